@@ -1,5 +1,7 @@
 from microservice_interconnect.base_service import BaseService
+from microservice_interconnect.load_shedding import OVERLOADED_STATUS_CODE, ServiceOverloaded
 from microservice_interconnect.rpc_client import register_event
+from microservice_interconnect.tracing import SpanExporter, inject, set_span_attribute, set_span_exporter, start_span
 import json
 import os
 import requests
@@ -63,13 +65,21 @@ class ServiceAmqpGateway(BaseService):
             return json.load(f)
 
     def _redirect_json_to_url(self, url:str, data:dict) -> dict:
-        response = requests.post(url=url, json=data)
+        with start_span(f"POST {url}", kind="client"):
+            # The cloud gateway continues the trace of the request (see tracing.py)
+            headers = {}
+            inject(headers)
+            response = requests.post(url=url, json=data, headers=headers)
+            set_span_attribute("status_code", response.status_code)
         if response.status_code == 200:
             return response.json()
         elif response.status_code in [400,500]:
             response_json = response.json()
             response_json["exception"] = response_json.pop("return")
             return response_json
+        elif response.status_code == OVERLOADED_STATUS_CODE:
+            # Passed on to the calling service as a 503, with the time to wait asked by the cloud
+            raise ServiceOverloaded(float(response.headers.get("Retry-After", 1)), f"{url} overloaded")
         else:
             raise CloudOperationFailed(url)
 
@@ -84,6 +94,8 @@ class ServiceAmqpGateway(BaseService):
         :rtype: dict
 
         :raises CloudOperationFailed: received unknown error from server 
+
+        :raises load_shedding.ServiceOverloaded: cloud overloaded, answered to the calling service with status code 503
         """
         register_event("client_gateway","rpc_redirect_update_user_info","Started redirecting update user info msg",allow_registering=allow_register,host=self.broker_host,port=self.broker_port)
 
@@ -106,6 +118,8 @@ class ServiceAmqpGateway(BaseService):
         :rtype: dict
 
         :raises CloudOperationFailed: received unknown error from server 
+
+        :raises load_shedding.ServiceOverloaded: cloud overloaded, answered to the calling service with status code 503
         """
         register_event("client_gateway","rpc_redirect_client_requesting_task","Started redirecting task request msg",allow_registering=allow_register,host=self.broker_host,port=self.broker_port)
 
@@ -123,6 +137,8 @@ if __name__ == "__main__":
     configs = configparser.ConfigParser()
     configs.read("./config.ini")
     allow_register = configs.getboolean("events","register_events")
+    if configs.getboolean("tracing","enabled",fallback=False):
+        set_span_exporter(SpanExporter(configs["tracing"]["directory"], "client_gateway"))
 
     service = ServiceAmqpGateway(
         workpath=os.path.join(Path().resolve(), "client_gateway"),
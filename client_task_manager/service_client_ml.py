@@ -2,6 +2,7 @@ import time as tm
 from client_task_manager.client_ml import ClientML
 from client_task_manager.process_messages_from_client_task import ForwardMessagesFromClientTask
 from microservice_interconnect.rpc_client import rpc_send, register_event
+from microservice_interconnect.tracing import SpanExporter, set_span_exporter, start_span
 from task_daemon_lib.task_exceptions import *
 from client_task_manager.client_info_manager import ClientInfoManager
 from client_task_manager.task_files_downloader import *
@@ -94,10 +95,12 @@ class ServiceClientML:
     def _update_info_procedure(self):
         """
         This function is periodically called to perform the following actions: 1) sends stats, 2) requets a task, and 3) updates current tasks list
+        The task request waits for the stats update, since the server selects the tasks by the user info it registers
         """
-        self.rpc_call_send_client_stats()
-
-        response = self.rpc_call_request_task()
+        # Each procedure is a trace, followed through the gateways up to the cloud services
+        with start_span("update_info_procedure"):
+            self.rpc_call_send_client_stats()
+            response = self.rpc_call_request_task()
         if (response is not None):
             self.current_tasks_list = response
         
@@ -205,6 +208,7 @@ class ServiceClientML:
         except (FileNotFoundError, json.JSONDecodeError) as e:
             print(f"Could not get info file: {e}. Restarting stats")
             self.client_info_handler.save_complete_info(self.initial_client_info)
+            client_info = self.initial_client_info
 
         response = rpc_send(
             "rpc_exec_client_requesting_task",
@@ -304,6 +308,8 @@ if __name__ == "__main__":
     configs.read("config.ini")
     allow_register = configs.getboolean("events","register_events")
     request_interval = int(configs["client.params"]["request_interval"])
+    if configs.getboolean("tracing","enabled",fallback=False):
+        set_span_exporter(SpanExporter(configs["tracing"]["directory"], "service_client_ml"))
 
     service = ServiceClientML(
         os.path.join(Path().resolve(),"client_task_manager"),
@@ -1,9 +1,20 @@
 import configparser
 from flask import Flask, request, jsonify
 from flask_cors import CORS  
+from microservice_interconnect.compression import accepts_compression, maybe_compress
+from microservice_interconnect.dedup_store import content_idempotency_key
+from microservice_interconnect.load_shedding import OVERLOADED_STATUS_CODE
 from microservice_interconnect.rpc_client import rpc_send, register_event
+from microservice_interconnect.service_registry import ServiceRegistry, set_service_registry
+from microservice_interconnect.tracing import SpanExporter, extract, set_span_exporter, start_span
 from flask.wrappers import Response
 
+# HTTP header with the idempotency key of the request, forwarded to the service
+IDEMPOTENCY_KEY_HTTP_HEADER = "Idempotency-Key"
+
+# Functions whose requests without key are deduplicated by content: sending the same task again is a retry
+CONTENT_KEYED_FUNCTIONS = {"rpc_exec_create_task"}
+
 app = Flask(__name__)
 CORS(app)  
 
@@ -13,6 +24,11 @@ configs.read("./config.ini")
 rpc_hostname = configs["server.broker"]["host"]
 rpc_port = int(configs["server.broker"]["port"])
 allow_register = configs.getboolean("events", "register_events")
+if configs.getboolean("direct", "enabled", fallback=False):
+    # Services in this host are called without the broker
+    set_service_registry(ServiceRegistry(configs["direct"]["registry"]))
+if configs.getboolean("tracing", "enabled", fallback=False):
+    set_span_exporter(SpanExporter(configs["tracing"]["directory"], "cloud_gateway"))
 
 @app.route("/<function_name>", methods=["POST", "OPTIONS"])
 def rpc_handler(function_name:str)->Response:
@@ -27,33 +43,64 @@ def rpc_handler(function_name:str)->Response:
     '''
     if request.method == "OPTIONS":
         return _build_cors_preflight_response()
-    
-    register_event("cloud_gateway", "rpc_handler", f"Started redirecting {function_name} msg",
-                   allow_registering=allow_register, host=rpc_hostname, port=rpc_port)
 
-    try:
-        args = request.get_json()
-        if args is None:
-            return jsonify({"error": "Invalid or missing JSON body"}), 400
+    # Continues the trace of the client gateway, if it sent the "traceparent" header
+    with start_span(function_name, kind="server", parent=extract(request.headers)):
+        register_event("cloud_gateway", "rpc_handler", f"Started redirecting {function_name} msg",
+                       allow_registering=allow_register, host=rpc_hostname, port=rpc_port)
 
-        rpc_response = rpc_send(function_name, args, rpc_hostname, rpc_port)
-        status_code = rpc_response.get("status_code", 500)
+        try:
+            args = request.get_json()
+            if args is None:
+                return jsonify({"error": "Invalid or missing JSON body"}), 400
 
-        response_data = rpc_response.get("return") if status_code == 200 else rpc_response.get("exception")
+            # The service executes a retried request once, even if the first one was executed but not answered
+            idempotency_key = request.headers.get(IDEMPOTENCY_KEY_HTTP_HEADER)
+            if idempotency_key is None and function_name in CONTENT_KEYED_FUNCTIONS:
+                idempotency_key = content_idempotency_key(args)
+            rpc_response = rpc_send(function_name, args, rpc_hostname, rpc_port, idempotency_key=idempotency_key)
+            status_code = rpc_response.get("status_code", 500)
 
-        register_event("cloud_gateway", "rpc_handler", f"Finished redirecting {function_name} msg",
-                       allow_registering=allow_register, host=rpc_hostname, port=rpc_port)
+            response_data = rpc_response.get("return") if status_code == 200 else rpc_response.get("exception")
+
+            register_event("cloud_gateway", "rpc_handler", f"Finished redirecting {function_name} msg",
+                           allow_registering=allow_register, host=rpc_hostname, port=rpc_port)
+
+            if status_code == OVERLOADED_STATUS_CODE:
+                # Lets the client gateway back off instead of retrying right away
+                return jsonify(response_data), status_code, {"Retry-After": str(rpc_response.get("retry_after", 1))}
+            return jsonify(response_data), status_code
 
-        return jsonify(response_data), status_code
+        except Exception as e:
+            return jsonify({"status_code": 500, "exception": str(e)}), 500
 
-    except Exception as e:
-        return jsonify({"status_code": 500, "exception": str(e)}), 500
+@app.after_request
+def _compress_response(response:Response)->Response:
+    '''
+    Compress large responses (e.g. task lists) crossing the WAN, if the client accepts gzip
+
+    :param response: response built by the handler
+    :type response: flask.wrappers.Response
+
+    :return: response, compressed or not
+    :rtype: flask.wrappers.Response
+    '''
+    if response.direct_passthrough or "Content-Encoding" in response.headers:
+        return response
+    if not accepts_compression(request.headers.get("Accept-Encoding")):
+        return response
+    body, content_encoding = maybe_compress(response.get_data())
+    if content_encoding is not None:
+        response.set_data(body)
+        response.headers["Content-Encoding"] = content_encoding
+        response.headers.add("Vary", "Accept-Encoding")
+    return response
 
 def _build_cors_preflight_response():
     response = jsonify({"message": "CORS preflight response"})
     response.headers.add("Access-Control-Allow-Origin", "*") 
     response.headers.add("Access-Control-Allow-Methods", "POST, OPTIONS") 
-    response.headers.add("Access-Control-Allow-Headers", "Content-Type") 
+    response.headers.add("Access-Control-Allow-Headers", f"Content-Type, {IDEMPOTENCY_KEY_HTTP_HEADER}") 
     return response
 
 if __name__ == "__main__":
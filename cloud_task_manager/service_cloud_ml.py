@@ -12,8 +12,20 @@ from cloud_task_manager.tasks_db_interface import TasksDbInterface
 from microservice_interconnect.rpc_client import rpc_send, register_event
 from task_daemon_lib.task_exceptions import TaskAlredyStopped
 from microservice_interconnect.base_service import BaseService
+from microservice_interconnect.dedup_store import DedupStore
+from microservice_interconnect.load_shedding import OverloadPolicy
+from microservice_interconnect.response_cache import CachePolicy
+from microservice_interconnect.service_registry import ServiceRegistry, set_service_registry
+from microservice_interconnect.tracing import SpanExporter, set_span_exporter
 from cloud_task_manager.process_messages_from_task import ForwardMessagesFromTask
 
+# Seconds that responses of read-only endpoints are cached
+TASK_CACHE_TTL = 60
+
+# Task requests beyond these are answered with 503 (see load_shedding.OverloadPolicy)
+REQUESTING_TASK_MAX_QUEUE_DEPTH = 500
+REQUESTING_TASK_MAX_QUEUE_AGE = 5
+
 class CouldNotRetrieveUser(Exception):
     def __init__(self, user_id:str):
         super().__init__(f"Could not retrieve info from user with ID={user_id}")
@@ -30,53 +42,85 @@ class ServiceCloudML(BaseService):
     
     :param broker_port: RPC broker port
     :type broker_port: int
+
+    :param direct_address: Unix socket or TCP address where co-located services and gateways call it without the broker. If None, only the broker is used
+    :type direct_address: str
     """
     def __init__(
             self, 
             workpath: str, 
             broker_host:str="localhsot",
-            broker_port:str=5672) -> None:
-        super().__init__(broker_host=broker_host, broker_port=broker_port)
+            broker_port:str=5672,
+            direct_address:str=None) -> None:
+        # Responses of requests with an idempotency key are persisted, so a task creation redelivered or retried after a crash
+        # replays the first response. The cloud gateway keys task creations by their content, or by their "Idempotency-Key" header
+        super().__init__(
+            broker_host=broker_host,
+            broker_port=broker_port,
+            execution_mode="thread",
+            dedup_store=DedupStore(path=os.path.join(workpath, "db", "dedup.db")),
+            direct_address=direct_address)
         self.broker_host = broker_host
         self.broker_port = broker_port
         self.workpath = workpath
         self.cloud_ml_backend = CloudML(workpath)
         self.db_handler = TasksDbInterface(workpath)
 
+        # Starting/stopping tasks spawns/kills subprocesses and changes the tasks map,
+        # so they run one at a time, isolated from the fast DB queries
+        self.add_bulkhead("task_control", max_workers=1)
+
+        # Any change in a task may change its info
+        task_invalidations = {
+            "rpc_exec_get_task_by_id": lambda received: received.get("task_id"),
+        }
+
         self.add_api_endpoint(
             func=self.rpc_exec_create_task,
             func_name="rpc_exec_create_task",
             schema=self._get_schema("rpc_exec_create_task"),
+            invalidates=task_invalidations,
         )
 
         self.add_api_endpoint(
             func=self.rpc_exec_start_server_task,
             func_name="rpc_exec_start_server_task",
             schema=self._get_schema("rpc_exec_start_server_task"),
+            bulkhead="task_control",
+            invalidates=task_invalidations,
+            priority="control",
         )
 
         self.add_api_endpoint(
             func=self.rpc_exec_stop_server_task,
             func_name="rpc_exec_stop_server_task",
             schema=self._get_schema("rpc_exec_stop_server_task"),
+            bulkhead="task_control",
+            invalidates=task_invalidations,
+            priority="control",
         )
 
         self.add_api_endpoint(
             func=self.rpc_exec_client_requesting_task,
             func_name="rpc_exec_client_requesting_task",
             schema=self._get_schema("rpc_exec_client_requesting_task"),
+            # Not cached: the compatible tasks depend on the user info, which is updated through other service
+            # Clients poll periodically, so under a surge they can come back later instead of piling up
+            overload_policy=OverloadPolicy(max_queue_depth=REQUESTING_TASK_MAX_QUEUE_DEPTH, max_queue_age=REQUESTING_TASK_MAX_QUEUE_AGE, retry_after=2),
         )
 
         self.add_api_endpoint(
             func=self.rpc_exec_update_task,
             func_name="rpc_exec_update_task",
             schema=self._get_schema("rpc_exec_update_task"),
+            invalidates=task_invalidations,
         )
 
         self.add_api_endpoint(
             func=self.rpc_exec_get_task_by_id,
             func_name="rpc_exec_get_task_by_id",
             schema=self._get_schema("rpc_exec_get_task_by_id"),
+            cache_policy=CachePolicy(ttl=TASK_CACHE_TTL, key_func=lambda received: received["task_id"]),
         )
 
         register_event("service_cloud_ml","main","Started",allow_registering=allow_register,host=self.broker_host,port=self.broker_port)
@@ -98,6 +142,15 @@ class ServiceCloudML(BaseService):
         with open(os.path.join(self.workpath, "schemas", f"{func_name}.json")) as f:
             return json.load(f)
 
+    def _invalidate_task_caches(self, task_id: str):
+        """
+        Invalidates cached responses that depend on a task changed outside the RPC endpoints
+
+        :param task_id: task ID
+        :type task_id: str
+        """
+        self.invalidate_cache("rpc_exec_get_task_by_id", task_id)
+
     def handle_error_from_task(self, task_id: str):
         """
         This function is executed to handle an error received by the task
@@ -120,6 +173,8 @@ class ServiceCloudML(BaseService):
 
         except TaskAlredyStopped:
             print(f"Received error from task {task_id}, which was alredy stopped")
+        finally:
+            self._invalidate_task_caches(task_id)
 
         register_event("service_cloud_ml","handle_error_from_task",f"Finished handling error from task {task_id}",allow_registering=allow_register,host=self.broker_host,port=self.broker_port)
 
@@ -182,6 +237,8 @@ class ServiceCloudML(BaseService):
             except Exception as e:
                 print(e)
                 raise e
+            finally:
+                self._invalidate_task_caches(task_id)
 
         forwarder = ForwardMessagesFromTask(
             received["task_id"], self.handle_error_from_task, finish_task, self.workpath
@@ -377,18 +434,28 @@ if __name__ == "__main__":
 
     def signal_handler(sig,frame):
         register_event("service_cloud_ml","main","Interrupted",allow_registering=allow_register,host=host,port=port)
-        service.cloud_ml_backend.finish_all()
+        # Drained in the connection thread, this one: start() returns once the connection is closed
         service.stop()
-        exit(0)
         
+    direct_address = None
+    if configs.getboolean("direct","enabled",fallback=False):
+        # Calls to the User Manager also skip the broker, if it runs in this host
+        set_service_registry(ServiceRegistry(configs["direct"]["registry"]))
+        direct_address = configs["direct"]["cloud_ml"]
+    if configs.getboolean("tracing","enabled",fallback=False):
+        set_span_exporter(SpanExporter(configs["tracing"]["directory"], "service_cloud_ml"))
+
     service = ServiceCloudML(
         os.path.join(Path().resolve(),"cloud_task_manager"), 
         host, 
-        port)
+        port,
+        direct_address=direct_address)
     try:
         signal.signal(signal.SIGINT, signal_handler)
         signal.signal(signal.SIGTERM, signal_handler)
         service.start()
     except Exception as e:
+        # The connection loop is no longer running, so there is nothing to drain
+        print(f"Service stopped by error: {e}")
+    finally:
         service.cloud_ml_backend.finish_all()
-        service.stop()
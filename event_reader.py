@@ -1,61 +1,114 @@
+import argparse
 import configparser
-from threading import Thread, Lock
+from threading import Thread, Event
 import signal
 import pika
-import os
+import pika.exceptions
 import time
 
-fd = open("events.json", "wb")
-fd.write(bytes("[\n","utf8"))
+from microservice_interconnect.event_store import EventStore, export_json_array, list_segments
+from microservice_interconnect.rpc_client import reconnect_delay
 
-writeLock = Lock()
+EVENTS_QUEUE = "events"
+EVENTS_DIR = "events"
+EVENTS_FILE = "events.json"
+
+# Unacked events delivered by each broker. Events are written and acked in batches of half of it
+PREFETCH_COUNT = 1000
+# Maximum time, in seconds, that a received event waits to be written
+FLUSH_INTERVAL = 0.5
+# Time, in seconds, that events still arriving are consumed after a stop signal
+STOP_DELAY = 3
 
 
 class WorkerThread(Thread):
-    def __init__(self, host, port):
+    """
+    Consumes the events queue of a broker, writing the events to the store in batches.
+    Each batch is acked with a single multiple-ack after being written, so events are not lost if the reader stops
+    """
+    def __init__(self, store:EventStore, host:str, port:int):
         super(WorkerThread, self).__init__()
-        self._is_interrupted = False
+        self._store = store
+        self._stop_event = Event()
         self._conn_params = pika.ConnectionParameters(host, port)
 
     def stop(self):
-        self._is_interrupted = True
+        self._stop_event.set()
 
     def run(self):
+        attempt = 0
+        while not self._stop_event.is_set():
+            try:
+                self._consume()
+                attempt = 0
+            except pika.exceptions.AMQPConnectionError as e:
+                attempt += 1
+                delay = reconnect_delay(attempt)
+                print(f"Connection to {self._conn_params.host}:{self._conn_params.port} lost ({e}), reconnecting in {delay:.2f} s")
+                self._stop_event.wait(delay)
+
+    def _consume(self):
         connection = pika.BlockingConnection(self._conn_params)
         channel = connection.channel()
-        channel.queue_declare("events")
-        for message in channel.consume("events", inactivity_timeout=1):
-            if self._is_interrupted:
-                break
-            if not all(message):
-                continue
-            method, _, body = message
-            print(f"event received: {body.decode('utf-8')}")
-            writeLock.acquire()
-            fd.write(bytes(f"\t{body.decode('utf-8')},\n", "utf8"))
-            writeLock.release()
-            channel.basic_ack(delivery_tag=method.delivery_tag)
+        channel.queue_declare(EVENTS_QUEUE)
+        channel.basic_qos(prefetch_count=PREFETCH_COUNT)
+
+        pending = []
+        last_delivery_tag = None
+        first_pending_time = None
+
+        def on_message(ch, method, properties, body):
+            nonlocal last_delivery_tag, first_pending_time
+            if not pending:
+                first_pending_time = time.monotonic()
+            pending.append(body)
+            last_delivery_tag = method.delivery_tag
+
+        def write_pending():
+            nonlocal first_pending_time
+            if not pending:
+                return
+            self._store.append_many(pending)
+            self._store.flush()
+            channel.basic_ack(delivery_tag=last_delivery_tag, multiple=True)
+            pending.clear()
+            first_pending_time = None
+
+        channel.basic_consume(EVENTS_QUEUE, on_message)
+        try:
+            while not self._stop_event.is_set():
+                # Blocks on the socket, without spinning, until events arrive or the interval expires
+                connection.process_data_events(time_limit=FLUSH_INTERVAL)
+                if pending and (len(pending) >= PREFETCH_COUNT//2 or time.monotonic() - first_pending_time >= FLUSH_INTERVAL):
+                    write_pending()
+            write_pending()
+        finally:
+            if connection.is_open:
+                connection.close()
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Writes the events of the server and client brokers to rotating JSON Lines segments")
+    parser.add_argument("--export", action="store_true", help=f"only rebuild {EVENTS_FILE} from all the segments in {EVENTS_DIR} (e.g. after a crash)")
+    args = parser.parse_args()
+
+    if args.export:
+        count = export_json_array(list_segments(EVENTS_DIR), EVENTS_FILE)
+        print(f"{count} events exported to {EVENTS_FILE}")
+        exit(0)
+
     print("Starting consumers...")
     configs = configparser.ConfigParser()
     configs.read("./config.ini")
 
-    a = WorkerThread(configs["server.broker"]["host"], configs["server.broker"]["port"])
-    b = WorkerThread(configs["client.broker"]["host"], configs["client.broker"]["port"])
+    store = EventStore(EVENTS_DIR)
+    a = WorkerThread(store, configs["server.broker"]["host"], configs["server.broker"]["port"])
+    b = WorkerThread(store, configs["client.broker"]["host"], configs["client.broker"]["port"])
+
+    stop_requested = Event()
 
     def signal_handler(sig,frame):
-        time.sleep(3)
-        a.stop()
-        b.stop()
-        a.join()
-        b.join()
-        print("Killed. Saving file...")
-        fd.seek(-2, os.SEEK_END)
-        fd.write(bytes("\n]","utf8"))
-        fd.close()
-        exit(0)
+        stop_requested.set()
 
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
@@ -63,21 +116,17 @@ if __name__ == "__main__":
     a.start()
     b.start()
 
-    try:
-        print("Started consuming....")
-        while True:
-            pass
-    except KeyboardInterrupt:
-        print("Stopping listener...")
-        a.stop()
-        b.stop()
-    except Exception as err:
-        print(f"Error: {str(err)}")
-        print("Stopping listener...")
-        a.stop()
-        b.stop()
-
-    print("Saving file")
-    fd.seek(-2, os.SEEK_END)
-    fd.write(bytes("\n]","utf8"))
-    fd.close()
+    print("Started consuming....")
+    # Sleeps until a signal arrives
+    stop_requested.wait()
+    time.sleep(STOP_DELAY)
+    print("Stopping listener...")
+    a.stop()
+    b.stop()
+    a.join()
+    b.join()
+    store.close()
+
+    # Events of this run, in the format read by the experiments scripts
+    count = export_json_array(store.segments, EVENTS_FILE)
+    print(f"{count} events saved to {EVENTS_FILE}")
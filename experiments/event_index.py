@@ -0,0 +1,232 @@
+import argparse
+import json
+import os
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# Timestamps of the events of each (service, function, event message)
+EventKey = Tuple[str, str, str]
+
+def _has_one_event_per_line(filename:str) -> bool:
+    # As events.json exported by event_reader. Arrays rewritten with indent have an event in many lines
+    with open(filename, "r") as file:
+        for line in file:
+            line = line.strip().rstrip(",")
+            if line in ("", "["):
+                continue
+            try:
+                # A whole array in one line is not an event
+                return isinstance(json.loads(line), dict)
+            except ValueError:
+                return False
+    return True
+
+def iter_events(filename:str) -> Iterator[dict]:
+    """
+    Reads events without loading the whole file, from a JSON Lines segment, a directory of segments
+    or an events.json array. Arrays with events split in many lines are loaded at once
+
+    :param filename: file or directory
+    :type filename: str
+
+    :return: events, in file order
+    :rtype: Iterator[dict]
+    """
+    if os.path.isdir(filename):
+        for name in sorted(os.listdir(filename)):
+            if name.endswith(".jsonl"):
+                yield from iter_events(os.path.join(filename, name))
+        return
+    if not filename.endswith(".jsonl") and not _has_one_event_per_line(filename):
+        with open(filename, "r") as file:
+            yield from json.load(file)
+        return
+    with open(filename, "r") as file:
+        for line_number, line in enumerate(file):
+            line = line.strip().rstrip(",")
+            if line in ("", "[", "]"):
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # Partially written by a reader that crashed
+                print(f"Skipped malformed line {line_number+1} of {filename}")
+
+class EventIndex:
+    """
+    Timestamps of events indexed by (service, function, event message), in sorted NumPy arrays, so that
+    searching an event is a binary search instead of a scan of the whole list
+
+    Events of many experiment repetitions can be loaded in the same index: each step is matched within
+    the repetition, since the repetitions do not overlap in time
+    """
+    def __init__(self) -> None:
+        self._times: Dict[EventKey, np.ndarray] = {}
+        self._by_event: Dict[str, np.ndarray] = {}
+
+    @classmethod
+    def load(cls, filenames:List[str]) -> "EventIndex":
+        """
+        :param filenames: events.json files, JSON Lines segments or directories of segments (see :func:`iter_events`)
+        :type filenames: List[str]
+
+        :return: index of all the events in the files
+        :rtype: EventIndex
+        """
+        collected: Dict[EventKey, List[float]] = {}
+        for filename in filenames:
+            for event in iter_events(filename):
+                key = (event.get("service"), event.get("function"), event.get("event"))
+                times = collected.get(key)
+                if times is None:
+                    times = collected[key] = []
+                times.append(event["time"])
+        index = cls()
+        for key, times in collected.items():
+            index._times[key] = np.sort(np.asarray(times, dtype=np.float64))
+        return index
+
+    def __len__(self) -> int:
+        return sum(len(times) for times in self._times.values())
+
+    def keys(self) -> List[EventKey]:
+        """
+        :return: (service, function, event message) of the indexed events
+        :rtype: List[EventKey]
+        """
+        return list(self._times)
+
+    def times(self, event:str, service:str=None, function:str=None) -> np.ndarray:
+        """
+        :param event: event message
+        :type event: str
+
+        :param service: if informed, only events of this service
+        :type service: str
+
+        :param function: if informed, only events of this function
+        :type function: str
+
+        :return: sorted timestamps of the event
+        :rtype: numpy.ndarray
+        """
+        if service is None and function is None:
+            times = self._by_event.get(event)
+            if times is None:
+                arrays = [times for key, times in self._times.items() if key[2] == event]
+                times = self._by_event[event] = np.sort(np.concatenate(arrays)) if arrays else np.empty(0)
+            return times
+        arrays = [
+            times for key, times in self._times.items()
+            if key[2] == event and (service is None or key[0] == service) and (function is None or key[1] == function)
+        ]
+        return np.sort(np.concatenate(arrays)) if arrays else np.empty(0)
+
+    def first_after(self, event:str, after:float=-np.inf, occurrence:int=1) -> Optional[float]:
+        """
+        :param event: event message
+        :type event: str
+
+        :param after: only events strictly after this time
+        :type after: float
+
+        :param occurrence: 1 for the first event after the time, 2 for the second, and so on
+        :type occurrence: int
+
+        :return: timestamp, or None if there is no such event
+        :rtype: float
+        """
+        times = self.times(event)
+        i = np.searchsorted(times, after, side="right") + occurrence - 1
+        return float(times[i]) if i < len(times) else None
+
+    def sequence(self, messages:List[str]) -> Dict[str, Optional[float]]:
+        """
+        Finds each message after the previous one, as the steps of one execution.
+        "message:2" skips to the second occurrence of the message. Once a message is not found, the
+        execution is incomplete, and the later messages are not searched
+
+        :param messages: event messages, in the order they are expected
+        :type messages: List[str]
+
+        :return: timestamp of each message, as given (with the ":n"), or None if it or an earlier message was not found
+        :rtype: Dict[str, float]
+        """
+        found = dict.fromkeys(messages, None)
+        after = -np.inf
+        for message in messages:
+            event, _, occurrence = message.partition(":")
+            timestamp = self.first_after(event, after, int(occurrence) if occurrence else 1)
+            if timestamp is None:
+                # Later events may belong to other execution
+                break
+            found[message] = timestamp
+            after = timestamp
+        return found
+
+    def step_latencies(self, start_event:str, end_event:str, service:str=None, function:str=None) -> np.ndarray:
+        """
+        Latency of every occurrence of a step: each start event is matched with the first end event after it.
+        Starts whose end did not happen before the next start (e.g. failed steps) are dropped
+
+        :param start_event: event message of the start of the step
+        :type start_event: str
+
+        :param end_event: event message of the end of the step
+        :type end_event: str
+
+        :param service: if informed, only events of this service
+        :type service: str
+
+        :param function: if informed, only events of this function
+        :type function: str
+
+        :return: latencies, in seconds, in the order of the starts
+        :rtype: numpy.ndarray
+        """
+        starts = self.times(start_event, service, function)
+        ends = self.times(end_event, service, function)
+        if len(starts) == 0 or len(ends) == 0:
+            return np.empty(0)
+        end_index = np.searchsorted(ends, starts, side="right")
+        matched = end_index < len(ends)
+        matched_ends = np.where(matched, ends[np.minimum(end_index, len(ends) - 1)], np.inf)
+        next_starts = np.append(starts[1:], np.inf)
+        matched &= matched_ends <= next_starts
+        return matched_ends[matched] - starts[matched]
+
+def summarize(latencies:np.ndarray) -> dict:
+    """
+    :param latencies: latencies, in seconds
+    :type latencies: numpy.ndarray
+
+    :return: count, mean, min, max and p50, p95 and p99 of the latencies, in seconds
+    :rtype: dict
+    """
+    if len(latencies) == 0:
+        return {"count": 0}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        "count": int(len(latencies)),
+        "mean": float(np.mean(latencies)),
+        "min": float(np.min(latencies)),
+        "p50": float(p50),
+        "p95": float(p95),
+        "p99": float(p99),
+        "max": float(np.max(latencies)),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency distribution of a step, across one or more experiment repetitions")
+    parser.add_argument("files", nargs="+", help="events.json files or directories of event segments")
+    parser.add_argument("-s", "--step", nargs=2, action="append", required=True, metavar=("START_EVENT", "END_EVENT"))
+    parser.add_argument("--service")
+    parser.add_argument("--function")
+    args = parser.parse_args()
+
+    index = EventIndex.load(args.files)
+    print(f"{len(index)} events")
+    for start_event, end_event in args.step:
+        summary = summarize(index.step_latencies(start_event, end_event, args.service, args.function))
+        print(f"{start_event} -> {end_event}: {summary}")
@@ -1,4 +1,4 @@
-from microservice_interconnect.rpc_client import rpc_send
+from microservice_interconnect.rpc_client import rpc_send_batch
 import configparser
 
 if __name__ == "__main__":
@@ -6,32 +6,27 @@ if __name__ == "__main__":
     configs = configparser.ConfigParser()
     configs.read("config.ini")
 
-    ret = rpc_send("rpc_exec_create_task",
-            {"task_id":"E",
-            'host':'localhost',
-            'port':8081,
-            'username':'user',
-            'password':'123',
-            'files_paths':['client.py','task.py'],
-            'client_arguments':'test-error'
-            },
+    # Creates both tasks and then starts them, in order, with a single message
+    ret = rpc_send_batch([
+            {"func_name":"rpc_exec_create_task",
+             "args":{"task_id":"E",
+                     'host':'localhost',
+                     'port':8081,
+                     'username':'user',
+                     'password':'123',
+                     'files_paths':['client.py','task.py'],
+                     'client_arguments':'test-error'
+                     }},
+            {"func_name":"rpc_exec_create_task",
+             "args":{"task_id":"C",
+                     'host':'localhost',
+                     'port':8080,
+                     'username':'user',
+                     'password':'123',
+                     'files_paths':['client.py','task.py']
+                     }},
+            {"func_name":"rpc_exec_start_server_task","args":{"task_id":"E"}},
+            {"func_name":"rpc_exec_start_server_task","args":{"task_id":"C"}},
+            ],
             host=configs["server.broker"]["host"],
             port=configs["server.broker"]["port"])
-    
-    ret = rpc_send("rpc_exec_create_task",
-            {"task_id":"C",
-            'host':'localhost',
-            'port':8080,
-            'username':'user',
-            'password':'123',
-            'files_paths':['client.py','task.py']
-            },
-            host=configs["server.broker"]["host"],
-            port=configs["server.broker"]["port"])
-    
-    ret = rpc_send("rpc_exec_start_server_task",{"task_id":"E"},
-                host=configs["server.broker"]["host"],
-                port=configs["server.broker"]["port"])
-    ret = rpc_send("rpc_exec_start_server_task",{"task_id":"C"},
-                host=configs["server.broker"]["host"],
-                port=configs["server.broker"]["port"])
\ No newline at end of file
@@ -0,0 +1,278 @@
+import argparse
+import asyncio
+import configparser
+import json
+import random
+import time as tm
+from typing import Dict, List
+
+from microservice_interconnect.async_rpc_client import AsyncRpcClient
+from microservice_interconnect.latency_stats import LatencyHistogram
+from microservice_interconnect.load_shedding import OVERLOADED_STATUS_CODE
+from microservice_interconnect.rpc_client import RpcTimeout
+
+UPDATE_USER_INFO = "rpc_exec_update_user_info"
+REQUESTING_TASK = "rpc_exec_client_requesting_task"
+
+THINK_DISTRIBUTIONS = ("fixed", "uniform", "exponential")
+
+class ClientProfile:
+    """
+    How virtual clients behave: the time each one waits between two procedures and the distribution of the
+    attributes it reports to the User Manager
+
+    :param think_time: mean time, in seconds, between the end of a procedure and the start of the next (request_interval of the Client Task Manager)
+    :type think_time: float
+
+    :param think_distribution: "fixed", "uniform" (between half and 1.5 times think_time) or "exponential"
+    :type think_distribution: str
+
+    :param data_qnt_range: minimum and maximum amount of data of a client
+    :type data_qnt_range: List[int]
+
+    :param sensors: sensors that a client may have
+    :type sensors: List[str]
+
+    :param sensor_prob: probability of a client having each sensor
+    :type sensor_prob: float
+
+    :param stats_change_prob: probability of the client attributes changing after a procedure. Like the Client Task Manager, stats are sent only in the first procedure and after they change
+    :type stats_change_prob: float
+    """
+    def __init__(
+            self,
+            think_time:float=10,
+            think_distribution:str="uniform",
+            data_qnt_range:List[int]=(0, 10000),
+            sensors:List[str]=("camera", "ecu"),
+            sensor_prob:float=0.5,
+            stats_change_prob:float=0.1) -> None:
+        if think_distribution not in THINK_DISTRIBUTIONS:
+            raise ValueError(f"Think time distribution should be one of {THINK_DISTRIBUTIONS}, not {think_distribution}")
+        self.think_time = think_time
+        self.think_distribution = think_distribution
+        self.data_qnt_range = data_qnt_range
+        self.sensors = list(sensors)
+        self.sensor_prob = sensor_prob
+        self.stats_change_prob = stats_change_prob
+
+    def next_think_time(self, rng:random.Random) -> float:
+        if self.think_distribution == "uniform":
+            return rng.uniform(0.5*self.think_time, 1.5*self.think_time)
+        if self.think_distribution == "exponential":
+            return rng.expovariate(1/self.think_time)
+        return self.think_time
+
+    def client_info(self, user_id:str, rng:random.Random) -> dict:
+        return {
+            "user_id": user_id,
+            "data_qnt": rng.randint(*self.data_qnt_range),
+            "avg_acc_contrib": rng.random(),
+            "avg_disconnection_per_round": rng.random(),
+            "sensors": [sensor for sensor in self.sensors if rng.random() < self.sensor_prob],
+        }
+
+class LoadStats:
+    """
+    Latencies and outcomes of the calls of a load level, by function. Calls finished during the warm-up are not recorded
+    """
+    def __init__(self) -> None:
+        self.latencies: Dict[str, LatencyHistogram] = {}
+        self.outcomes: Dict[str, Dict[str, int]] = {}
+        self.recording = False
+        self.started = None
+        self.finished = None
+
+    def start_recording(self):
+        self.recording = True
+        self.started = tm.monotonic()
+
+    def stop_recording(self):
+        self.recording = False
+        self.finished = tm.monotonic()
+
+    def record(self, func_name:str, seconds:float, outcome:str):
+        """
+        :param func_name: called function
+        :type func_name: str
+
+        :param seconds: latency of the call
+        :type seconds: float
+
+        :param outcome: "ok", "overloaded", "timeout", "exception" or the status code of the error
+        :type outcome: str
+        """
+        if not self.recording:
+            return
+        if func_name not in self.latencies:
+            self.latencies[func_name] = LatencyHistogram()
+            self.outcomes[func_name] = {}
+        self.latencies[func_name].record(seconds)
+        self.outcomes[func_name][outcome] = self.outcomes[func_name].get(outcome, 0) + 1
+
+    def summary(self) -> Dict[str, dict]:
+        """
+        :return: for each function and for "all" the calls: throughput (calls/s), latency summary in ms, error rate, overloaded (503) rate and count of each outcome
+        :rtype: Dict[str, dict]
+        """
+        duration = (self.finished or tm.monotonic()) - self.started
+        summary = {}
+        for func_name, histogram in self.latencies.items():
+            outcomes = self.outcomes[func_name]
+            count = histogram.count
+            summary[func_name] = {
+                "throughput": count/duration,
+                "latency": histogram.summary(),
+                "error_rate": (count - outcomes.get("ok", 0) - outcomes.get("overloaded", 0))/count,
+                "overloaded_rate": outcomes.get("overloaded", 0)/count,
+                "outcomes": dict(outcomes),
+            }
+        count = sum(h.count for h in self.latencies.values())
+        ok = sum(outcomes.get("ok", 0) for outcomes in self.outcomes.values())
+        overloaded = sum(outcomes.get("overloaded", 0) for outcomes in self.outcomes.values())
+        summary["all"] = {
+            "throughput": count/duration,
+            "error_rate": (count - ok - overloaded)/count if count else 0,
+            "overloaded_rate": overloaded/count if count else 0,
+        }
+        return summary
+
+async def _timed_call(rpc_client:AsyncRpcClient, func_name:str, args:dict, timeout:float, stats:LoadStats) -> dict:
+    start = tm.perf_counter()
+    response = None
+    try:
+        response = await rpc_client.call(func_name, args, timeout)
+        status_code = response.get("status_code") if isinstance(response, dict) else 200
+        if status_code == 200:
+            outcome = "ok"
+        elif status_code == OVERLOADED_STATUS_CODE:
+            outcome = "overloaded"
+        else:
+            outcome = str(status_code)
+    except RpcTimeout:
+        outcome = "timeout"
+    except Exception as e:
+        # Connection errors and malformed responses count as errors, without stopping the virtual client
+        print(f"{func_name} failed: {e!r}")
+        outcome = "exception"
+    stats.record(func_name, tm.perf_counter() - start, outcome)
+    return response
+
+async def run_virtual_client(
+        user_id:str,
+        rpc_client:AsyncRpcClient,
+        profile:ClientProfile,
+        timeout:float,
+        stop_time:float,
+        stats:LoadStats,
+        rng:random.Random):
+    """
+    Repeats the procedure of the Client Task Manager (see :meth:`client_task_manager.service_client_ml.ServiceClientML._update_info_procedure`):
+    sends its stats, if they changed, then requests a task, and waits a think time
+
+    :param stop_time: monotonic time after which no procedure is started
+    :type stop_time: float
+    """
+    client_info = profile.client_info(user_id, rng)
+    stats_changed = True
+    # Clients do not start in lockstep
+    await asyncio.sleep(rng.uniform(0, profile.think_time))
+    while tm.monotonic() < stop_time:
+        # The task request uses the stats just sent
+        if stats_changed:
+            await _timed_call(rpc_client, UPDATE_USER_INFO, client_info, timeout, stats)
+        await _timed_call(rpc_client, REQUESTING_TASK, {"user_id": user_id}, timeout, stats)
+        stats_changed = rng.random() < profile.stats_change_prob
+        if stats_changed:
+            client_info = profile.client_info(user_id, rng)
+        await asyncio.sleep(profile.next_think_time(rng))
+
+async def run_load_level(
+        n_clients:int,
+        host:str,
+        port:int,
+        profile:ClientProfile,
+        timeout:float,
+        duration:float,
+        warmup:float,
+        n_connections:int=4,
+        seed:int=None) -> Dict[str, dict]:
+    """
+    Runs n_clients virtual clients, sharing n_connections connections, for warmup + duration seconds
+
+    :return: summary of the calls finished after the warm-up (see :meth:`LoadStats.summary`)
+    :rtype: Dict[str, dict]
+    """
+    rng = random.Random(seed)
+    rpc_clients = [AsyncRpcClient(host, port) for _ in range(min(n_connections, n_clients))]
+    for rpc_client in rpc_clients:
+        await rpc_client.connect()
+    stats = LoadStats()
+    stop_time = tm.monotonic() + warmup + duration
+    run_id = f"{rng.getrandbits(32):08x}"
+    clients = [
+        asyncio.ensure_future(run_virtual_client(
+            f"load-{run_id}-{i}", rpc_clients[i % len(rpc_clients)], profile, timeout, stop_time, stats,
+            random.Random(rng.getrandbits(64))))
+        for i in range(n_clients)
+    ]
+    try:
+        await asyncio.sleep(warmup)
+        stats.start_recording()
+        await asyncio.sleep(duration)
+        stats.stop_recording()
+        # Procedures in progress are not recorded, and are not waited for longer than the timeout
+        await asyncio.wait(clients, timeout=timeout)
+    finally:
+        for client in clients:
+            client.cancel()
+        await asyncio.gather(*clients, return_exceptions=True)
+        for rpc_client in rpc_clients:
+            await rpc_client.close()
+    return stats.summary()
+
+def format_row(n_clients:int, name:str, summary:dict) -> str:
+    latency = summary.get("latency")
+    latencies = f"{latency['p50_ms']:>10.1f} {latency['p99_ms']:>10.1f}" if latency else f"{'':>10} {'':>10}"
+    return (f"{n_clients:>8} {name:<32} {summary['throughput']:>10.1f} {latencies}"
+            f" {100*summary['error_rate']:>8.2f}% {100*summary['overloaded_rate']:>8.2f}%")
+
+if __name__ == "__main__":
+    configs = configparser.ConfigParser()
+    configs.read("config.ini")
+
+    parser = argparse.ArgumentParser(description="Simulates N Client Task Managers against the control plane and reports throughput, latency and error rates for each N")
+    parser.add_argument("-n", "--clients", type=int, nargs="+", default=[10, 100, 1000], help="numbers of virtual clients, one load level each")
+    parser.add_argument("--via", choices=("services", "gateways"), default="services", help="calls the cloud services through the server broker, or through the client broker and both gateways")
+    parser.add_argument("--think_time", type=float, default=configs.getfloat("client.params", "request_interval", fallback=10))
+    parser.add_argument("--think_distribution", choices=THINK_DISTRIBUTIONS, default="uniform")
+    parser.add_argument("--timeout", type=float, help="call timeout, in seconds. Default: the think time, as the Client Task Manager")
+    parser.add_argument("--data_qnt", type=int, nargs=2, default=[0, 10000], metavar=("MIN", "MAX"))
+    parser.add_argument("--sensors", nargs="+", default=["camera", "ecu"])
+    parser.add_argument("--sensor_prob", type=float, default=0.5)
+    parser.add_argument("--stats_change_prob", type=float, default=0.1)
+    parser.add_argument("--duration", type=float, default=60, help="measured time of each level, in seconds")
+    parser.add_argument("--warmup", type=float, help="time before measuring each level, in seconds. Default: the think time, so every client started")
+    parser.add_argument("--connections", type=int, default=4, help="broker connections shared by the virtual clients")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("-o", "--output", help="also writes the results of every level to this JSON file")
+    args = parser.parse_args()
+
+    broker = "server.broker" if args.via == "services" else "client.broker"
+    host, port = configs[broker]["host"], int(configs[broker]["port"])
+    profile = ClientProfile(args.think_time, args.think_distribution, args.data_qnt, args.sensors, args.sensor_prob, args.stats_change_prob)
+    timeout = args.timeout if args.timeout is not None else args.think_time
+    warmup = args.warmup if args.warmup is not None else args.think_time
+
+    results = {}
+    print(f"{'clients':>8} {'function':<32} {'calls/s':>10} {'p50_ms':>10} {'p99_ms':>10} {'errors':>9} {'overload':>9}")
+    for n_clients in args.clients:
+        summary = asyncio.run(run_load_level(
+            n_clients, host, port, profile, timeout, args.duration, warmup, args.connections, args.seed))
+        results[n_clients] = summary
+        for name in sorted(summary, key=lambda name: (name == "all", name)):
+            print(format_row(n_clients, name, summary[name]))
+
+    if args.output is not None:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=1)
@@ -0,0 +1,24 @@
+import json
+
+from experiments.event_index import EventIndex
+
+def load_index(tmp_path, events:list) -> EventIndex:
+    filename = tmp_path / "events.json"
+    filename.write_text(json.dumps([
+        {"service": "service_cloud_ml", "function": "main", "event": event, "time": time}
+        for event, time in events
+    ]))
+    return EventIndex.load([str(filename)])
+
+def test_sequence_finds_each_event_after_the_previous(tmp_path):
+    index = load_index(tmp_path, [("Finished", 0.5), ("Started", 1.0), ("Finished", 2.0), ("Started", 3.0), ("Finished", 4.0)])
+
+    assert index.sequence(["Started", "Finished"]) == {"Started": 1.0, "Finished": 2.0}
+    # Second occurrence after the previous event
+    assert index.sequence(["Started", "Finished:2"]) == {"Started": 1.0, "Finished:2": 4.0}
+
+def test_sequence_stops_at_a_missing_event(tmp_path):
+    # "Sent" never happened, so the "Finished" at 3.0 cannot be attributed to this execution
+    index = load_index(tmp_path, [("Started", 1.0), ("Finished", 3.0)])
+
+    assert index.sequence(["Started", "Sent", "Finished"]) == {"Started": 1.0, "Sent": None, "Finished": None}
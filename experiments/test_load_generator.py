@@ -0,0 +1,32 @@
+import asyncio
+import random
+import time as tm
+
+from experiments.load_generator import REQUESTING_TASK, UPDATE_USER_INFO, ClientProfile, LoadStats, run_virtual_client
+
+class FlakyRpcClient:
+    """
+    Records the calls, and fails the first one with an exception that is not an AMQP error
+    """
+    def __init__(self) -> None:
+        self.calls = []
+
+    async def call(self, func_name:str, args:dict, timeout:float) -> dict:
+        self.calls.append(func_name)
+        await asyncio.sleep(0.01)
+        if len(self.calls) == 1:
+            raise ConnectionResetError("connection lost")
+        return {"status_code": 200, "return": []}
+
+def test_virtual_client_sends_stats_before_requesting_task_and_survives_errors():
+    rpc_client = FlakyRpcClient()
+    stats = LoadStats()
+    stats.start_recording()
+    profile = ClientProfile(think_time=0.01, think_distribution="fixed", stats_change_prob=0)
+    asyncio.run(run_virtual_client("load-test-0", rpc_client, profile, 1, tm.monotonic() + 0.2, stats, random.Random(0)))
+    stats.stop_recording()
+
+    assert rpc_client.calls[:3] == [UPDATE_USER_INFO, REQUESTING_TASK, REQUESTING_TASK]
+    assert rpc_client.calls.count(UPDATE_USER_INFO) == 1
+    assert stats.outcomes[UPDATE_USER_INFO] == {"exception": 1}
+    assert stats.outcomes[REQUESTING_TASK]["ok"] == len(rpc_client.calls) - 1
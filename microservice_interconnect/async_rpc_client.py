@@ -0,0 +1,263 @@
+import asyncio
+import uuid
+import weakref
+from typing import Dict, Set, Tuple
+
+import pika
+import pika.channel
+import pika.exceptions
+import pika.spec
+from pika.adapters.asyncio_connection import AsyncioConnection
+
+from microservice_interconnect.compression import decompress, maybe_compress
+from microservice_interconnect.rpc_client import RpcTimeout, request_properties
+from microservice_interconnect.wire_codecs import JSON_CONTENT_TYPE, get_codec
+
+class AsyncRpcClient:
+    """
+    Asyncio RPC client that keeps many calls in flight on a single connection
+    All calls share one exclusive reply queue and each response resolves the future
+    of the call with the same correlation ID
+
+    :param host: IP or hostname of destination broker
+    :type host: str
+
+    :param port: broker port
+    :type port: int
+
+    :param content_type: codec used to encode requests and requested for responses (see :mod:`wire_codecs`)
+    :type content_type: str
+
+    :param compression_threshold: requests of at least this size, in bytes, are compressed. If None (default), requests are never compressed (see :class:`rpc_client.RpcClient`)
+    :type compression_threshold: int
+
+    :raises wire_codecs.UnknownContentType: no codec registered for the content type
+    """
+    def __init__(self, host:str="localhost", port:int=5672, content_type:str=JSON_CONTENT_TYPE, compression_threshold:int=None) -> None:
+        self._codec = get_codec(content_type)
+        self.compression_threshold = compression_threshold
+        self.host = host
+        self.port = int(port)
+        self._connection_params = pika.ConnectionParameters(host=host, heartbeat=600, port=self.port)
+        self._connection = None
+        self._channel = None
+        self._reply_queue_name = None
+        self._declared_queues = set()
+        self._pending: Dict[str, asyncio.Future] = {}
+        # Queue declarations waiting for the broker, failed with the calls in flight
+        self._declaring: Set[asyncio.Future] = set()
+        self._connecting = None
+        self._closed = None
+
+    @property
+    def is_open(self) -> bool:
+        return (self._connection is not None and self._connection.is_open
+                and self._channel is not None and self._channel.is_open)
+
+    async def connect(self):
+        """
+        Opens the connection, the channel and the reply queue. Concurrent callers wait for the same attempt
+
+        :raises pika.exceptions.AMQPConnectionError: broker inaccessible
+        """
+        if self.is_open:
+            return
+        if self._connecting is None or self._connecting.done():
+            self._connecting = asyncio.get_running_loop().create_future()
+            self._open_connection(self._connecting)
+        await asyncio.shield(self._connecting)
+
+    def _open_connection(self, ready:asyncio.Future):
+        def on_open_error(connection, error):
+            if not ready.done():
+                ready.set_exception(pika.exceptions.AMQPConnectionError(error))
+
+        def on_reply_queue_consuming(frame):
+            if not ready.done():
+                ready.set_result(None)
+
+        def on_reply_queue_declared(frame):
+            self._reply_queue_name = frame.method.queue
+            self._channel.basic_consume(
+                queue=self._reply_queue_name,
+                on_message_callback=self._on_response,
+                auto_ack=True,
+                callback=on_reply_queue_consuming,
+            )
+
+        def on_channel_open(channel:pika.channel.Channel):
+            self._channel = channel
+            self._declared_queues = set()
+            channel.add_on_close_callback(self._on_channel_closed)
+            channel.queue_declare(queue="", exclusive=True, callback=on_reply_queue_declared)
+
+        def on_open(connection):
+            connection.channel(on_open_callback=on_channel_open)
+
+        self._connection = AsyncioConnection(
+            self._connection_params,
+            on_open_callback=on_open,
+            on_open_error_callback=on_open_error,
+            on_close_callback=self._on_connection_closed,
+            custom_ioloop=asyncio.get_running_loop(),
+        )
+
+    def _fail_pending(self, error:Exception):
+        # Calls in flight will never receive their responses
+        pending = list(self._pending.values()) + list(self._declaring)
+        self._pending = {}
+        self._declaring = set()
+        for future in pending:
+            if not future.done():
+                future.set_exception(error)
+
+    def _on_channel_closed(self, channel:pika.channel.Channel, reason:Exception):
+        if channel is not self._channel or self._connection is None or not self._connection.is_open:
+            # Closed with the connection (see _on_connection_closed)
+            return
+        # E.g. closed by the broker after a channel error. The reply queue consumer is gone with the channel
+        self._channel = None
+        self._fail_pending(pika.exceptions.AMQPChannelError(reason))
+        # The next call opens a new connection, with its own channel and reply queue
+        self._connection.close()
+
+    def _on_connection_closed(self, connection, reason):
+        if connection is not self._connection:
+            # Replaced after its channel closed: its calls already failed
+            return
+        self._fail_pending(pika.exceptions.AMQPConnectionError(reason))
+        self._channel = None
+        if self._closed is not None and not self._closed.done():
+            self._closed.set_result(None)
+
+    def _on_response(
+        self,
+        ch: pika.channel.Channel,
+        method: pika.spec.Basic.Deliver,
+        props: pika.spec.BasicProperties,
+        body: bytes
+    ) -> None:
+        future = self._pending.pop(props.correlation_id, None)
+        if future is not None and not future.done():
+            future.set_result((props, body))
+
+    async def _declare_queue(self, queue_name:str):
+        # This queue probabily alerdy exists, but its nice to declare (once per connection)
+        if queue_name in self._declared_queues:
+            return
+        declared = asyncio.get_running_loop().create_future()
+        self._declaring.add(declared)
+        try:
+            self._channel.queue_declare(
+                queue=queue_name,
+                callback=lambda frame: declared.done() or declared.set_result(None))
+            await declared
+        finally:
+            self._declaring.discard(declared)
+        self._declared_queues.add(queue_name)
+
+    async def call(self, func_name:str, data:dict, timeout:float=None, idempotency_key:str=None) -> dict:
+        """
+        Sends a message to a microservice and waits for the response without blocking the event loop
+
+        :param func_name: function name in the destination
+        :type func_name: str
+
+        :param data: JSON data to be sent to the microservice
+        :type data: dict
+
+        :param timeout: maximum time to wait for the response, in seconds, also sent to the service as a deadline. If None, waits forever
+        :type timeout: float
+
+        :param idempotency_key: identifies the request, so the service executes it only once (see :meth:`rpc_client.RpcClient.call`). If None, the request is not deduplicated
+        :type idempotency_key: str
+
+        :raises pika.exceptions.AMQPConnectionError: broker inaccessible or connection lost during the call
+
+        :raises pika.exceptions.AMQPChannelError: channel closed during the call
+
+        :raises rpc_client.RpcTimeout: response not received before the timeout
+
+        :return: JSON microservice response
+        :rtype: dict
+        """
+        await self.connect()
+        await self._declare_queue(func_name)
+
+        corr_id = str(uuid.uuid4())
+        properties = request_properties(func_name, self._codec.content_type, self._reply_queue_name, corr_id, timeout, idempotency_key)
+        body, properties.content_encoding = maybe_compress(self._codec.encode(data), self.compression_threshold)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[corr_id] = future
+        try:
+            self._channel.basic_publish(
+                exchange="",
+                routing_key=func_name,
+                properties=properties,
+                body=body,
+            )
+            response_props, body = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise RpcTimeout(func_name, timeout)
+        finally:
+            self._pending.pop(corr_id, None)
+        return get_codec(response_props.content_type).decode(decompress(body, response_props.content_encoding))
+
+    async def close(self):
+        """
+        Closes RabbitMQ connection
+        """
+        if self._connection is not None and not (self._connection.is_closed or self._connection.is_closing):
+            self._closed = asyncio.get_running_loop().create_future()
+            self._connection.close()
+            await self._closed
+        self._connection = None
+
+
+# One shared client per event loop and broker
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple[str,int,str], AsyncRpcClient]]" = weakref.WeakKeyDictionary()
+
+def _get_shared_client(host:str, port:int, content_type:str) -> AsyncRpcClient:
+    loop_clients = _clients.setdefault(asyncio.get_running_loop(), {})
+    key = (host, int(port), content_type)
+    if key not in loop_clients:
+        loop_clients[key] = AsyncRpcClient(host, port, content_type)
+    return loop_clients[key]
+
+async def rpc_call_async(
+        func_name:str, 
+        request:dict, 
+        host:str="localhost", 
+        port:int=5672, 
+        content_type:str=JSON_CONTENT_TYPE,
+        timeout:float=None) -> dict:
+    """
+    Asyncio version of :func:`rpc_client.rpc_send`. Calls made concurrently (e.g. with asyncio.gather)
+    share a single connection per event loop and broker and are all in flight at the same time
+
+    :param func_name: function name in the destination
+    :type func_name: str
+
+    :param request: parameters in JSON format
+    :type request: dict
+
+    :param host: broker IP or hostname
+    :type host: str
+
+    :param port: broker port
+    :type port: int
+
+    :param content_type: codec for the request and the response
+    :type content_type: str
+
+    :param timeout: maximum time to wait for the response, in seconds. If None, waits forever
+    :type timeout: float
+
+    :return: JSON with funtion return. If the timeout expires, status code is 504
+    :rtype: dict
+    """
+    rpc_client = _get_shared_client(host, port, content_type)
+    try:
+        return await rpc_client.call(func_name, request, timeout)
+    except RpcTimeout as e:
+        return {"status_code":504, "exception":f"{e}"}
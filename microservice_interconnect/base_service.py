@@ -1,12 +1,80 @@
 import pika
-import json
 import jsonschema
 import threading
-from typing import Dict, Any
+import functools
+import heapq
+import contextvars
+import itertools
+import time as tm
+from concurrent.futures import Future
+from typing import Dict, Any, Callable, Hashable, Iterable, List, Optional, Tuple
 
 import pika.channel
+import pika.frame
 import pika.spec
 
+from microservice_interconnect.bulkhead import Bulkhead
+from microservice_interconnect.compression import DEFAULT_COMPRESSION_THRESHOLD, UnknownContentEncoding, accepts_compression, decompress, get_compression_stats, maybe_compress
+from microservice_interconnect.dedup_store import DedupStore
+from microservice_interconnect.direct_transport import DirectChannel, DirectServer
+from microservice_interconnect.latency_stats import ServiceStats
+from microservice_interconnect.load_shedding import OVERLOADED_STATUS_CODE, QUEUE_DEPTH_POLL_INTERVAL, OverloadPolicy, ServiceOverloaded
+from microservice_interconnect.loopback import LoopbackSelectConnection, is_loopback_host
+from microservice_interconnect.profiling import EndpointProfiler
+from microservice_interconnect.protocol import ACCEPT_ENCODING_HEADER, ACCEPT_HEADER, BATCH_FUNC_NAME, DEADLINE_HEADER, IDEMPOTENCY_KEY_HEADER, PROFILE_FUNC_NAME, SENT_AT_HEADER, STATS_FUNC_NAME, STREAM_HEADER
+from microservice_interconnect.response_cache import CachePolicy, ResponseCache
+from microservice_interconnect.schema_validation import CompiledValidator
+from microservice_interconnect.service_registry import get_service_registry
+from microservice_interconnect.tracing import extract, set_span_attribute, start_span
+from microservice_interconnect.wire_codecs import JSON_CONTENT_TYPE, Codec, UnknownContentType, get_codec, negotiate_codec
+
+EXECUTION_MODES = ("inline", "thread", "process")
+
+# Priority classes of endpoints, from the highest to the lowest
+PRIORITY_CLASSES = ("control", "normal", "bulk")
+# Bulkhead created for "control" endpoints without bulkhead, outside "inline" mode
+CONTROL_BULKHEAD = "control"
+
+# Chunks of a streamed response that a bulkhead thread may have waiting for the connection thread
+STREAM_WINDOW = 8
+
+# Batch envelopes (see protocol.BATCH_FUNC_NAME) run in their own bulkhead and are validated with this schema
+BATCH_BULKHEAD = "batch"
+BATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "calls": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "func_name": {"type": "string"},
+                    "args": {}
+                },
+                "required": ["func_name"]
+            }
+        },
+        "parallel": {"type": "boolean"}
+    },
+    "required": ["calls"]
+}
+BATCH_VALIDATOR = CompiledValidator(BATCH_SCHEMA, fast=True)
+
+# Profiling control messages (see protocol.PROFILE_FUNC_NAME) are validated with this schema
+PROFILE_ACTIONS = ("enable", "disable", "dump", "status")
+PROFILE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "func_name": {"type": "string"},
+        "action": {"enum": list(PROFILE_ACTIONS)},
+        "profile_slowest": {"type": "integer", "minimum": 0},
+        "sample_rate": {"type": "number", "minimum": 0, "maximum": 1},
+        "trace_allocations": {"type": "boolean"}
+    },
+    "required": ["func_name", "action"]
+}
+PROFILE_VALIDATOR = CompiledValidator(PROFILE_SCHEMA)
+
 class BaseService:
     """
     Generic service
@@ -21,19 +89,109 @@ class BaseService:
     
     :param broker_port: RPC broker port
     :type broker_port: int
+
+    :param execution_mode: "inline" executes requests in the connection thread, one at a time. "thread" and "process" execute them in a "default" bulkhead of threads or processes, and batch envelopes in a "batch" bulkhead of threads
+    :type execution_mode: str
+
+    :param max_workers: number of workers of the "default" bulkhead. Ignored if execution_mode is "inline"
+    :type max_workers: int
+
+    :param fast_schema_validation: if True, simple schemas are also compiled into specialized check functions, faster than jsonschema for valid requests
+    :type fast_schema_validation: bool
+
+    :param prefetch_count: maximum number of unacknowledged messages delivered to each endpoint executed in the connection thread. Keeps dispatch fair between replicas consuming the same queues
+    :type prefetch_count: int
+
+    :param compression_threshold: responses of at least this size, in bytes, are compressed, if the client accepts it. If None, responses are never compressed
+    :type compression_threshold: int
+
+    :param dedup_store: responses of requests with an idempotency key, replayed for redeliveries. Default: in memory. Use a store with a path to survive crashes
+    :type dedup_store: DedupStore
+
+    :param direct_address: if informed, the service also listens at this Unix socket or TCP address (e.g. "unix:/tmp/cloud_ml.sock"), and registers its endpoints in the process :class:`service_registry.ServiceRegistry`, so co-located clients call it without the broker
+    :type direct_address: str
+
+    :param profile_dir: directory where the profiles of endpoints are dumped (see :meth:`enable_profiling`)
+    :type profile_dir: str
+
+    :raises ValueError: unknown execution mode
     """
     def __init__(
             self, 
             hide_error_info:bool=False, 
             broker_host:str="localhost",
-            broker_port:int=5672) -> None:
+            broker_port:int=5672,
+            execution_mode:str="inline",
+            max_workers:int=4,
+            fast_schema_validation:bool=False,
+            prefetch_count:int=1,
+            compression_threshold:int=DEFAULT_COMPRESSION_THRESHOLD,
+            dedup_store:DedupStore=None,
+            direct_address:str=None,
+            profile_dir:str="profiles") -> None:
         self.broker_host = broker_host
         self.broker_port = broker_port
         self.hide_error_info = hide_error_info
         self.func_name_to_func_and_schema_map = {}
         self.background = None
+        self.fast_schema_validation = fast_schema_validation
+        self.stats = ServiceStats()
+        self.prefetch_count = prefetch_count
+        self.compression_threshold = compression_threshold
+        self.dedup_store = dedup_store if dedup_store is not None else DedupStore()
+        self.direct_address = direct_address
+        self._direct_server = None
+        self.profile_dir = profile_dir
+        # Endpoints being profiled. Others only pay a dictionary lookup
+        self.profilers: Dict[str, EndpointProfiler] = {}
+        self.connection = None
+        self.channels: Dict[str, pika.channel.Channel] = {}
+        self._consumer_tags = []
+        # Requests waiting for the connection thread in "inline" mode, by priority
+        self._inline_requests = []
+        self._inline_sequence = itertools.count()
+        self._inline_scheduled = False
+        # Last known number of messages in the queues of endpoints with max_queue_depth, and requests rejected by overload
+        self._queue_depths: Dict[str, int] = {}
+        self.shed_counts: Dict[str, int] = {}
+        self._in_flight = 0
+        self._draining = False
+
+        if execution_mode not in EXECUTION_MODES:
+            raise ValueError(f"Execution mode should be one of {EXECUTION_MODES}, not {execution_mode}")
+        self.execution_mode = execution_mode
+        self.bulkheads: Dict[str, Bulkhead] = {}
+        if execution_mode != "inline":
+            self.add_bulkhead("default", max_workers=max_workers, use_processes=(execution_mode == "process"))
+            self.add_bulkhead(BATCH_BULKHEAD, max_workers=max_workers)
+
+    def add_bulkhead(self, name:str, max_workers:int=4, use_processes:bool=False):
+        """
+        Creates an isolated group of workers, that can be assigned to endpoints in :meth:`add_api_endpoint`
 
-    def add_api_endpoint(self, func_name:str, schema: Dict[str, Any], func: Any):
+        :param name: bulkhead name
+        :type name: str
+
+        :param max_workers: maximum number of requests executed at the same time in this bulkhead
+        :type max_workers: int
+
+        :param use_processes: if True, registered functions run in a process pool. They must be picklable
+        :type use_processes: bool
+        """
+        self.bulkheads[name] = Bulkhead(name, max_workers=max_workers, use_processes=use_processes)
+
+    def add_api_endpoint(
+            self, 
+            func_name:str, 
+            schema: Dict[str, Any], 
+            func: Any,
+            prefetch_count:int=None,
+            bulkhead:str=None,
+            cache_policy:CachePolicy=None,
+            invalidates:Dict[str, Callable[[Any], Hashable]]=None,
+            priority:str="normal",
+            overload_policy:OverloadPolicy=None,
+            stream_chunk_size:int=None):
         """
         Register a new function to be executed uppon receiving RPC call 
 
@@ -45,23 +203,311 @@ class BaseService:
 
         :param func: function to be executed
         :type func: Any
+
+        :param prefetch_count: maximum number of unacknowledged messages delivered for this endpoint. If None, uses the bulkhead size (or the service prefetch_count in "inline" mode)
+        :type prefetch_count: int
+
+        :param bulkhead: name of the bulkhead that executes the requests. If None, uses "default" bulkhead, or the connection thread in "inline" mode
+        :type bulkhead: str
+
+        :param cache_policy: if informed, successful responses are cached. Only for read-only endpoints
+        :type cache_policy: CachePolicy
+
+        :param invalidates: maps cached endpoints names to functions that receive the request and return the cache key to be invalidated after executing this endpoint. If a function is None, the whole cache is invalidated. Only the cache of this process is invalidated: other replicas keep their entries until the TTL expires
+        :type invalidates: Dict[str, Callable[[Any], Hashable]]
+
+        :param priority: one of :data:`PRIORITY_CLASSES`. Each class is consumed in its own channel, and requests waiting for the connection thread are executed in priority order. Outside "inline" mode, "control" endpoints without bulkhead run in a dedicated "control" bulkhead
+        :type priority: str
+
+        :param overload_policy: if informed, requests beyond its queue depth or age limits are answered with status code 503 and "retry_after", without executing
+        :type overload_policy: OverloadPolicy
+
+        :param stream_chunk_size: if informed, func returns an iterable (e.g. a generator), whose items are sent to clients that accept streams (see :meth:`rpc_client.RpcClient.call_stream`) in messages of up to this many items. Other clients receive the items as a list
+        :type stream_chunk_size: int
+
+        :raises ValueError: bulkhead not created with :meth:`add_bulkhead`, unknown priority class, or streaming endpoint with cache or in a bulkhead of processes
+
+        :raises jsonschema.SchemaError: invalid schema
         """
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"Priority should be one of {PRIORITY_CLASSES}, not {priority}")
+        if bulkhead is None and priority == "control" and self.execution_mode != "inline":
+            if CONTROL_BULKHEAD not in self.bulkheads:
+                self.add_bulkhead(CONTROL_BULKHEAD, max_workers=2)
+            bulkhead = CONTROL_BULKHEAD
+        if bulkhead is None and "default" in self.bulkheads:
+            bulkhead = "default"
+        if bulkhead is not None and bulkhead not in self.bulkheads:
+            raise ValueError(f"Bulkhead {bulkhead} was not created")
+        if prefetch_count is None:
+            prefetch_count = self.bulkheads[bulkhead].max_workers if bulkhead is not None else self.prefetch_count
+        if stream_chunk_size is not None:
+            # Generators can be neither cached nor sent back from other processes
+            if cache_policy is not None:
+                raise ValueError(f"Streaming endpoint {func_name} cannot be cached")
+            if bulkhead is not None and self.bulkheads[bulkhead].use_processes:
+                raise ValueError(f"Streaming endpoint {func_name} cannot run in bulkhead of processes {bulkhead}")
+
         self.func_name_to_func_and_schema_map[func_name] = {
             "func":func,
-            "schema":schema
+            "schema":schema,
+            "validator":CompiledValidator(schema, fast=self.fast_schema_validation) if schema is not None else None,
+            "prefetch_count":prefetch_count,
+            "bulkhead":bulkhead,
+            "cache":ResponseCache(cache_policy) if cache_policy is not None else None,
+            "invalidates":invalidates or {},
+            "priority":priority,
+            "overload":overload_policy,
+            "stream_chunk_size":stream_chunk_size
+        }
+
+    def invalidate_cache(self, func_name:str, key:Hashable=None):
+        """
+        Removes cached responses of an endpoint. Used when data changes outside the endpoints that declared invalidations
+
+        :param func_name: cached endpoint name
+        :type func_name: str
+
+        :param key: cache key to be removed. If None, the whole cache is invalidated
+        :type key: Hashable
+        """
+        cache = self.func_name_to_func_and_schema_map.get(func_name, {}).get("cache")
+        if cache is not None:
+            cache.invalidate(key)
+
+    def cache_stats(self) -> Dict[str, dict]:
+        """
+        :return: hits, misses, evictions, invalidations and size of the cache of each cached endpoint
+        :rtype: Dict[str, dict]
+        """
+        return {
+            func_name: func_and_schema["cache"].stats()
+            for func_name, func_and_schema in self.func_name_to_func_and_schema_map.items()
+            if func_and_schema.get("cache") is not None
         }
 
+    def enable_profiling(self, func_name:str, profile_slowest:int=0, sample_rate:float=0.1, trace_allocations:bool=True):
+        """
+        Starts measuring each call of an endpoint (see :class:`profiling.EndpointProfiler`), discarding its previous profile.
+        Also switched on by the "rpc_profile" message type, at runtime (see :func:`rpc_client.rpc_profile`)
+
+        :param func_name: endpoint name
+        :type func_name: str
+
+        :param profile_slowest: number of cProfile snapshots of the slowest calls kept. If 0, cProfile is not used
+        :type profile_slowest: int
+
+        :param sample_rate: fraction of the calls run under cProfile
+        :type sample_rate: float
+
+        :param trace_allocations: if True, the memory allocated by each call is measured with tracemalloc
+        :type trace_allocations: bool
+
+        :raises ValueError: unknown endpoint, or endpoint that streams or runs in a bulkhead of processes, whose work is not done in the call
+        """
+        func_and_schema = self.func_name_to_func_and_schema_map.get(func_name)
+        if func_and_schema is None:
+            raise ValueError(f"{func_name} is not an endpoint of the service")
+        bulkhead = self.bulkheads.get(func_and_schema.get("bulkhead"))
+        if bulkhead is not None and bulkhead.use_processes:
+            raise ValueError(f"{func_name} runs in bulkhead of processes {bulkhead.name} and cannot be profiled")
+        if func_and_schema.get("stream_chunk_size") is not None:
+            raise ValueError(f"Streaming endpoint {func_name} cannot be profiled")
+        previous = self.profilers.get(func_name)
+        self.profilers[func_name] = EndpointProfiler(func_name, profile_slowest, sample_rate, trace_allocations)
+        if previous is not None:
+            previous.stop()
+
+    def disable_profiling(self, func_name:str, dump:bool=False) -> Optional[dict]:
+        """
+        :param func_name: endpoint name
+        :type func_name: str
+
+        :param dump: if True, the profile is written to profile_dir before being discarded
+        :type dump: bool
+
+        :return: final summary of the profile, with the written "files" if dumped, or None if the endpoint was not profiled
+        :rtype: dict
+        """
+        profiler = self.profilers.pop(func_name, None)
+        if profiler is None:
+            return None
+        profiler.stop()
+        summary = profiler.summary()
+        if dump:
+            summary["files"] = profiler.dump(self.profile_dir)
+        return summary
+
+    def dump_profiling(self, func_name:str) -> List[str]:
+        """
+        Writes the profile of an endpoint to profile_dir, without stopping it
+
+        :param func_name: endpoint name
+        :type func_name: str
+
+        :return: paths of the written files. Empty if the endpoint is not profiled
+        :rtype: List[str]
+        """
+        profiler = self.profilers.get(func_name)
+        if profiler is None:
+            return []
+        return profiler.dump(self.profile_dir)
+
+    def _process_profile_request(self, rcv_data:Any) -> dict:
+        """
+        Handles a profiling control message: {"func_name", "action": one of :data:`PROFILE_ACTIONS`, and the options of :meth:`enable_profiling`}
+
+        :return: response with "enabled", the profile "summary" and the dumped "files"
+        :rtype: dict
+        """
+        try:
+            PROFILE_VALIDATOR.validate(rcv_data)
+        except jsonschema.ValidationError as e:
+            return {'status_code': 400, 'exception': f"{PROFILE_FUNC_NAME} cannot be executed due to invalid arguments: {e}"}
+        func_name = rcv_data["func_name"]
+        action = rcv_data["action"]
+        files = []
+        summary = None
+        try:
+            if action == "enable":
+                self.enable_profiling(
+                    func_name,
+                    profile_slowest=rcv_data.get("profile_slowest", 0),
+                    sample_rate=rcv_data.get("sample_rate", 0.1),
+                    trace_allocations=rcv_data.get("trace_allocations", True))
+            elif action == "disable":
+                summary = self.disable_profiling(func_name, dump=True)
+                files = summary.pop("files") if summary is not None else []
+            elif action == "dump":
+                files = self.dump_profiling(func_name)
+        except (ValueError, OSError) as e:
+            return {'status_code': 400, 'exception': f"{PROFILE_FUNC_NAME} cannot be executed: {e}"}
+        profiler = self.profilers.get(func_name)
+        if profiler is not None:
+            summary = profiler.summary()
+        return {"status_code":200, "return":{"func_name":func_name, "enabled":profiler is not None, "summary":summary, "files":files}}
+
     def _on_open(self, connection: pika.SelectConnection):
-        connection.channel(on_open_callback=self._on_channel_open)
+        if self.direct_address is not None and self._direct_server is None:
+            self._start_direct_server()
+        priorities = {func_and_schema.get("priority") for func_and_schema in self.func_name_to_func_and_schema_map.values()}
+        for priority in PRIORITY_CLASSES:
+            if priority in priorities:
+                # Separated channels, so the unacked messages of one class do not hold back the others
+                connection.channel(on_open_callback=functools.partial(self._on_channel_open, priority=priority))
+
+    def _start_direct_server(self):
+        self._direct_server = DirectServer(self.direct_address, self._on_direct_message)
+        try:
+            self._direct_server.start()
+        except OSError as e:
+            # The broker is enough to serve every request
+            print(f"Direct transport not available at {self.direct_address}: {e}")
+            self._direct_server = None
+            return
+        registry = get_service_registry()
+        if registry is not None:
+            registry.register(list(self.func_name_to_func_and_schema_map), self.direct_address)
+
+    def _stop_direct_server(self, close_connections:bool=False):
+        if self._direct_server is None:
+            return
+        registry = get_service_registry()
+        if registry is not None:
+            registry.unregister(list(self.func_name_to_func_and_schema_map), self.direct_address)
+        if close_connections:
+            self._direct_server.close()
+            self._direct_server = None
+        else:
+            self._direct_server.stop_listening()
+
+    def _on_direct_message(self, channel: DirectChannel, queue_name:str, props: pika.spec.BasicProperties, body:bytes):
+        # Runs in a direct transport thread: the request joins the ones received from the broker
+        if self._draining:
+            # Not executed: RpcClient sends the call again through the broker, to other replica
+            channel.close()
+            return
+        method = pika.spec.Basic.Deliver(consumer_tag="direct", delivery_tag=0, routing_key=queue_name)
+        try:
+            self.connection.ioloop.add_callback_threadsafe(
+                functools.partial(self._uppon_receiving_message, channel, method, props, body))
+        except Exception as e:
+            print(f"Could not handle {props.type} from direct transport: {e}")
+            channel.close()
+
+    def _on_connection_closed(self, connection: pika.SelectConnection, reason: Exception):
+        print(f"Connection closed: {reason}")
+        connection.ioloop.stop()
 
-    def _on_channel_open(self, channel: pika.channel.Channel):
-        for func_name in self.func_name_to_func_and_schema_map.keys():
+    def _on_channel_open(self, channel: pika.channel.Channel, priority:str="normal"):
+        self.channels[priority] = channel
+        if self._draining:
+            # Stopped before the channel opened
+            self._close_connection()
+            return
+        for func_name, func_and_schema in self.func_name_to_func_and_schema_map.items():
+            if func_and_schema.get("priority") != priority:
+                continue
             channel.queue_declare(queue=func_name)
-            channel.basic_consume(
+            if func_and_schema.get("prefetch_count") is not None:
+                # Applies to the consumer created next in this channel
+                channel.basic_qos(prefetch_count=func_and_schema.get("prefetch_count"))
+            self._consumer_tags.append((channel, channel.basic_consume(
                 queue=func_name,
                 on_message_callback=self._uppon_receiving_message,
                 auto_ack=False
-            )
+            )))
+            overload_policy = func_and_schema.get("overload")
+            if overload_policy is not None and overload_policy.max_queue_depth is not None:
+                self._poll_queue_depth(channel, func_name)
+
+    def _poll_queue_depth(self, channel: pika.channel.Channel, func_name:str):
+        if self._draining or not channel.is_open:
+            return
+        channel.queue_declare(queue=func_name, passive=True, callback=functools.partial(self._on_queue_depth, func_name))
+        self.connection.ioloop.call_later(QUEUE_DEPTH_POLL_INTERVAL, functools.partial(self._poll_queue_depth, channel, func_name))
+
+    def _on_queue_depth(self, func_name:str, frame: pika.frame.Method):
+        self._queue_depths[func_name] = frame.method.message_count
+
+    def _overload_retry_after(self, queue_name:str, props: pika.spec.BasicProperties) -> Optional[float]:
+        """
+        :return: time, in seconds, that the client should wait before retrying, or None if the request can be executed
+        :rtype: float
+        """
+        overload_policy = self.func_name_to_func_and_schema_map.get(queue_name, {}).get("overload")
+        if overload_policy is None or props.type in (STATS_FUNC_NAME, PROFILE_FUNC_NAME):
+            return None
+        depth = self._queue_depths.get(queue_name)
+        if depth is not None:
+            # Each delivery removes a message from the queue, until the next check
+            self._queue_depths[queue_name] = max(depth - 1, 0)
+            if overload_policy.max_queue_depth is not None and depth > overload_policy.max_queue_depth:
+                return overload_policy.retry_after
+        sent_at = (props.headers or {}).get(SENT_AT_HEADER)
+        if overload_policy.max_queue_age is not None and sent_at is not None and tm.time() - sent_at > overload_policy.max_queue_age:
+            return overload_policy.retry_after
+        return None
+
+    def _reject_overloaded(
+        self,
+        ch: pika.channel.Channel,
+        method: pika.spec.Basic.Deliver,
+        props: pika.spec.BasicProperties,
+        retry_after:float
+    ):
+        response_codec = negotiate_codec((props.headers or {}).get(ACCEPT_HEADER))
+        response = {
+            'status_code': OVERLOADED_STATUS_CODE,
+            'exception': f"{method.routing_key} is overloaded, retry after {retry_after} s",
+            'retry_after': retry_after
+        }
+        try:
+            self._send_response(ch, props, method, response_codec.encode(response), response_codec.content_type)
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+            self.shed_counts[method.routing_key] = self.shed_counts.get(method.routing_key, 0) + 1
+        finally:
+            self._request_finished()
 
     def _uppon_receiving_message(
         self,
@@ -70,38 +516,314 @@ class BaseService:
         props: pika.spec.BasicProperties,
         body: bytes
     ) -> None:
-        response = self._process_generic_request(body, func_name=props.type)
-        self._send_response(ch, props, method, response)
-        ch.basic_ack(delivery_tag=method.delivery_tag)
+        self._in_flight += 1
+        retry_after = self._overload_retry_after(method.routing_key, props)
+        if retry_after is not None:
+            # Answered right away by the connection thread, so the queue does not grow while overloaded
+            self._reject_overloaded(ch, method, props, retry_after)
+            return
+        if props.type == BATCH_FUNC_NAME:
+            # Batches wait for their calls, so they must not take workers from the endpoints bulkheads
+            bulkhead_name = BATCH_BULKHEAD if BATCH_BULKHEAD in self.bulkheads else None
+        else:
+            bulkhead_name = self.func_name_to_func_and_schema_map.get(props.type, {}).get("bulkhead")
+        if bulkhead_name is None:
+            func_and_schema = self.func_name_to_func_and_schema_map.get(method.routing_key, {})
+            rank = PRIORITY_CLASSES.index(func_and_schema.get("priority", "normal"))
+            heapq.heappush(self._inline_requests, (rank, next(self._inline_sequence), ch, method, props, body))
+            if not self._inline_scheduled:
+                self._inline_scheduled = True
+                self.connection.ioloop.add_callback_threadsafe(self._process_next_inline_request)
+            return
+
+        send_chunk = functools.partial(self._send_chunk_threadsafe, ch, props, method, threading.Semaphore(STREAM_WINDOW))
+        future = self.bulkheads[bulkhead_name].submit(self._process_generic_request, body, props.type, props, send_chunk)
+        future.add_done_callback(functools.partial(self._on_request_done, ch, method, props))
+
+    def _process_next_inline_request(self):
+        # One request per ioloop iteration: messages received in the meantime join the queue
+        # before the next one is chosen, so higher priorities go first
+        _, _, ch, method, props, body = heapq.heappop(self._inline_requests)
+        if self._inline_requests:
+            self.connection.ioloop.add_callback_threadsafe(self._process_next_inline_request)
+        else:
+            self._inline_scheduled = False
+        try:
+            if not ch.is_open:
+                # Not acked: the broker redelivers it
+                return
+            response, content_type, content_encoding = self._process_generic_request(
+                body, props.type, props, functools.partial(self._send_response, ch, props, method))
+            self._send_response(ch, props, method, response, content_type, content_encoding)
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+        finally:
+            self._request_finished()
+
+    def _on_request_done(
+        self,
+        ch: pika.channel.Channel,
+        method: pika.spec.Basic.Deliver,
+        props: pika.spec.BasicProperties,
+        future: Future
+    ) -> None:
+        # Runs in a bulkhead thread: hands the response back to the connection thread
+        try:
+            self.connection.ioloop.add_callback_threadsafe(
+                functools.partial(self._complete_request, ch, method, props, future))
+        except Exception as e:
+            # Connection alredy closed. The request was not acked, so the broker redelivers it
+            print(f"Could not complete {props.type}: {e}")
+
+    def _complete_request(
+        self,
+        ch: pika.channel.Channel,
+        method: pika.spec.Basic.Deliver,
+        props: pika.spec.BasicProperties,
+        future: Future
+    ) -> None:
+        # Runs in the connection thread, since pika channels are not thread-safe
+        try:
+            if future.cancelled() or not ch.is_open:
+                return
+            response, content_type, content_encoding = future.result()
+            self._send_response(ch, props, method, response, content_type, content_encoding)
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+        finally:
+            self._request_finished()
+
+    def _send_chunk_threadsafe(
+        self,
+        ch: pika.channel.Channel,
+        props: pika.spec.BasicProperties,
+        method: pika.spec.Basic.Deliver,
+        window: threading.Semaphore,
+        chunk:bytes,
+        content_type:str,
+        content_encoding:str
+    ) -> None:
+        # Runs in a bulkhead thread. The window stops fast generators from piling chunks up in the ioloop
+        if not ch.is_open:
+            raise ConnectionError(f"Channel closed while streaming {props.type}")
+        window.acquire()
+        try:
+            self.connection.ioloop.add_callback_threadsafe(functools.partial(
+                self._send_chunk, ch, props, method, window, chunk, content_type, content_encoding))
+        except Exception:
+            window.release()
+            raise
+
+    def _send_chunk(
+        self,
+        ch: pika.channel.Channel,
+        props: pika.spec.BasicProperties,
+        method: pika.spec.Basic.Deliver,
+        window: threading.Semaphore,
+        chunk:bytes,
+        content_type:str,
+        content_encoding:str
+    ) -> None:
+        try:
+            if ch.is_open:
+                self._send_response(ch, props, method, chunk, content_type, content_encoding)
+        finally:
+            window.release()
 
-    def _process_generic_request(self, body:str, func_name:str) -> str:
+    def _request_finished(self):
+        self._in_flight -= 1
+        if self._draining and self._in_flight == 0:
+            self._close_connection()
+
+    def _process_generic_request(
+            self, 
+            body:bytes, 
+            func_name:str, 
+            props:pika.spec.BasicProperties=None,
+            send_chunk:Callable[[bytes, str, str], None]=None) -> Tuple[bytes, str, str]:
         """
         Process received HTTP body, calling corresponding registered function implemented in child
+        The body is decompressed and decoded according to its content encoding and type, and the response is encoded with
+        the first codec in the "accept" header supported by the service (JSON by default), and compressed
+        if large and accepted by the client ("accept-encoding" header)
 
         :param body: HTTP request body
-        :type body: str
+        :type body: bytes
 
         :param func_name: name of the function to be executed
         :type func_name: str
 
-        :return: HTTP response body
-        :rtype: str
+        :param props: AMQP properties of the request, with content type and headers
+        :type props: pika.spec.BasicProperties
+
+        :param send_chunk: sends a chunk of a streamed response, receiving its body, content type and content encoding. If None, responses are not streamed
+        :type send_chunk: Callable[[bytes, str, str], None]
+
+        :return: HTTP response body (the end marker, for streamed responses), its content type and its content encoding (None if not compressed)
+        :rtype: Tuple[bytes, str, str]
         """
-        rcv_data = json.loads(body)
-        print(f"Received {func_name} / {rcv_data}")
-        
+        start = tm.perf_counter()
+        content_type = props.content_type if props is not None else None
+        content_encoding = props.content_encoding if props is not None else None
+        headers = (props.headers if props is not None else None) or {}
+        # Child of the caller span, so the calls made by the endpoint join the caller trace (see tracing.py)
+        with start_span(func_name, kind="server", parent=extract(headers)):
+            response_codec = negotiate_codec(headers.get(ACCEPT_HEADER))
+            compression_threshold = self.compression_threshold if accepts_compression(headers.get(ACCEPT_ENCODING_HEADER)) else None
+
+            # Only known names are measured, so random names cannot grow the stats
+            measured = func_name in self.func_name_to_func_and_schema_map or func_name in (BATCH_FUNC_NAME, STATS_FUNC_NAME, PROFILE_FUNC_NAME)
+            sent_at = headers.get(SENT_AT_HEADER)
+            if measured and sent_at is not None:
+                queue_wait = tm.time() - sent_at
+                self.stats.record(func_name, "queue_wait", queue_wait)
+                set_span_attribute("queue_wait_ms", round(1000*queue_wait, 3))
+
+            deadline = headers.get(DEADLINE_HEADER)
+            if deadline is not None and tm.time() > deadline:
+                # The caller alredy gave up waiting: do not spend time executing
+                response = {'status_code': 504, 'exception': f"{func_name} not executed: deadline expired"}
+                set_span_attribute("status_code", 504)
+                return response_codec.encode(response), response_codec.content_type, None
+
+            try:
+                rcv_data = get_codec(content_type).decode(decompress(body, content_encoding))
+            except (UnknownContentType, UnknownContentEncoding) as e:
+                response = {'status_code': 415, 'exception': f"{func_name} cannot be executed: {e}"}
+                set_span_attribute("status_code", 415)
+                return response_codec.encode(response), response_codec.content_type, None
+            except Exception as e:
+                response = {'status_code': 400, 'exception': f"{func_name} cannot be executed due to malformed body: {e}"}
+                set_span_attribute("status_code", 400)
+                return response_codec.encode(response), response_codec.content_type, None
+            decoding_time = tm.perf_counter() - start
+            print(f"Received {func_name} / {rcv_data}")
+
+            idempotency_key = headers.get(IDEMPOTENCY_KEY_HEADER)
+            stream_chunk_size = self.func_name_to_func_and_schema_map.get(func_name, {}).get("stream_chunk_size")
+            stream = send_chunk is not None and stream_chunk_size is not None and bool(headers.get(STREAM_HEADER))
+            if func_name == STATS_FUNC_NAME:
+                response = {"status_code":200, "return":self.get_stats()}
+            elif func_name == PROFILE_FUNC_NAME:
+                response = self._process_profile_request(rcv_data)
+            elif idempotency_key is not None and self._is_deduplicated(func_name):
+                response = self.dedup_store.execute_once(
+                    f"{func_name}/{idempotency_key}", functools.partial(self._dispatch_request, rcv_data, func_name))
+            else:
+                response = self._dispatch_request(rcv_data, func_name, stream)
+            if stream and response.get("status_code") == 200:
+                response = self._send_stream(
+                    func_name, response["return"], stream_chunk_size, send_chunk, response_codec, compression_threshold)
+
+            print(f"Response: {response}")
+            if isinstance(response, dict):
+                set_span_attribute("status_code", response.get("status_code"))
+            encoding_start = tm.perf_counter()
+            encoded_response, response_encoding = maybe_compress(response_codec.encode(response), compression_threshold)
+            end = tm.perf_counter()
+            if measured:
+                self.stats.record(func_name, "serialization", decoding_time + end - encoding_start)
+                self.stats.record(func_name, "total", end - start)
+            return encoded_response, response_codec.content_type, response_encoding
+
+    def _is_deduplicated(self, func_name:str) -> bool:
+        if func_name == BATCH_FUNC_NAME:
+            return True
+        func_and_schema = self.func_name_to_func_and_schema_map.get(func_name)
+        # Cached and streaming endpoints are read-only: executing them again is harmless
+        return (func_and_schema is not None and func_and_schema.get("cache") is None
+                and func_and_schema.get("stream_chunk_size") is None)
+
+    def _dispatch_request(self, rcv_data:Any, func_name:str, stream:bool=False) -> Any:
+        if func_name == BATCH_FUNC_NAME:
+            return self._process_batch_request(rcv_data)
+        return self._process_request_data(rcv_data, func_name, stream)
+
+    def _send_stream(
+            self,
+            func_name:str,
+            items:Iterable,
+            chunk_size:int,
+            send_chunk:Callable[[bytes, str, str], None],
+            response_codec:Codec,
+            compression_threshold:int) -> dict:
+        """
+        Sends the items returned by a streaming endpoint in chunks, as they are produced
+
+        :return: end marker, with the number of items sent, or the exception that interrupted the stream
+        :rtype: dict
+        """
+        count = 0
+        chunk = []
         try:
-            func_and_schema = self.func_name_to_func_and_schema_map[func_name]
-            if func_and_schema.get("schema") is not None:
-                jsonschema.validate(instance=rcv_data, schema=func_and_schema.get("schema"))
-            response = self._try_exec_child_func_and_build_response(func_and_schema.get("func"), rcv_data)
-        
-        except KeyError as e:
-            response = {
+            for item in items:
+                chunk.append(item)
+                if len(chunk) < chunk_size:
+                    continue
+                send_chunk(*self._encode_chunk(chunk, response_codec, compression_threshold))
+                count += len(chunk)
+                chunk = []
+            if chunk:
+                send_chunk(*self._encode_chunk(chunk, response_codec, compression_threshold))
+                count += len(chunk)
+        except Exception as e:
+            exception = f"{func_name} Internal error" if self.hide_error_info else f"{func_name} stream interrupted: {e}"
+            return {"status_code":500, "exception":exception, "end":True, "count":count}
+        return {"status_code":200, "end":True, "count":count}
+
+    def _encode_chunk(self, items:list, response_codec:Codec, compression_threshold:int) -> Tuple[bytes, str, str]:
+        chunk, content_encoding = maybe_compress(response_codec.encode({"status_code":200, "items":items}), compression_threshold)
+        return chunk, response_codec.content_type, content_encoding
+
+    def get_stats(self) -> dict:
+        """
+        Statistics returned by the built-in "rpc_stats" message type (see :func:`rpc_client.rpc_get_service_stats`)
+
+        :return: "latency" with count, p50, p95 and p99 (in ms) of each stage of each endpoint, "cache" with :meth:`cache_stats` "compression" with the bytes saved and CPU time spent by compression in the process, "dedup" with the number of replayed duplicates, "shed" with the number of requests rejected by overload, by endpoint, and "profiling" with the summary of each profiled endpoint
+        :rtype: dict
+        """
+        return {
+            "latency": self.stats.summary(),
+            "cache": self.cache_stats(),
+            "compression": get_compression_stats().summary(),
+            "dedup": self.dedup_store.stats(),
+            "shed": dict(self.shed_counts),
+            "profiling": {func_name: profiler.summary() for func_name, profiler in list(self.profilers.items())},
+        }
+
+    def _process_request_data(self, rcv_data:Any, func_name:str, stream:bool=False) -> dict:
+        """
+        Validates decoded request data and calls the corresponding registered function
+
+        :param rcv_data: decoded JSON request
+        :type rcv_data: Any
+
+        :param func_name: name of the function to be executed
+        :type func_name: str
+
+        :param stream: if True, the iterable returned by streaming endpoints is kept in the response. Otherwise, it is turned into a list
+        :type stream: bool
+
+        :return: response with status code and function return or exception
+        :rtype: dict
+        """
+        func_and_schema = self.func_name_to_func_and_schema_map.get(func_name)
+        if func_and_schema is None:
+            return {
                 'status_code': 500,
                 'exception': f"{func_name} is an invalid RPC function"
             }
 
+        try:
+            validator = func_and_schema.get("validator")
+            if validator is not None:
+                validation_start = tm.perf_counter()
+                try:
+                    validator.validate(rcv_data)
+                finally:
+                    self.stats.record(func_name, "validation", tm.perf_counter() - validation_start)
+            response = self._exec_endpoint(func_name, func_and_schema, rcv_data)
+            if func_and_schema.get("stream_chunk_size") is not None and not stream and response.get("status_code") == 200:
+                response["return"] = list(response["return"])
+
         except jsonschema.ValidationError as e: 
             response = {
                 'status_code': 400,
@@ -114,14 +836,78 @@ class BaseService:
             else:
                 response = {'status_code': 500,'exception': f"{func_name} An unknown error occured: {e}"}
 
+        return response
+
+    def _exec_endpoint(self, func_name:str, func_and_schema:dict, rcv_data:Any) -> dict:
+        cache = func_and_schema.get("cache")
+        if cache is not None:
+            key = cache.key(rcv_data)
+            found, response, generation = cache.get(key)
+            if found:
+                return response
+
+        bulkhead = self.bulkheads.get(func_and_schema.get("bulkhead"))
+        profiler = self.profilers.get(func_name)
+        handler_start = tm.perf_counter()
+        if profiler is None:
+            response = self._try_exec_child_func_and_build_response(func_and_schema.get("func"), rcv_data, bulkhead)
+        else:
+            response = profiler.profile(functools.partial(
+                self._try_exec_child_func_and_build_response, func_and_schema.get("func"), rcv_data, bulkhead))
+        self.stats.record(func_name, "handler", tm.perf_counter() - handler_start)
+
+        if cache is not None and response.get("status_code") == 200:
+            cache.put(key, response, generation)
+        # Even failed writes may have changed something
+        for cached_func_name, key_func in func_and_schema.get("invalidates").items():
+            self.invalidate_cache(cached_func_name, key_func(rcv_data) if key_func is not None else None)
+        return response
+
+    def _submit_batch_call(self, call:dict) -> Future:
+        func_name = call["func_name"]
+        bulkhead = self.bulkheads.get(self.func_name_to_func_and_schema_map.get(func_name, {}).get("bulkhead"))
+        if bulkhead is None:
+            # No bulkhead: executes right away, in the thread handling the batch
+            future = Future()
+            future.set_result(self._process_request_data(call.get("args"), func_name))
+            return future
+        # Runs in other thread: the calls made by the endpoint still belong to the batch span
+        return bulkhead.submit(contextvars.copy_context().run, self._process_request_data, call.get("args"), func_name)
+
+    def _process_batch_request(self, rcv_data:Any) -> Any:
+        """
+        Executes every call of a batch envelope, in order or, if "parallel" is True, at the same time
+        in the bulkheads of the called endpoints. Endpoints without bulkhead always run in order
+
+        :param rcv_data: decoded batch envelope, with a "calls" list of {"func_name", "args"}
+        :type rcv_data: Any
+
+        :return: list of responses, in the same order as the calls, or a single error response if the envelope is invalid
+        :rtype: Any
+        """
+        try:
+            BATCH_VALIDATOR.validate(rcv_data)
+        except jsonschema.ValidationError as e:
+            return {
+                'status_code': 400,
+                'exception': f"{BATCH_FUNC_NAME} cannot be executed due to invalid envelope: {e}"
+            }
 
-        print(f"Response: {response}")
-        return json.dumps(response)
+        if rcv_data.get("parallel", False):
+            futures = [self._submit_batch_call(call) for call in rcv_data["calls"]]
+            return [future.result() for future in futures]
+        return [self._submit_batch_call(call).result() for call in rcv_data["calls"]]
 
-    def _try_exec_child_func_and_build_response(self, func, argument):
+    def _try_exec_child_func_and_build_response(self, func, argument, bulkhead:Bulkhead=None):
         try:
-            returned = func(argument)
+            if bulkhead is None:
+                returned = func(argument)
+            else:
+                returned = bulkhead.run_func(func, argument)
             return {"status_code":200,"return":returned}
+        except ServiceOverloaded as e:
+            # Same response as the requests shed by the service (see _reject_overloaded)
+            return {"status_code":OVERLOADED_STATUS_CODE,"exception":f"{e}","retry_after":e.retry_after}
         except Exception as e:
             if self.hide_error_info:
                 return {"status_code":500,"exception":"Internal error"}
@@ -133,13 +919,17 @@ class BaseService:
         ch:pika.channel.Channel, 
         props:pika.spec.BasicProperties, 
         method: pika.spec.Basic.Deliver, 
-        response:str
+        response:bytes,
+        content_type:str=JSON_CONTENT_TYPE,
+        content_encoding:str=None
     ):
         ch.basic_publish(
             exchange='',
             routing_key=props.reply_to,
             properties=pika.BasicProperties(
-                correlation_id=props.correlation_id
+                correlation_id=props.correlation_id,
+                content_type=content_type,
+                content_encoding=content_encoding
             ),
             body=response
         )
@@ -150,33 +940,69 @@ class BaseService:
 
         NOTE: background = True is not recommended because of lack of testing 
 
+        If broker_host is "loopback", the service is reached only by clients in the same process, without a broker
+
         :param background: if True, a thread will be created and the function will be non-blocking 
         :type background: bool
         """
-        self.connection = pika.SelectConnection(
+        connection_class = LoopbackSelectConnection if is_loopback_host(self.broker_host) else pika.SelectConnection
+        self.connection = connection_class(
             pika.ConnectionParameters(
                 host=self.broker_host, 
                 port=self.broker_port),
-            on_open_callback=self._on_open
+            on_open_callback=self._on_open,
+            on_close_callback=self._on_connection_closed
         )
 
         print("Starting service...")
         if background:
             self.background = True
-            self.service_thread = threading.Thread(target=self.connection.ioloop.start)
+            self.service_thread = threading.Thread(target=self._run_ioloop)
             self.service_thread.start()
         else:
             self.background = False
-            self.connection.ioloop.start()
+            self._run_ioloop()
+
+    def _run_ioloop(self):
+        self.connection.ioloop.start()
+        self._stop_direct_server(close_connections=True)
+        # Requests still in execution after the drain timeout are not acked and will be redelivered
+        for bulkhead in self.bulkheads.values():
+            bulkhead.shutdown(wait=False)
 
-    def stop(self):
+    def stop(self, drain_timeout:float=30):
         """
-        Stops the microsservice from listing to RPC queues
+        Stops the microsservice gracefully: stops consuming from the RPC queues, waits for the requests
+        in execution to finish and be acked, and then closes the connection. Messages prefetched but not
+        started are returned to the queues, so other replicas can consume them
+
+        Can be called from any thread or from a signal handler. In background mode, blocks until the service stops
+
+        :param drain_timeout: maximum time, in seconds, to wait for the requests in execution
+        :type drain_timeout: float
         """
         if self.background is None:
             return
-        elif self.background is False:
-            self.connection.close()
-        else: # self.background is True
+        self.connection.ioloop.add_callback_threadsafe(functools.partial(self._drain, drain_timeout))
+        if self.background and threading.current_thread() is not self.service_thread:
+            self.service_thread.join()
+
+    def _drain(self, drain_timeout:float):
+        if self._draining:
+            return
+        self._draining = True
+        self._stop_direct_server()
+        for channel, consumer_tag in self._consumer_tags:
+            if channel.is_open:
+                channel.basic_cancel(consumer_tag)
+        if self._in_flight == 0 or not any(channel.is_open for channel in self.channels.values()):
+            self._close_connection()
+        else:
+            self.connection.ioloop.call_later(drain_timeout, self._close_connection)
+
+    def _close_connection(self):
+        if self.connection.is_open:
             self.connection.close()
-            self.service_thread.join()
\ No newline at end of file
+        elif self.connection.is_closed:
+            # Never opened: on_close_callback is not called
+            self.connection.ioloop.stop()
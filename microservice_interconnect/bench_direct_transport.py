@@ -0,0 +1,69 @@
+import argparse
+import tempfile
+import time as tm
+
+import pika
+import pika.exceptions
+
+from microservice_interconnect.base_service import BaseService
+from microservice_interconnect.loopback import LOOPBACK_HOST
+from microservice_interconnect.rpc_client import RpcClient
+from microservice_interconnect.service_registry import ServiceRegistry, set_service_registry
+
+FUNC_NAME = "rpc_exec_bench_direct"
+
+def echo(received:dict) -> dict:
+    return received
+
+def broker_available(host:str, port:int) -> bool:
+    try:
+        pika.BlockingConnection(pika.ConnectionParameters(host=host, port=port)).close()
+        return True
+    except pika.exceptions.AMQPConnectionError:
+        return False
+
+def measure_hop_latency(host:str, port:int, direct_address:str, direct:bool, n_calls:int) -> float:
+    service = BaseService(broker_host=host, broker_port=port, direct_address=direct_address)
+    service.add_api_endpoint(FUNC_NAME, None, echo)
+    service.start(background=True)
+    # The direct transport starts with the broker connection
+    tm.sleep(0.5)
+
+    rpc_client = RpcClient(queue_name=FUNC_NAME, host=host, port=port, direct=direct)
+    request = {"user_id": "xxxx", "data_qnt": 10}
+    latencies = []
+    try:
+        for _ in range(n_calls):
+            start = tm.perf_counter()
+            response = rpc_client.call(request)
+            latencies.append(tm.perf_counter() - start)
+            assert response["status_code"] == 200, response
+    finally:
+        rpc_client.close()
+        service.stop()
+    latencies.sort()
+    return 1000*latencies[len(latencies)//2]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-hop latency of calls through the broker and through the direct transport")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=5672)
+    parser.add_argument("-n", "--n_calls", type=int, default=2000)
+    args = parser.parse_args()
+
+    registry_path = tempfile.mkdtemp(prefix="registry-")
+    set_service_registry(ServiceRegistry(registry_path))
+
+    host, port = args.host, args.port
+    if broker_available(host, port):
+        broker = measure_hop_latency(host, port, None, False, args.n_calls)
+        print(f"Median hop latency, broker = {broker:.3f} ms")
+    else:
+        # The services still need a connection, to receive calls of remote clients
+        print(f"Broker not available at {host}:{port}, measuring only the direct transport")
+        host, port = LOOPBACK_HOST, 5200
+
+    unix = measure_hop_latency(host, port, f"unix:{registry_path}/bench.sock", True, args.n_calls)
+    print(f"Median hop latency, direct Unix socket = {unix:.3f} ms")
+    tcp = measure_hop_latency(host, port, "tcp:127.0.0.1:9199", True, args.n_calls)
+    print(f"Median hop latency, direct TCP = {tcp:.3f} ms")
@@ -0,0 +1,38 @@
+import argparse
+import threading
+import time as tm
+from pathlib import Path
+from pprint import pprint
+
+from microservice_interconnect.loopback import LOOPBACK_HOST
+from microservice_interconnect.rpc_client import rpc_send
+from microservice_interconnect.sample_service import SampleService
+
+def call_endpoint(n_calls:int, port:int):
+    for _ in range(n_calls):
+        response = rpc_send("rpc_exec_a", {"arg_1":1}, host=LOOPBACK_HOST, port=port)
+        assert response == {"status_code":200,"return":2}, response
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the throughput of a service endpoint without broker, using the loopback transport")
+    parser.add_argument("--port", type=int, default=5000, help="identifies the loopback broker")
+    parser.add_argument("-n", "--n_calls", type=int, default=5000, help="calls per client thread")
+    parser.add_argument("-c", "--clients", type=int, default=1, help="number of client threads")
+    args = parser.parse_args()
+
+    service = SampleService(str(Path().resolve()), LOOPBACK_HOST, args.port)
+    service.start(background=True)
+    call_endpoint(10, args.port)
+
+    clients = [threading.Thread(target=call_endpoint, args=(args.n_calls, args.port)) for _ in range(args.clients)]
+    start = tm.perf_counter()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    elapsed = tm.perf_counter() - start
+    stats = service.get_stats()
+    service.stop()
+
+    print(f"Loopback throughput = {args.clients*args.n_calls/elapsed:.1f} calls/s")
+    pprint(stats["latency"]["rpc_exec_a"])
@@ -0,0 +1,55 @@
+import argparse
+import time as tm
+
+import pika
+
+from microservice_interconnect.base_service import BaseService
+from microservice_interconnect.loopback import LOOPBACK_HOST
+from microservice_interconnect.rpc_client import RpcClient
+
+def update_stats(received:dict):
+    # Stands for a DB write, such as rpc_exec_update_user_info
+    tm.sleep(0.0005)
+
+def stop_task(received:dict) -> str:
+    return received["task_id"]
+
+def measure_control_latency(use_priorities:bool, port:int, flood_size:int, n_control_calls:int) -> float:
+    service = BaseService(broker_host=LOOPBACK_HOST, broker_port=port)
+    service.add_api_endpoint("rpc_exec_update_stats", None, update_stats, priority="bulk" if use_priorities else "normal")
+    service.add_api_endpoint("rpc_exec_stop_task", None, stop_task, priority="control" if use_priorities else "normal")
+    service.start(background=True)
+
+    flood_client = RpcClient(queue_name="rpc_exec_update_stats", host=LOOPBACK_HOST, port=port)
+    control_client = RpcClient(queue_name="rpc_exec_stop_task", host=LOOPBACK_HOST, port=port)
+    latencies = []
+    try:
+        for _ in range(n_control_calls):
+            # Responses of the flood go to the flood client reply queue and are never read
+            for _ in range(flood_size):
+                flood_client.publish({"user_id": "xxxx", "data_qnt": 10}, properties=pika.BasicProperties(
+                    reply_to=flood_client.callback_queue_name, type="rpc_exec_update_stats"))
+            start = tm.perf_counter()
+            response = control_client.call({"task_id": "runaway"})
+            latencies.append(tm.perf_counter() - start)
+            assert response["status_code"] == 200, response
+            # Lets the service consume the rest of the flood before the next round
+            while service.get_stats()["latency"].get("rpc_exec_update_stats", {}).get("total", {}).get("count", 0) < flood_size*len(latencies):
+                tm.sleep(0.01)
+    finally:
+        flood_client.close()
+        control_client.close()
+        service.stop()
+    latencies.sort()
+    return 1000*latencies[len(latencies)//2]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency of a control-plane call behind a flood of bulk calls, with and without priority classes")
+    parser.add_argument("-f", "--flood_size", type=int, default=2000, help="bulk calls queued before each control call")
+    parser.add_argument("-n", "--n_control_calls", type=int, default=5)
+    args = parser.parse_args()
+
+    before = measure_control_latency(False, 5101, args.flood_size, args.n_control_calls)
+    after = measure_control_latency(True, 5102, args.flood_size, args.n_control_calls)
+    print(f"Control call median latency, single lane (before) = {before:.2f} ms")
+    print(f"Control call median latency, priority lanes (after) = {after:.2f} ms")
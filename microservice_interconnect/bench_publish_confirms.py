@@ -0,0 +1,49 @@
+import argparse
+import time as tm
+
+import pika
+
+from microservice_interconnect.rpc_client import RpcClient
+
+QUEUE_NAME = "bench_publish_confirms"
+
+def fire_and_forget(rpc_client:RpcClient, messages:list, batch_size:int):
+    for message in messages:
+        rpc_client.publish(message)
+
+def confirmed_one_by_one(rpc_client:RpcClient, messages:list, batch_size:int):
+    # A round trip to the broker per message, as a blocking channel in confirm mode
+    for message in messages:
+        rpc_client.publish_many([message], confirm=True)
+
+def confirmed_pipelined(rpc_client:RpcClient, messages:list, batch_size:int):
+    for i in range(0, len(messages), batch_size):
+        rpc_client.publish_many(messages[i:i+batch_size], confirm=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare publishing throughput with and without publisher confirms")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=5672)
+    parser.add_argument("-n", "--n_messages", type=int, default=20000)
+    parser.add_argument("-b", "--batch_size", type=int, default=500, help="messages per pipelined batch")
+    args = parser.parse_args()
+
+    messages = [{"time": tm.time(), "service": "bench", "function": "bench", "event": f"Message {i}"} for i in range(args.n_messages)]
+    rpc_client = RpcClient(queue_name=QUEUE_NAME, host=args.host, port=args.port)
+    strategies = {
+        "fire-and-forget": fire_and_forget,
+        "confirmed, one by one": confirmed_one_by_one,
+        "confirmed, pipelined": confirmed_pipelined,
+    }
+    try:
+        for name, publish in strategies.items():
+            start = tm.perf_counter()
+            publish(rpc_client, messages, args.batch_size)
+            elapsed = tm.perf_counter() - start
+            print(f"{name} = {args.n_messages/elapsed:.1f} messages/s")
+    finally:
+        rpc_client.close()
+        # Removes the benchmark messages from the broker
+        connection = pika.BlockingConnection(pika.ConnectionParameters(host=args.host, port=args.port))
+        connection.channel().queue_delete(queue=QUEUE_NAME)
+        connection.close()
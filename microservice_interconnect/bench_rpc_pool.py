@@ -0,0 +1,50 @@
+import argparse
+import time as tm
+from pathlib import Path
+
+from microservice_interconnect.rpc_client import RpcClient, rpc_send
+from microservice_interconnect.sample_service import SampleService
+
+def call_unpooled(host:str, port:int) -> dict:
+    # Behaviour before pooling: new connection and new reply queue for every call
+    rpc_client = RpcClient(queue_name="rpc_exec_a", host=host, port=port, pooled=False)
+    try:
+        return rpc_client.call({"arg_1":1})
+    finally:
+        rpc_client.close()
+
+def call_pooled(host:str, port:int) -> dict:
+    rpc_client = RpcClient(queue_name="rpc_exec_a", host=host, port=port)
+    try:
+        return rpc_client.call({"arg_1":1})
+    finally:
+        rpc_client.close()
+
+def measure(call, n_calls:int, host:str, port:int) -> float:
+    start = tm.perf_counter()
+    for _ in range(n_calls):
+        response = call(host, port)
+        assert response == {"status_code":200,"return":2}, response
+    return n_calls/(tm.perf_counter()-start)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare RPC calls/sec with and without the connection pool")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("-n", "--n_calls", type=int, default=500)
+    args = parser.parse_args()
+
+    service = SampleService(str(Path().resolve()), args.host, args.port)
+    service.start(background=True)
+    # Warm up, also ensuring that the service queues were declared
+    rpc_send("rpc_exec_a", {"arg_1":1}, host=args.host, port=args.port)
+
+    try:
+        before = measure(call_unpooled, args.n_calls, args.host, args.port)
+        after = measure(call_pooled, args.n_calls, args.host, args.port)
+    finally:
+        service.stop()
+
+    print(f"Unpooled (before) = {before:.1f} calls/s")
+    print(f"Pooled (after) = {after:.1f} calls/s")
+    print(f"Speedup = {after/before:.2f}x")
@@ -0,0 +1,41 @@
+import argparse
+import json
+import os
+import timeit
+
+import jsonschema
+
+from microservice_interconnect.schema_validation import CompiledValidator
+
+REQUEST = {
+    "user_id": "guilhermeeec",
+    "data_qnt": 323,
+    "avg_acc_contrib": 0.12,
+    "avg_disconnection_per_round": 0.44,
+    "sensors": ["camera", "ecu"],
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare JSON schema validation strategies used in the RPC dispatch path")
+    parser.add_argument("--schema", default=os.path.join("user_manager", "schemas", "rpc_exec_update_user_info.json"))
+    parser.add_argument("-n", "--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    with open(args.schema) as f:
+        schema = json.load(f)
+
+    compiled = CompiledValidator(schema)
+    fast = CompiledValidator(schema, fast=True)
+    print(f"Fast path available for {args.schema}: {fast.has_fast_path}")
+
+    strategies = {
+        "jsonschema.validate (per message)": lambda: jsonschema.validate(instance=REQUEST, schema=schema),
+        "precompiled validator": lambda: compiled.validate(REQUEST),
+        "precompiled + fast path": lambda: fast.validate(REQUEST),
+    }
+    baseline = None
+    for name, validate in strategies.items():
+        seconds = timeit.timeit(validate, number=args.number)
+        us_per_call = 1e6*seconds/args.number
+        baseline = baseline or us_per_call
+        print(f"{name} = {us_per_call:.2f} us/call ({baseline/us_per_call:.1f}x)")
@@ -0,0 +1,67 @@
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable
+
+class Bulkhead:
+    """
+    Isolated group of workers that executes requests for one or more endpoints,
+    so slow endpoints cannot exhaust the workers of the other ones
+
+    Requests are always handled by a thread, which validates arguments and builds the response.
+    If use_processes is True, the registered function itself runs in a process pool. In that case,
+    the function and its argument must be picklable (e.g. module-level functions, not bound methods of the service)
+
+    :param name: bulkhead name, referenced by :meth:`base_service.BaseService.add_api_endpoint`
+    :type name: str
+
+    :param max_workers: maximum number of requests executed at the same time
+    :type max_workers: int
+
+    :param use_processes: if True, registered functions run in separated processes
+    :type use_processes: bool
+    """
+    def __init__(self, name:str, max_workers:int=4, use_processes:bool=False) -> None:
+        self.name = name
+        self.max_workers = max_workers
+        self.use_processes = use_processes
+        self._threads = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"bulkhead-{name}")
+        self._processes = ProcessPoolExecutor(max_workers=max_workers) if use_processes else None
+
+    def submit(self, fn:Callable, *args) -> Future:
+        """
+        Schedules a request handling function in the bulkhead threads
+
+        :param fn: function that handles the request
+        :type fn: Callable
+
+        :return: future with the function result
+        :rtype: concurrent.futures.Future
+        """
+        return self._threads.submit(fn, *args)
+
+    def run_func(self, func:Callable, argument:Any) -> Any:
+        """
+        Executes a registered endpoint function, in a separated process if configured
+
+        :param func: registered endpoint function
+        :type func: Callable
+
+        :param argument: validated JSON received in the request
+        :type argument: Any
+
+        :return: function return
+        :rtype: Any
+        """
+        if self._processes is None:
+            return func(argument)
+        return self._processes.submit(func, argument).result()
+
+    def shutdown(self, wait:bool=True):
+        """
+        Stops accepting requests. Requests not yet started are cancelled (they were not acked, so the broker redelivers them)
+
+        :param wait: if True, blocks until requests in execution finish
+        :type wait: bool
+        """
+        self._threads.shutdown(wait=wait, cancel_futures=True)
+        if self._processes is not None:
+            self._processes.shutdown(wait=wait, cancel_futures=True)
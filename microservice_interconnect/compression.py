@@ -0,0 +1,118 @@
+import gzip
+import threading
+import time as tm
+from typing import Optional, Tuple
+
+# Value of the AMQP content_encoding property (and of the HTTP Content-Encoding header) of compressed bodies
+GZIP_ENCODING = "gzip"
+
+# Bodies smaller than this, in bytes, are not worth the CPU of compressing
+DEFAULT_COMPRESSION_THRESHOLD = 4096
+
+class UnknownContentEncoding(Exception):
+    def __init__(self, content_encoding:str):
+        super().__init__(f"Unsupported content encoding {content_encoding}")
+
+class CompressionStats:
+    """
+    Bytes saved and CPU time spent by compression in this process
+    """
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.compressed_messages = 0
+        self.original_bytes = 0
+        self.compressed_bytes = 0
+        self.compression_seconds = 0.0
+        self.decompressed_messages = 0
+        self.decompression_seconds = 0.0
+
+    def record_compression(self, original_size:int, compressed_size:int, seconds:float):
+        with self._lock:
+            self.compressed_messages += 1
+            self.original_bytes += original_size
+            self.compressed_bytes += compressed_size
+            self.compression_seconds += seconds
+
+    def record_decompression(self, seconds:float):
+        with self._lock:
+            self.decompressed_messages += 1
+            self.decompression_seconds += seconds
+
+    def summary(self) -> dict:
+        """
+        :return: counters, including the bytes saved and the compression ratio of the sent messages
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                "compressed_messages": self.compressed_messages,
+                "bytes_saved": self.original_bytes - self.compressed_bytes,
+                "ratio": self.compressed_bytes/self.original_bytes if self.original_bytes else None,
+                "compression_ms": 1000*self.compression_seconds,
+                "decompressed_messages": self.decompressed_messages,
+                "decompression_ms": 1000*self.decompression_seconds,
+            }
+
+
+_stats = CompressionStats()
+
+def get_compression_stats() -> CompressionStats:
+    """
+    :return: process-wide compression statistics
+    :rtype: CompressionStats
+    """
+    return _stats
+
+def accepts_compression(accept_encoding:str) -> bool:
+    """
+    :param accept_encoding: comma-separated encodings accepted by the receiver, as in the HTTP Accept-Encoding header
+    :type accept_encoding: str
+
+    :return: True if gzip bodies are accepted
+    :rtype: bool
+    """
+    if not accept_encoding:
+        return False
+    return any(encoding.split(";")[0].strip() == GZIP_ENCODING for encoding in accept_encoding.split(","))
+
+def maybe_compress(body:bytes, threshold:int=DEFAULT_COMPRESSION_THRESHOLD) -> Tuple[bytes, Optional[str]]:
+    """
+    :param body: encoded message
+    :type body: bytes
+
+    :param threshold: minimum size, in bytes, to compress. If None, never compresses
+    :type threshold: int
+
+    :return: the body, compressed if at least threshold bytes long and if it got smaller, and its content encoding (None if not compressed)
+    :rtype: Tuple[bytes, str]
+    """
+    if threshold is None or len(body) < threshold:
+        return body, None
+    start = tm.perf_counter()
+    compressed = gzip.compress(body, compresslevel=6, mtime=0)
+    _stats.record_compression(len(body), min(len(compressed), len(body)), tm.perf_counter() - start)
+    if len(compressed) >= len(body):
+        return body, None
+    return compressed, GZIP_ENCODING
+
+def decompress(body:bytes, content_encoding:str) -> bytes:
+    """
+    :param body: received message
+    :type body: bytes
+
+    :param content_encoding: content encoding of the message (None if not compressed)
+    :type content_encoding: str
+
+    :raises UnknownContentEncoding: encoding not supported
+
+    :return: decompressed body
+    :rtype: bytes
+    """
+    if not content_encoding or content_encoding == "identity":
+        return body
+    if content_encoding != GZIP_ENCODING:
+        raise UnknownContentEncoding(content_encoding)
+    start = tm.perf_counter()
+    body = gzip.decompress(body)
+    _stats.record_decompression(tm.perf_counter() - start)
+    return body
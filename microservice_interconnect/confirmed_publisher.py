@@ -0,0 +1,183 @@
+import functools
+import threading
+import time as tm
+from typing import Dict, List
+
+import pika
+import pika.channel
+import pika.exceptions
+import pika.frame
+import pika.spec
+
+class PublishNotConfirmed(Exception):
+    def __init__(self, n_failed:int, n_total:int):
+        super().__init__(f"{n_failed} of {n_total} messages not confirmed by the broker")
+
+class _PendingBatch:
+    def __init__(self, n_messages:int) -> None:
+        self.n_messages = n_messages
+        self.acked = 0
+        self.nacked = 0
+        self.done = threading.Event()
+        if n_messages == 0:
+            self.done.set()
+
+    def resolve(self, ack:bool):
+        if ack:
+            self.acked += 1
+        else:
+            self.nacked += 1
+        if self.acked + self.nacked == self.n_messages:
+            self.done.set()
+
+class ConfirmedPublisher:
+    """
+    Publishes with RabbitMQ publisher confirms. A batch of messages is sent at once (pipelined) and the
+    broker confirms them in bulk, instead of a round trip per message as in a blocking channel in confirm mode
+
+    The connection runs in a background thread, with the ioloop of pika.SelectConnection
+
+    :param host: broker IP or hostname
+    :type host: str
+
+    :param port: broker port
+    :type port: int
+    """
+    def __init__(self, host:str="localhost", port:int=5672) -> None:
+        self.host = host
+        self.port = int(port)
+        self._connection = None
+        self._channel = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._open_error = None
+        # Delivery tag of the last published message, and the batch of each unconfirmed message
+        self._delivery_tag = 0
+        self._pending: Dict[int, _PendingBatch] = {}
+
+    @property
+    def is_open(self) -> bool:
+        return self._channel is not None and self._channel.is_open
+
+    def _start(self, timeout:float):
+        self._ready.clear()
+        self._open_error = None
+        self._connection = pika.SelectConnection(
+            pika.ConnectionParameters(host=self.host, port=self.port),
+            on_open_callback=self._on_open,
+            on_open_error_callback=self._on_open_error,
+            on_close_callback=self._on_connection_closed,
+        )
+        self._thread = threading.Thread(target=self._connection.ioloop.start, name="confirmed-publisher", daemon=True)
+        self._thread.start()
+        if not self._ready.wait(timeout):
+            self.close()
+            raise pika.exceptions.AMQPConnectionError(f"Timeout connecting to {self.host}:{self.port}")
+        if self._open_error is not None:
+            raise pika.exceptions.AMQPConnectionError(f"Could not connect to {self.host}:{self.port}: {self._open_error!r}")
+
+    def _on_open(self, connection:pika.SelectConnection):
+        connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_open_error(self, connection:pika.SelectConnection, error:Exception):
+        self._open_error = error
+        self._ready.set()
+        connection.ioloop.stop()
+
+    def _on_channel_open(self, channel:pika.channel.Channel):
+        self._delivery_tag = 0
+        channel.confirm_delivery(self._on_delivery_confirmation, callback=lambda _: self._on_confirm_mode(channel))
+
+    def _on_confirm_mode(self, channel:pika.channel.Channel):
+        self._channel = channel
+        self._ready.set()
+
+    def _on_connection_closed(self, connection:pika.SelectConnection, reason:Exception):
+        # Messages not confirmed until now may have been lost
+        pending = self._pending
+        self._pending = {}
+        self._channel = None
+        for batch in pending.values():
+            batch.resolve(ack=False)
+        connection.ioloop.stop()
+
+    def _on_delivery_confirmation(self, frame:pika.frame.Method):
+        ack = isinstance(frame.method, pika.spec.Basic.Ack)
+        delivery_tag = frame.method.delivery_tag
+        if frame.method.multiple:
+            confirmed = [tag for tag in self._pending if tag <= delivery_tag]
+        else:
+            confirmed = [delivery_tag]
+        for tag in confirmed:
+            batch = self._pending.pop(tag, None)
+            if batch is not None:
+                batch.resolve(ack)
+
+    def _publish_batch(self, queue_name:str, bodies:List[bytes], properties:pika.BasicProperties, batch:_PendingBatch):
+        # Runs in the connection thread
+        if not self.is_open:
+            for _ in bodies:
+                batch.resolve(ack=False)
+            return
+        # Channel operations are ordered, so the queue exists before the messages arrive
+        self._channel.queue_declare(queue=queue_name)
+        for body in bodies:
+            self._delivery_tag += 1
+            self._pending[self._delivery_tag] = batch
+            self._channel.basic_publish(exchange="", routing_key=queue_name, body=body, properties=properties)
+
+    def publish_many(self, queue_name:str, bodies:List[bytes], properties:pika.BasicProperties=None, timeout:float=None):
+        """
+        Publishes every message and blocks until the broker confirms all of them
+
+        :param queue_name: destination queue
+        :type queue_name: str
+
+        :param bodies: encoded messages
+        :type bodies: List[bytes]
+
+        :param properties: properties of every message
+        :type properties: pika.BasicProperties
+
+        :param timeout: maximum time to wait for the confirms (and the connection), in seconds. If None, waits forever
+        :type timeout: float
+
+        :raises pika.exceptions.AMQPConnectionError: broker inaccessible
+
+        :raises PublishNotConfirmed: broker rejected some messages, connection was lost or timeout expired
+        """
+        deadline = None if timeout is None else tm.monotonic() + timeout
+        if not self.is_open:
+            self.close()
+            self._start(timeout)
+        batch = _PendingBatch(len(bodies))
+        self._connection.ioloop.add_callback_threadsafe(
+            functools.partial(self._publish_batch, queue_name, bodies, properties, batch))
+        remaining = None if deadline is None else max(deadline - tm.monotonic(), 0)
+        if not batch.done.wait(remaining):
+            raise PublishNotConfirmed(batch.n_messages - batch.acked, batch.n_messages)
+        if batch.nacked > 0:
+            raise PublishNotConfirmed(batch.nacked, batch.n_messages)
+
+    def close(self):
+        """
+        Closes the connection and stops the background thread
+        """
+        if self._thread is None:
+            return
+        connection = self._connection
+        def close_connection():
+            if connection.is_open:
+                connection.close()
+            elif not connection.is_closing:
+                # Closed or still connecting: on_close_callback will not stop the ioloop
+                connection.ioloop.stop()
+        try:
+            connection.ioloop.add_callback_threadsafe(close_connection)
+        except Exception:
+            # ioloop alredy closed
+            pass
+        if threading.current_thread() is not self._thread:
+            self._thread.join()
+        self._thread = None
+        self._channel = None
@@ -0,0 +1,270 @@
+import collections
+import os
+import threading
+import time as tm
+from typing import Dict, List, Optional, Tuple
+
+import pika
+import pika.exceptions
+import pika.spec
+
+from microservice_interconnect.direct_transport import DirectConnection, is_direct_address
+from microservice_interconnect.loopback import LoopbackConnection, is_loopback_host
+
+class PooledConnection:
+    """
+    Long-lived AMQP connection with a single channel and a persistent exclusive reply queue
+    Responses arriving at the reply queue are matched by correlation ID, so the same
+    queue can be reused by every call made through this connection
+
+    :param host: IP or hostname of destination broker
+    :type host: str
+
+    :param port: broker port
+    :type port: int
+
+    :param heartbeat: AMQP heartbeat interval, in seconds
+    :type heartbeat: int
+
+    :raises pika.exceptions.AMQPConnectionError: broker inaccessible
+    """
+    def __init__(self, host:str="localhost", port:int=5672, heartbeat:int=600) -> None:
+        self.host = host
+        self.port = int(port)
+        self.connection_params = pika.ConnectionParameters(host=host, heartbeat=heartbeat, port=self.port)
+        self.connection = None
+        self.channel = None
+        self.reply_queue_name = None
+        self._declared_queues = set()
+        self._responses = {}
+        self._connect()
+
+    def _connect(self):
+        self.connection = pika.BlockingConnection(self.connection_params)
+        self.channel = self.connection.channel()
+        self._declared_queues = set()
+        self._responses = {}
+
+        # One reply queue for the whole lifetime of the channel
+        callback_queue = self.channel.queue_declare(queue="", exclusive=True)
+        self.reply_queue_name = callback_queue.method.queue
+        self.channel.basic_consume(
+            queue=self.reply_queue_name,
+            on_message_callback=self._on_response,
+            auto_ack=True,
+        )
+
+    def _on_response(self, ch, method, props, body) -> None:
+        # Streamed responses have many messages with the same correlation ID
+        self._responses.setdefault(props.correlation_id, collections.deque()).append((props, body))
+
+    @property
+    def is_open(self) -> bool:
+        return (self.connection is not None and self.connection.is_open
+                and self.channel is not None and self.channel.is_open)
+
+    def reconnect(self):
+        """
+        Drops the current connection (if any) and opens a new one, with a new reply queue
+
+        :raises pika.exceptions.AMQPConnectionError: broker inaccessible
+        """
+        self.close()
+        self._connect()
+
+    def declare_queue(self, queue_name:str):
+        """
+        Declares a destination queue only once for this channel
+
+        :param queue_name: queue name
+        :type queue_name: str
+        """
+        if queue_name in self._declared_queues:
+            return
+        self.channel.queue_declare(queue=queue_name, exclusive=False)
+        self._declared_queues.add(queue_name)
+
+    def wait_response(self, corr_id:str, timeout:float=None) -> Optional[Tuple[pika.spec.BasicProperties, bytes]]:
+        """
+        Blocks on the socket until the response with the given correlation ID arrives at the reply queue
+        Responses with other correlation IDs (stale replies) are discarded. For streamed responses, returns
+        the next message of the stream
+
+        :param corr_id: correlation ID of the published call
+        :type corr_id: str
+
+        :param timeout: maximum time to wait, in seconds. If None, waits forever
+        :type timeout: float
+
+        :return: response properties and raw body, or None if the timeout expired
+        :rtype: Tuple[pika.spec.BasicProperties, bytes]
+        """
+        deadline = None if timeout is None else tm.monotonic() + timeout
+        while not self._responses.get(corr_id):
+            if deadline is None:
+                # Blocks until there is I/O to process, without spinning
+                self.connection.process_data_events(time_limit=None)
+                continue
+            remaining = deadline - tm.monotonic()
+            if remaining <= 0:
+                return None
+            self.connection.process_data_events(time_limit=remaining)
+        pending = self._responses[corr_id]
+        response = pending.popleft()
+        self._responses = {corr_id: pending} if pending else {}
+        return response
+
+    def wait_responses(self, corr_ids:List[str], timeout:float=None) -> Dict[str, Tuple[pika.spec.BasicProperties, bytes]]:
+        """
+        Blocks on the socket until the responses with all the given correlation IDs arrive at the reply queue,
+        or until the timeout expires. Responses with other correlation IDs (stale replies) are discarded
+
+        :param corr_ids: correlation IDs of the published calls
+        :type corr_ids: List[str]
+
+        :param timeout: maximum time to wait, in seconds. If None, waits forever
+        :type timeout: float
+
+        :return: response properties and raw body of each correlation ID that received a response
+        :rtype: Dict[str, Tuple[pika.spec.BasicProperties, bytes]]
+        """
+        deadline = None if timeout is None else tm.monotonic() + timeout
+        waiting = set(corr_ids)
+        received = {}
+        while True:
+            for corr_id in [corr_id for corr_id in waiting if self._responses.get(corr_id)]:
+                received[corr_id] = self._responses[corr_id].popleft()
+                waiting.discard(corr_id)
+            if not waiting:
+                break
+            if deadline is None:
+                self.connection.process_data_events(time_limit=None)
+                continue
+            remaining = deadline - tm.monotonic()
+            if remaining <= 0:
+                break
+            self.connection.process_data_events(time_limit=remaining)
+        self._responses = {}
+        return received
+
+    def close(self):
+        """
+        Closes the AMQP connection, ignoring errors if it is alredy closed
+        """
+        try:
+            if self.connection is not None and self.connection.is_open:
+                self.connection.close()
+        except pika.exceptions.AMQPError:
+            pass
+        self.connection = None
+        self.channel = None
+
+
+def open_connection(host:str="localhost", port:int=5672):
+    """
+    :param host: IP or hostname of destination broker, :data:`loopback.LOOPBACK_HOST` for the in-process transport, or a direct transport address (see :mod:`direct_transport`)
+    :type host: str
+
+    :param port: broker port
+    :type port: int
+
+    :raises pika.exceptions.AMQPConnectionError: broker inaccessible
+
+    :return: new connection, :class:`PooledConnection`, :class:`loopback.LoopbackConnection` or :class:`direct_transport.DirectConnection`
+    :rtype: PooledConnection
+    """
+    if is_loopback_host(host):
+        return LoopbackConnection(host, port)
+    if is_direct_address(host):
+        return DirectConnection(host)
+    return PooledConnection(host, port)
+
+
+class ConnectionPool:
+    """
+    Process-wide pool of :class:`PooledConnection`, indexed by broker address
+    A connection is leased by one caller at a time, since pika blocking connections are not thread-safe.
+    Idle connections are kept open for the next caller instead of being closed
+
+    :param max_idle_per_broker: maximum number of idle connections kept for each broker
+    :type max_idle_per_broker: int
+    """
+    def __init__(self, max_idle_per_broker:int=8) -> None:
+        self.max_idle_per_broker = max_idle_per_broker
+        self._idle: Dict[Tuple[str,int], List[PooledConnection]] = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _check_fork(self):
+        # Connections inherited from a parent process cannot be shared with it
+        if self._pid != os.getpid():
+            self._idle = {}
+            self._lock = threading.Lock()
+            self._pid = os.getpid()
+
+    def acquire(self, host:str="localhost", port:int=5672) -> PooledConnection:
+        """
+        Leases an open connection to the broker, creating a new one if there is no idle connection
+
+        :param host: IP or hostname of destination broker
+        :type host: str
+
+        :param port: broker port
+        :type port: int
+
+        :raises pika.exceptions.AMQPConnectionError: broker inaccessible
+
+        :return: leased connection. Must be given back with :meth:`release`
+        :rtype: PooledConnection
+        """
+        self._check_fork()
+        key = (host, int(port))
+        while True:
+            with self._lock:
+                idle_list = self._idle.get(key)
+                pooled = idle_list.pop() if idle_list else None
+            if pooled is None:
+                return open_connection(host, port)
+            if pooled.is_open:
+                return pooled
+            pooled.close()
+
+    def release(self, pooled:PooledConnection):
+        """
+        Gives back a leased connection. Broken connections or connections above the idle limit are closed
+
+        :param pooled: connection previously returned by :meth:`acquire`
+        :type pooled: PooledConnection
+        """
+        self._check_fork()
+        if not pooled.is_open:
+            pooled.close()
+            return
+        key = (pooled.host, pooled.port)
+        with self._lock:
+            idle_list = self._idle.setdefault(key, [])
+            if len(idle_list) < self.max_idle_per_broker:
+                idle_list.append(pooled)
+                return
+        pooled.close()
+
+    def close_all(self):
+        """
+        Closes every idle connection in the pool
+        """
+        with self._lock:
+            idle = self._idle
+            self._idle = {}
+        for idle_list in idle.values():
+            for pooled in idle_list:
+                pooled.close()
+
+
+_pool = ConnectionPool()
+
+def get_connection_pool() -> ConnectionPool:
+    """
+    :return: process-wide connection pool used by :class:`rpc_client.RpcClient`
+    :rtype: ConnectionPool
+    """
+    return _pool
@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time as tm
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Tuple
+
+def content_idempotency_key(request:Any) -> str:
+    """
+    Idempotency key derived from the request content, for callers that resend a request without keeping
+    a key, e.g. HTTP clients. Equal requests share the key, so it should only be used for operations where
+    sending an equal request again means retrying it (e.g. creating a task with the same ID and settings)
+
+    :param request: JSON request
+    :type request: Any
+
+    :return: SHA-256 of the canonical JSON of the request
+    :rtype: str
+    """
+    return hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
+
+def is_successful(response:Any) -> bool:
+    """
+    :param response: response of a request
+    :type response: Any
+
+    :return: False for responses with a status code outside 2xx, e.g. 500 of a transient failure or 503 of an overloaded service
+    :rtype: bool
+    """
+    status_code = response.get("status_code", 200) if isinstance(response, dict) else 200
+    return 200 <= status_code < 300
+
+class DedupStore:
+    """
+    Remembers the responses of requests with an idempotency key, so a redelivered request
+    (e.g. the service stopped before acking it) is answered with the same response instead of executing again.
+    A duplicate received while the original request is still executing waits for its response
+
+    Only successful responses (see :func:`is_successful`) are stored: a request that failed is executed again
+    when retried with the same key, instead of being answered with the failure until the TTL expires
+
+    Responses are kept in memory, in LRU order. If path is informed, they are also written to a SQLite
+    database before the request is acked, so they survive a crash of the service and are shared by the
+    replicas in the same host
+
+    :param ttl: time, in seconds, that a response is kept. Should be longer than redeliveries take
+    :type ttl: float
+
+    :param max_size: maximum number of responses kept
+    :type max_size: int
+
+    :param path: SQLite database file. If None, responses are kept only in memory
+    :type path: str
+    """
+    def __init__(self, ttl:float=600, max_size:int=10000, path:str=None) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        self.path = path
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._running: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._db = None
+        if path is not None:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, expires REAL, response TEXT)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_expires ON responses (expires)")
+            self._db.commit()
+        self.replayed = 0
+
+    def _lookup(self, key:str, now:float) -> Tuple[bool, Any]:
+        # Called with the lock held
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                self._entries.move_to_end(key)
+                return True, entry[1]
+            del self._entries[key]
+        if self._db is not None:
+            row = self._db.execute("SELECT expires, response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[0] > now:
+                return True, json.loads(row[1])
+        return False, None
+
+    def _store(self, key:str, response:Any, now:float):
+        # Called with the lock held
+        self._entries[key] = (now + self.ttl, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        if self._db is None:
+            return
+        try:
+            serialized = json.dumps(response)
+        except (TypeError, ValueError):
+            # Kept only in memory
+            return
+        self._db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?)", (key, now + self.ttl, serialized))
+        self._db.execute("DELETE FROM responses WHERE expires <= ?", (now,))
+        self._db.execute(
+            "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY expires DESC LIMIT -1 OFFSET ?)",
+            (self.max_size,))
+        self._db.commit()
+
+    def execute_once(self, key:str, func:Callable[[], Any]) -> Any:
+        """
+        :param key: idempotency key, unique for each request (and its redeliveries)
+        :type key: str
+
+        :param func: executes the request and returns the response
+        :type func: Callable[[], Any]
+
+        :return: response of the first successful execution with the key
+        :rtype: Any
+        """
+        with self._lock:
+            found, response = self._lookup(key, tm.time())
+            if found:
+                self.replayed += 1
+                return response
+            running = self._running.get(key)
+            if running is None:
+                running = self._running[key] = Future()
+                is_first = True
+            else:
+                self.replayed += 1
+                is_first = False
+
+        if not is_first:
+            return running.result()
+
+        try:
+            response = func()
+        except BaseException as e:
+            with self._lock:
+                del self._running[key]
+            running.set_exception(e)
+            raise
+        with self._lock:
+            if is_successful(response):
+                self._store(key, response, tm.time())
+            del self._running[key]
+        running.set_result(response)
+        return response
+
+    def stats(self) -> dict:
+        """
+        :return: number of duplicates answered with a stored response, and number of responses in memory
+        :rtype: dict
+        """
+        with self._lock:
+            return {"replayed": self.replayed, "size": len(self._entries)}
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,350 @@
+import collections
+import json
+import os
+import socket
+import struct
+import threading
+import time as tm
+import uuid
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import pika
+import pika.exceptions
+import pika.spec
+
+# Prefixes of direct transport addresses, e.g. "unix:/tmp/cloud_ml.sock" or "tcp:127.0.0.1:9101"
+UNIX_PREFIX = "unix:"
+TCP_PREFIX = "tcp:"
+
+# Each frame is the size of the properties and of the body, followed by the properties (JSON) and the body
+_FRAME_HEADER = struct.Struct(">II")
+
+def is_direct_address(host:str) -> bool:
+    """
+    :param host: broker host or direct transport address
+    :type host: str
+
+    :return: True if host is a direct transport address
+    :rtype: bool
+    """
+    return isinstance(host, str) and (host.startswith(UNIX_PREFIX) or host.startswith(TCP_PREFIX))
+
+def _parse_address(address:str) -> Tuple[int, Any]:
+    if address.startswith(UNIX_PREFIX):
+        return socket.AF_UNIX, address[len(UNIX_PREFIX):]
+    host, port = address[len(TCP_PREFIX):].rsplit(":", 1)
+    return socket.AF_INET, (host, int(port))
+
+def _send_frame(sock:socket.socket, lock:threading.Lock, meta:dict, body:bytes):
+    meta_bytes = json.dumps(meta).encode()
+    with lock:
+        sock.sendall(_FRAME_HEADER.pack(len(meta_bytes), len(body)) + meta_bytes + body)
+
+def _recv_exact(sock:socket.socket, size:int) -> Optional[bytes]:
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:])
+        if n == 0:
+            return None
+        received += n
+    return bytes(buffer)
+
+def _recv_frame(sock:socket.socket) -> Optional[Tuple[dict, bytes]]:
+    header = _recv_exact(sock, _FRAME_HEADER.size)
+    if header is None:
+        return None
+    meta_size, body_size = _FRAME_HEADER.unpack(header)
+    meta = _recv_exact(sock, meta_size)
+    body = _recv_exact(sock, body_size) if body_size else b""
+    if meta is None or body is None:
+        return None
+    return json.loads(meta), body
+
+def _properties_to_meta(routing_key:str, properties:pika.spec.BasicProperties) -> dict:
+    return {
+        "routing_key": routing_key,
+        "type": properties.type,
+        "correlation_id": properties.correlation_id,
+        "reply_to": properties.reply_to,
+        "content_type": properties.content_type,
+        "content_encoding": properties.content_encoding,
+        "headers": properties.headers,
+    }
+
+def _meta_to_properties(meta:dict) -> pika.spec.BasicProperties:
+    return pika.BasicProperties(
+        type=meta.get("type"),
+        correlation_id=meta.get("correlation_id"),
+        reply_to=meta.get("reply_to"),
+        content_type=meta.get("content_type"),
+        content_encoding=meta.get("content_encoding"),
+        headers=meta.get("headers"),
+    )
+
+
+class DirectTransportClosed(pika.exceptions.AMQPConnectionError):
+    """
+    The service closed the connection, e.g. while draining, before all the awaited responses arrived
+
+    :param address: service address
+    :type address: str
+
+    :param received: responses received before the connection closed, by correlation ID
+    :type received: Dict[str, Tuple[pika.spec.BasicProperties, bytes]]
+    """
+    def __init__(self, address:str, received:Dict[str, Tuple[pika.spec.BasicProperties, bytes]]=None):
+        super().__init__(f"Direct transport {address} closed")
+        self.received = received or {}
+
+
+class DirectChannel:
+    """
+    Service side of a direct transport connection, with the interface of pika.channel.Channel used
+    by :class:`base_service.BaseService` to reply. Replies are written back to the socket of the request
+
+    :param sock: connected socket
+    :type sock: socket.socket
+    """
+    def __init__(self, sock:socket.socket) -> None:
+        self.sock = sock
+        self._lock = threading.Lock()
+        self.is_open = True
+
+    def basic_publish(self, exchange:str, routing_key:str, body:bytes, properties:pika.spec.BasicProperties=None, **kwargs):
+        if not self.is_open:
+            return
+        try:
+            _send_frame(self.sock, self._lock, _properties_to_meta(routing_key, properties or pika.BasicProperties()), body)
+        except OSError as e:
+            # Client gone: the response is lost, as with a closed reply queue
+            print(f"Could not reply through direct transport: {e}")
+            self.close()
+
+    def basic_ack(self, delivery_tag:int=0, **kwargs):
+        pass
+
+    def close(self):
+        self.is_open = False
+        try:
+            # Wakes up the thread reading the socket, and tells the client the connection is closed
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class DirectServer:
+    """
+    Service side of the direct transport: accepts connections at a Unix socket or TCP address, and hands
+    each request, with the :class:`DirectChannel` to reply, to on_message. Each connection has its own thread
+
+    TCP addresses are bound with SO_REUSEPORT, where available, so replicas can share them
+
+    :param address: address to listen at, e.g. "unix:/tmp/cloud_ml.sock" or "tcp:127.0.0.1:9101"
+    :type address: str
+
+    :param on_message: receives the channel, the destination queue, the properties and the body of each request
+    :type on_message: Callable[[DirectChannel, str, pika.spec.BasicProperties, bytes], None]
+    """
+    def __init__(self, address:str, on_message:Callable[[DirectChannel, str, pika.spec.BasicProperties, bytes], None]) -> None:
+        self.address = address
+        self.on_message = on_message
+        self._listener = None
+        self._channels = set()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        :raises OSError: address cannot be bound
+        """
+        family, sockaddr = _parse_address(self.address)
+        listener = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_UNIX:
+            if os.path.exists(sockaddr):
+                # Left behind by a service that crashed
+                os.unlink(sockaddr)
+        else:
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if hasattr(socket, "SO_REUSEPORT"):
+                listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        listener.bind(sockaddr)
+        listener.listen(128)
+        self._listener = listener
+        threading.Thread(target=self._accept_loop, args=(listener,), name="direct-accept", daemon=True).start()
+
+    def _accept_loop(self, listener:socket.socket):
+        while True:
+            try:
+                sock, _ = listener.accept()
+            except OSError:
+                # Listener closed
+                return
+            if sock.family == socket.AF_INET:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            channel = DirectChannel(sock)
+            with self._lock:
+                self._channels.add(channel)
+            threading.Thread(target=self._serve, args=(channel,), name="direct-connection", daemon=True).start()
+
+    def _serve(self, channel:DirectChannel):
+        try:
+            while channel.is_open:
+                frame = _recv_frame(channel.sock)
+                if frame is None:
+                    break
+                meta, body = frame
+                self.on_message(channel, meta.get("routing_key"), _meta_to_properties(meta), body)
+        except OSError:
+            pass
+        finally:
+            channel.close()
+            with self._lock:
+                self._channels.discard(channel)
+
+    def stop_listening(self):
+        """
+        Stops accepting connections. Open connections are kept, so their requests in execution can be answered
+        """
+        if self._listener is None:
+            return
+        self._listener.close()
+        self._listener = None
+        family, sockaddr = _parse_address(self.address)
+        if family == socket.AF_UNIX and os.path.exists(sockaddr):
+            os.unlink(sockaddr)
+
+    def close(self):
+        """
+        Stops accepting connections and closes the open ones
+        """
+        self.stop_listening()
+        with self._lock:
+            channels = list(self._channels)
+        for channel in channels:
+            channel.close()
+
+
+class DirectConnection:
+    """
+    Client side of the direct transport, with the interface of :class:`connection_pool.PooledConnection`.
+    Requests are sent straight to the service socket, and replies are matched by correlation ID
+
+    :param address: service address, e.g. "unix:/tmp/cloud_ml.sock" or "tcp:127.0.0.1:9101"
+    :type address: str
+
+    :raises pika.exceptions.AMQPConnectionError: service not listening at the address
+    """
+    def __init__(self, address:str) -> None:
+        self.host = address
+        self.port = 0
+        self.reply_queue_name = f"direct.reply.{uuid.uuid4()}"
+        # The connection also plays the role of channel and of pika connection
+        self.channel = self
+        self.connection = self
+        self.sock = None
+        self.is_open = False
+        self._send_lock = threading.Lock()
+        self._condition = threading.Condition()
+        self._responses: Dict[str, Deque[Tuple[pika.spec.BasicProperties, bytes]]] = {}
+        self._connect()
+
+    def _connect(self):
+        family, sockaddr = _parse_address(self.host)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            sock.connect(sockaddr)
+        except OSError as e:
+            sock.close()
+            raise pika.exceptions.AMQPConnectionError(f"Direct transport {self.host}: {e}")
+        if family == socket.AF_INET:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock = sock
+        self._responses = {}
+        self.is_open = True
+        threading.Thread(target=self._read_loop, args=(sock,), name="direct-replies", daemon=True).start()
+
+    def _read_loop(self, sock:socket.socket):
+        try:
+            while True:
+                frame = _recv_frame(sock)
+                if frame is None:
+                    break
+                meta, body = frame
+                with self._condition:
+                    self._responses.setdefault(meta.get("correlation_id"), collections.deque()).append(
+                        (_meta_to_properties(meta), body))
+                    self._condition.notify_all()
+        except OSError:
+            pass
+        with self._condition:
+            if sock is self.sock:
+                self.is_open = False
+            self._condition.notify_all()
+
+    def declare_queue(self, queue_name:str):
+        pass
+
+    def basic_publish(self, exchange:str, routing_key:str, body:bytes, properties:pika.spec.BasicProperties=None):
+        if not self.is_open:
+            raise pika.exceptions.AMQPConnectionError(f"Direct transport {self.host} closed")
+        try:
+            _send_frame(self.sock, self._send_lock, _properties_to_meta(routing_key, properties or pika.BasicProperties()), body)
+        except OSError as e:
+            self.close()
+            raise pika.exceptions.AMQPConnectionError(f"Direct transport {self.host}: {e}")
+
+    def process_data_events(self, time_limit:float=0):
+        pass
+
+    def wait_response(self, corr_id:str, timeout:float=None) -> Optional[Tuple[pika.spec.BasicProperties, bytes]]:
+        """
+        See :meth:`connection_pool.PooledConnection.wait_response`
+
+        :raises DirectTransportClosed: connection closed by the service before the response
+        """
+        received = self.wait_responses([corr_id], timeout)
+        return received.get(corr_id)
+
+    def wait_responses(self, corr_ids:List[str], timeout:float=None) -> Dict[str, Tuple[pika.spec.BasicProperties, bytes]]:
+        """
+        See :meth:`connection_pool.PooledConnection.wait_responses`
+
+        :raises DirectTransportClosed: connection closed by the service before all the responses. The ones received are kept in the exception
+        """
+        deadline = None if timeout is None else tm.monotonic() + timeout
+        waiting = set(corr_ids)
+        received = {}
+        with self._condition:
+            while True:
+                for corr_id in [corr_id for corr_id in waiting if self._responses.get(corr_id)]:
+                    received[corr_id] = self._responses[corr_id].popleft()
+                    waiting.discard(corr_id)
+                remaining = None if deadline is None else deadline - tm.monotonic()
+                if not waiting or (remaining is not None and remaining <= 0):
+                    break
+                if not self.is_open:
+                    raise DirectTransportClosed(self.host, received)
+                self._condition.wait(remaining)
+            # Streamed responses keep their next chunks
+            self._responses = {corr_id: pending for corr_id, pending in self._responses.items() if corr_id in corr_ids and pending}
+        return received
+
+    def reconnect(self):
+        self.close()
+        self._connect()
+
+    def close(self):
+        with self._condition:
+            self.is_open = False
+            self._condition.notify_all()
+        if self.sock is not None:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.sock.close()
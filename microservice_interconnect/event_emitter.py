@@ -0,0 +1,265 @@
+import atexit
+import os
+import queue
+import threading
+import time as tm
+from typing import Dict, List, Tuple
+
+import pika
+import pika.exceptions
+
+from microservice_interconnect.connection_pool import open_connection
+from microservice_interconnect.wire_codecs import JSON_CONTENT_TYPE, get_codec
+
+class _FlushRequest:
+    def __init__(self, stop:bool=False) -> None:
+        self.stop = stop
+        self.done = threading.Event()
+
+class EventEmitter:
+    """
+    Publishes events in a background thread, so registering an event only costs a queue insertion.
+    Events are accumulated in a bounded in-memory queue and published through a single persistent
+    connection, in batches of up to batch_size events or every flush_interval seconds.
+    Each event is still a separate message, as expected by the event readers
+
+    When the queue is full, new events are dropped and counted, instead of blocking the caller
+
+    :param host: broker IP or hostname
+    :type host: str
+
+    :param port: broker port
+    :type port: int
+
+    :param queue_name: destination queue
+    :type queue_name: str
+
+    :param max_queue_size: maximum number of events waiting to be published
+    :type max_queue_size: int
+
+    :param batch_size: number of events that triggers a flush
+    :type batch_size: int
+
+    :param flush_interval: maximum time, in seconds, that an event waits in the queue
+    :type flush_interval: float
+    """
+    def __init__(
+            self,
+            host:str="localhost",
+            port:int=5672,
+            queue_name:str="events",
+            max_queue_size:int=10000,
+            batch_size:int=100,
+            flush_interval:float=0.5) -> None:
+        self.host = host
+        self.port = port
+        self.queue_name = queue_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._codec = get_codec(JSON_CONTENT_TYPE)
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._connection = None
+        self._closed = False
+        self.published = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def emit(self, event:dict) -> bool:
+        """
+        Queues an event for publishing, without blocking
+
+        :param event: JSON event
+        :type event: dict
+
+        :return: False if the event was dropped because the queue is full or the emitter is closed
+        :rtype: bool
+        """
+        if self._thread is None:
+            self._start()
+        try:
+            if self._closed:
+                raise queue.Full()
+            self._queue.put_nowait(event)
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+
+    def flush(self, timeout:float=None) -> bool:
+        """
+        Blocks until every event emitted before this call is published
+
+        :param timeout: maximum time to wait, in seconds. If None, waits forever
+        :type timeout: float
+
+        :return: False if the timeout expired
+        :rtype: bool
+        """
+        if self._thread is None or self._closed:
+            return True
+        return self._request_flush(_FlushRequest(), timeout)
+
+    def close(self, timeout:float=None) -> bool:
+        """
+        Publishes the pending events, stops the background thread and closes the connection.
+        Events emitted after closing are dropped
+
+        :param timeout: maximum time to wait for the pending events, in seconds. If None, waits forever
+        :type timeout: float
+
+        :return: False if the timeout expired before every pending event was published
+        :rtype: bool
+        """
+        if self._thread is None or self._closed:
+            self._closed = True
+            return True
+        self._closed = True
+        return self._request_flush(_FlushRequest(stop=True), timeout)
+
+    def stats(self) -> dict:
+        """
+        :return: number of events published, waiting in the queue, dropped due to a full queue and lost due to broker errors
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                "published": self.published,
+                "queued": self._queue.qsize(),
+                "dropped": self.dropped,
+                "failed": self.failed,
+            }
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"event-emitter-{self.queue_name}", daemon=True)
+                self._thread.start()
+
+    def _request_flush(self, request:_FlushRequest, timeout:float) -> bool:
+        deadline = None if timeout is None else tm.monotonic() + timeout
+        try:
+            # Unlike events, flush requests wait for space in the queue
+            self._queue.put(request, timeout=timeout)
+        except queue.Full:
+            return False
+        remaining = None if deadline is None else max(deadline - tm.monotonic(), 0)
+        return request.done.wait(remaining)
+
+    def _run(self):
+        batch: List[dict] = []
+        batch_deadline = None
+        while True:
+            if batch_deadline is None:
+                timeout = self.flush_interval
+            else:
+                timeout = max(batch_deadline - tm.monotonic(), 0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if isinstance(item, _FlushRequest):
+                self._publish_batch(batch)
+                batch, batch_deadline = [], None
+                if item.stop:
+                    self._close_connection()
+                item.done.set()
+                if item.stop:
+                    return
+                continue
+
+            if item is not None:
+                batch.append(item)
+                if batch_deadline is None:
+                    batch_deadline = tm.monotonic() + self.flush_interval
+            if batch and (len(batch) >= self.batch_size or tm.monotonic() >= batch_deadline):
+                self._publish_batch(batch)
+                batch, batch_deadline = [], None
+            elif not batch:
+                self._keep_alive()
+
+    def _publish_batch(self, batch:List[dict]):
+        published = 0
+        # A second attempt, in a new connection, if the current one was lost
+        for attempt in range(2):
+            try:
+                if self._connection is None:
+                    self._connection = open_connection(self.host, self.port)
+                self._connection.declare_queue(self.queue_name)
+                properties = pika.BasicProperties(content_type=self._codec.content_type)
+                while published < len(batch):
+                    self._connection.channel.basic_publish(
+                        exchange="",
+                        routing_key=self.queue_name,
+                        properties=properties,
+                        body=self._codec.encode(batch[published]),
+                    )
+                    published += 1
+                break
+            except pika.exceptions.AMQPError as e:
+                print(f"ERROR: could not publish events: {e}")
+                self._close_connection()
+        with self._lock:
+            self.published += published
+            self.failed += len(batch) - published
+
+    def _keep_alive(self):
+        # Idle blocking connections only answer broker heartbeats when processing events
+        if self._connection is None:
+            return
+        try:
+            self._connection.connection.process_data_events(time_limit=0)
+        except pika.exceptions.AMQPError:
+            self._close_connection()
+
+    def _close_connection(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+_emitters: Dict[Tuple[str,int], EventEmitter] = {}
+_emitters_lock = threading.Lock()
+_emitters_pid = os.getpid()
+
+def get_event_emitter(host:str="localhost", port:int=5672) -> EventEmitter:
+    """
+    :param host: broker IP or hostname
+    :type host: str
+
+    :param port: broker port
+    :type port: int
+
+    :return: process-wide emitter of the "events" queue of the broker
+    :rtype: EventEmitter
+    """
+    global _emitters, _emitters_lock, _emitters_pid
+    if _emitters_pid != os.getpid():
+        # The background threads were not copied by the fork
+        _emitters = {}
+        _emitters_lock = threading.Lock()
+        _emitters_pid = os.getpid()
+    key = (host, int(port))
+    emitter = _emitters.get(key)
+    if emitter is None:
+        with _emitters_lock:
+            emitter = _emitters.setdefault(key, EventEmitter(host, int(port)))
+    return emitter
+
+def flush_event_emitters(timeout:float=5):
+    """
+    Publishes the pending events of every emitter of the process. Called at exit
+
+    :param timeout: maximum time to wait for each emitter, in seconds
+    :type timeout: float
+    """
+    if _emitters_pid != os.getpid():
+        return
+    for emitter in list(_emitters.values()):
+        if not emitter.flush(timeout):
+            print(f"WARNING: events to {emitter.host}:{emitter.port} not published before exiting")
+
+atexit.register(flush_event_emitters)
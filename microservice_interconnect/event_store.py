@@ -0,0 +1,153 @@
+import json
+import os
+import threading
+import time as tm
+from typing import Iterator, List
+
+# Segments are named events-<creation time in ms>-<sequence>.jsonl, so sorting the names sorts them by creation
+SEGMENT_PREFIX = "events-"
+SEGMENT_SUFFIX = ".jsonl"
+
+class EventStore:
+    """
+    Append-only event log, written as JSON Lines segments in a directory. A new segment is started when the
+    current one reaches max_segment_bytes or is max_segment_age seconds old, so files stay small and old ones
+    can be archived or removed. Each event is a line, so a crash loses at most a partially written last line,
+    which readers skip
+
+    :param directory: directory of the segments
+    :type directory: str
+
+    :param max_segment_bytes: size, in bytes, after which a new segment is started
+    :type max_segment_bytes: int
+
+    :param max_segment_age: time, in seconds, after which a new segment is started
+    :type max_segment_age: float
+    """
+    def __init__(self, directory:str, max_segment_bytes:int=64*1024*1024, max_segment_age:float=3600) -> None:
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segment_age = max_segment_age
+        # Segments written by this store, in order
+        self.segments: List[str] = []
+        self.appended = 0
+        self._file = None
+        self._segment_started = 0.0
+        self._segment_size = 0
+        self._sequence = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _open_segment(self):
+        # Called with the lock held
+        self._close_segment()
+        self._sequence += 1
+        path = os.path.join(self.directory, f"{SEGMENT_PREFIX}{int(tm.time()*1000):013d}-{self._sequence:06d}{SEGMENT_SUFFIX}")
+        self._file = open(path, "ab")
+        self._segment_started = tm.monotonic()
+        self._segment_size = 0
+        self.segments.append(path)
+
+    def _close_segment(self):
+        # Called with the lock held
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def append_many(self, events:List[bytes]):
+        """
+        Writes many events with a single write. They reach the disk on :meth:`flush`
+
+        :param events: JSON-encoded events
+        :type events: List[bytes]
+        """
+        if not events:
+            return
+        data = b"".join(_as_line(event) for event in events)
+        with self._lock:
+            if (self._file is None or self._segment_size >= self.max_segment_bytes
+                    or tm.monotonic() - self._segment_started >= self.max_segment_age):
+                self._open_segment()
+            self._file.write(data)
+            self._segment_size += len(data)
+            self.appended += len(events)
+
+    def flush(self, sync:bool=False):
+        """
+        :param sync: if True, also waits for the operating system to write the segment to the disk (fsync)
+        :type sync: bool
+        """
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.flush()
+            if sync:
+                os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+            self._close_segment()
+
+
+def _as_line(event:bytes) -> bytes:
+    event = event.strip()
+    if b"\n" in event:
+        # Pretty-printed JSON: one line per event
+        event = json.dumps(json.loads(event)).encode()
+    return event + b"\n"
+
+def list_segments(directory:str) -> List[str]:
+    """
+    :param directory: directory of an :class:`EventStore`
+    :type directory: str
+
+    :return: paths of the segments, from the oldest to the newest
+    :rtype: List[str]
+    """
+    if not os.path.isdir(directory):
+        return []
+    return [
+        os.path.join(directory, name) for name in sorted(os.listdir(directory))
+        if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)
+    ]
+
+def read_events(segments:List[str]) -> Iterator[dict]:
+    """
+    :param segments: segment paths (see :func:`list_segments`)
+    :type segments: List[str]
+
+    :return: events, in the order they were written. Truncated lines, left by a crash, are skipped
+    :rtype: Iterator[dict]
+    """
+    for path in segments:
+        with open(path, "rb") as segment:
+            for line in segment:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    print(f"Skipped malformed event in {path}")
+
+def export_json_array(segments:List[str], filename:str) -> int:
+    """
+    Writes the events as a single JSON array, the format read by the experiments scripts
+
+    :param segments: segment paths (see :func:`list_segments`)
+    :type segments: List[str]
+
+    :param filename: JSON file to be written
+    :type filename: str
+
+    :return: number of events exported
+    :rtype: int
+    """
+    count = 0
+    with open(filename, "w") as file:
+        file.write("[\n")
+        for event in read_events(segments):
+            file.write(",\n" if count else "")
+            file.write(f"\t{json.dumps(event)}")
+            count += 1
+        file.write("\n]\n")
+    return count
@@ -0,0 +1,121 @@
+import threading
+from typing import Dict, List
+
+# Stages of a request measured by BaseService for every endpoint
+STAGES = ("queue_wait", "validation", "handler", "serialization", "total")
+
+class LatencyHistogram:
+    """
+    HDR-style histogram with log-linear buckets: each power of two of microseconds is split in
+    2**sub_bucket_bits buckets, so the relative error of percentiles is bounded, whatever the value.
+    Recording is O(1) and memory does not grow with the number of samples
+
+    :param sub_bucket_bits: precision. 5 bits means 32 buckets per power of two (about 3% error)
+    :type sub_bucket_bits: int
+    """
+    def __init__(self, sub_bucket_bits:int=5) -> None:
+        self._sub_bucket_bits = sub_bucket_bits
+        self._sub_buckets = 1 << sub_bucket_bits
+        self._counts: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self.count = 0
+        self.max_us = 0
+
+    def _bucket_index(self, value_us:int) -> int:
+        if value_us < self._sub_buckets:
+            # Exact buckets for small values
+            return value_us
+        exponent = value_us.bit_length() - 1 - self._sub_bucket_bits
+        return ((exponent + 1) << self._sub_bucket_bits) + (value_us >> exponent) - self._sub_buckets
+
+    def _bucket_upper_value(self, index:int) -> int:
+        if index < self._sub_buckets:
+            return index
+        exponent = (index >> self._sub_bucket_bits) - 1
+        sub_bucket = index - ((exponent + 1) << self._sub_bucket_bits) + self._sub_buckets
+        return ((sub_bucket + 1) << exponent) - 1
+
+    def record(self, seconds:float):
+        """
+        :param seconds: measured duration. Negative values (e.g. due to clock skew) are recorded as 0
+        :type seconds: float
+        """
+        value_us = max(int(seconds*1e6), 0)
+        index = self._bucket_index(value_us)
+        with self._lock:
+            self._counts[index] = self._counts.get(index, 0) + 1
+            self.count += 1
+            self.max_us = max(self.max_us, value_us)
+
+    def percentiles(self, quantiles:List[float]) -> List[float]:
+        """
+        :param quantiles: values between 0 and 1, in increasing order
+        :type quantiles: List[float]
+
+        :return: upper bound of the bucket of each quantile, in milliseconds (0 if there are no samples)
+        :rtype: List[float]
+        """
+        with self._lock:
+            counts = sorted(self._counts.items())
+            total = self.count
+            max_us = self.max_us
+        results = []
+        cumulative = 0
+        position = 0
+        for quantile in quantiles:
+            target = quantile*total
+            while position < len(counts) and (cumulative < target or cumulative == 0):
+                cumulative += counts[position][1]
+                position += 1
+            if position == 0:
+                results.append(0.0)
+            else:
+                results.append(min(self._bucket_upper_value(counts[position-1][0]), max_us)/1000)
+        return results
+
+    def summary(self) -> dict:
+        """
+        :return: count, p50, p95, p99 and max, in milliseconds
+        :rtype: dict
+        """
+        p50, p95, p99 = self.percentiles([0.5, 0.95, 0.99])
+        return {"count": self.count, "p50_ms": p50, "p95_ms": p95, "p99_ms": p99, "max_ms": self.max_us/1000}
+
+
+class ServiceStats:
+    """
+    Latency histograms of each stage (see :data:`STAGES`) of each endpoint of a service
+    """
+    def __init__(self) -> None:
+        self._histograms: Dict[str, Dict[str, LatencyHistogram]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, func_name:str, stage:str, seconds:float):
+        """
+        :param func_name: endpoint name
+        :type func_name: str
+
+        :param stage: one of :data:`STAGES`
+        :type stage: str
+
+        :param seconds: measured duration
+        :type seconds: float
+        """
+        endpoint_histograms = self._histograms.get(func_name)
+        if endpoint_histograms is None:
+            with self._lock:
+                endpoint_histograms = self._histograms.setdefault(
+                    func_name, {s: LatencyHistogram() for s in STAGES})
+        endpoint_histograms[stage].record(seconds)
+
+    def summary(self) -> Dict[str, Dict[str, dict]]:
+        """
+        :return: for each endpoint, the summary of each stage with samples
+        :rtype: Dict[str, Dict[str, dict]]
+        """
+        with self._lock:
+            histograms = dict(self._histograms)
+        return {
+            func_name: {stage: h.summary() for stage, h in endpoint_histograms.items() if h.count > 0}
+            for func_name, endpoint_histograms in histograms.items()
+        }
@@ -0,0 +1,56 @@
+import random
+
+# Status code of requests rejected because the service is overloaded. The response has a "retry_after", in seconds
+OVERLOADED_STATUS_CODE = 503
+
+# Interval, in seconds, between queue depth checks of endpoints with max_queue_depth
+QUEUE_DEPTH_POLL_INTERVAL = 0.5
+
+class ServiceOverloaded(Exception):
+    """
+    Raised by an endpoint that cannot serve the request now, e.g. a gateway whose upstream answered 503.
+    The caller receives status code 503 and the "retry_after", as if the service had shed the request
+
+    :param retry_after: time, in seconds, that the caller should wait before retrying
+    :type retry_after: float
+
+    :param reason: why the request was not served
+    :type reason: str
+    """
+    def __init__(self, retry_after:float, reason:str="Service overloaded"):
+        super().__init__(retry_after, reason)
+        self.retry_after = retry_after
+        self.reason = reason
+
+    def __str__(self) -> str:
+        return f"{self.reason}, retry after {self.retry_after} s"
+
+class OverloadPolicy:
+    """
+    Load shedding configuration of an endpoint. Requests beyond the limits are answered right away
+    with status code 503 and a "retry_after", instead of waiting in the queue and delaying everyone
+
+    :param max_queue_depth: maximum number of messages waiting in the endpoint queue. If None, not limited
+    :type max_queue_depth: int
+
+    :param max_queue_age: maximum time, in seconds, that a request may wait in the queue (from the client "x-sent-at" header). If None, not limited
+    :type max_queue_age: float
+
+    :param retry_after: time, in seconds, that clients are asked to wait before retrying
+    :type retry_after: float
+    """
+    def __init__(self, max_queue_depth:int=None, max_queue_age:float=None, retry_after:float=1.0) -> None:
+        self.max_queue_depth = max_queue_depth
+        self.max_queue_age = max_queue_age
+        self.retry_after = retry_after
+
+
+def retry_after_delay(retry_after:float) -> float:
+    """
+    :param retry_after: time requested by the service, in seconds
+    :type retry_after: float
+
+    :return: time to wait before retrying, with random jitter of up to 50%, so rejected clients do not come back all together
+    :rtype: float
+    """
+    return retry_after*random.uniform(1, 1.5)
@@ -0,0 +1,279 @@
+import collections
+import functools
+import itertools
+import queue
+import threading
+import time as tm
+import uuid
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+import pika
+import pika.spec
+
+# Broker host that selects the in-process transport, e.g. rpc_send(..., host="loopback")
+LOOPBACK_HOST = "loopback"
+
+def is_loopback_host(host:str) -> bool:
+    """
+    :param host: broker IP or hostname
+    :type host: str
+
+    :return: True if the host selects the in-process loopback transport instead of a RabbitMQ broker
+    :rtype: bool
+    """
+    return host == LOOPBACK_HOST
+
+_REPLY_QUEUE_PREFIX = "loopback.reply."
+
+# Receives the message properties and body
+Consumer = Callable[[pika.spec.BasicProperties, bytes], None]
+
+class LoopbackBroker:
+    """
+    In-process replacement for a RabbitMQ broker, with only the default exchange.
+    Messages to a queue are delivered to its consumers in turns, or kept until a consumer is registered
+    """
+    def __init__(self) -> None:
+        self._consumers: Dict[str, List[Tuple[str, Consumer]]] = {}
+        self._pending: Dict[str, Deque[Tuple[pika.spec.BasicProperties, bytes]]] = {}
+        self._turns: Dict[str, itertools.count] = {}
+        self._lock = threading.Lock()
+
+    def publish(self, routing_key:str, properties:pika.spec.BasicProperties, body:bytes):
+        with self._lock:
+            consumers = self._consumers.get(routing_key)
+            if not consumers:
+                if routing_key.startswith(_REPLY_QUEUE_PREFIX):
+                    # Late response to a closed client: its reply queue no longer exists
+                    return
+                self._pending.setdefault(routing_key, collections.deque()).append((properties, body))
+                return
+            _, consumer = consumers[next(self._turns[routing_key]) % len(consumers)]
+        consumer(properties, body)
+
+    def consume(self, queue_name:str, consumer:Consumer, consumer_tag:str=None) -> str:
+        """
+        :param consumer_tag: identifies the consumer. If None, a random one is created
+        :type consumer_tag: str
+
+        :return: consumer tag, used to cancel it
+        :rtype: str
+        """
+        if consumer_tag is None:
+            consumer_tag = f"loopback.ctag.{uuid.uuid4()}"
+        with self._lock:
+            self._consumers.setdefault(queue_name, []).append((consumer_tag, consumer))
+            self._turns.setdefault(queue_name, itertools.count())
+            pending = self._pending.pop(queue_name, ())
+        for properties, body in pending:
+            consumer(properties, body)
+        return consumer_tag
+
+    def cancel(self, consumer_tag:str):
+        with self._lock:
+            for queue_name, consumers in self._consumers.items():
+                self._consumers[queue_name] = [c for c in consumers if c[0] != consumer_tag]
+
+
+_brokers: Dict[Tuple[str,int], LoopbackBroker] = {}
+_brokers_lock = threading.Lock()
+
+def get_loopback_broker(host:str=LOOPBACK_HOST, port:int=5672) -> LoopbackBroker:
+    """
+    :return: process-wide loopback broker for the address. Different ports are independent brokers
+    :rtype: LoopbackBroker
+    """
+    with _brokers_lock:
+        return _brokers.setdefault((host, int(port)), LoopbackBroker())
+
+
+class LoopbackConnection:
+    """
+    Client side of the loopback transport, with the same interface as :class:`connection_pool.PooledConnection`
+
+    :param host: loopback host
+    :type host: str
+
+    :param port: port that identifies the loopback broker
+    :type port: int
+    """
+    def __init__(self, host:str=LOOPBACK_HOST, port:int=5672) -> None:
+        self.host = host
+        self.port = int(port)
+        self._broker = get_loopback_broker(host, port)
+        self._responses = {}
+        self._condition = threading.Condition()
+        self.reply_queue_name = f"{_REPLY_QUEUE_PREFIX}{uuid.uuid4()}"
+        self._consumer_tag = self._broker.consume(self.reply_queue_name, self._on_response)
+        self.is_open = True
+        # The connection also plays the role of channel and of pika connection
+        self.channel = self
+        self.connection = self
+
+    def _on_response(self, properties:pika.spec.BasicProperties, body:bytes):
+        with self._condition:
+            self._responses.setdefault(properties.correlation_id, collections.deque()).append((properties, body))
+            self._condition.notify_all()
+
+    def declare_queue(self, queue_name:str):
+        pass
+
+    def basic_publish(self, exchange:str, routing_key:str, body:bytes, properties:pika.spec.BasicProperties=None):
+        self._broker.publish(routing_key, properties or pika.BasicProperties(), body)
+
+    def process_data_events(self, time_limit:float=0):
+        pass
+
+    def wait_response(self, corr_id:str, timeout:float=None) -> Optional[Tuple[pika.spec.BasicProperties, bytes]]:
+        """
+        See :meth:`connection_pool.PooledConnection.wait_response`
+        """
+        deadline = None if timeout is None else tm.monotonic() + timeout
+        with self._condition:
+            while not self._responses.get(corr_id):
+                remaining = None if deadline is None else deadline - tm.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+            pending = self._responses[corr_id]
+            response = pending.popleft()
+            self._responses = {corr_id: pending} if pending else {}
+            return response
+
+    def wait_responses(self, corr_ids:List[str], timeout:float=None) -> Dict[str, Tuple[pika.spec.BasicProperties, bytes]]:
+        """
+        See :meth:`connection_pool.PooledConnection.wait_responses`
+        """
+        deadline = None if timeout is None else tm.monotonic() + timeout
+        waiting = set(corr_ids)
+        received = {}
+        with self._condition:
+            while True:
+                for corr_id in [corr_id for corr_id in waiting if self._responses.get(corr_id)]:
+                    received[corr_id] = self._responses[corr_id].popleft()
+                    waiting.discard(corr_id)
+                remaining = None if deadline is None else deadline - tm.monotonic()
+                if not waiting or (remaining is not None and remaining <= 0):
+                    break
+                self._condition.wait(remaining)
+            self._responses = {}
+        return received
+
+    def reconnect(self):
+        pass
+
+    def close(self):
+        if self.is_open:
+            self._broker.cancel(self._consumer_tag)
+            self.is_open = False
+
+
+class LoopbackIOLoop:
+    """
+    Executes the callbacks of a :class:`LoopbackSelectConnection` in a single thread, like the pika ioloop
+    """
+    def __init__(self) -> None:
+        self._callbacks = queue.Queue()
+        self._stopped = False
+
+    def add_callback_threadsafe(self, callback:Callable):
+        self._callbacks.put(callback)
+
+    def call_later(self, delay:float, callback:Callable) -> threading.Timer:
+        timer = threading.Timer(delay, self.add_callback_threadsafe, args=(callback,))
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    def start(self):
+        self._stopped = False
+        while not self._stopped:
+            self._callbacks.get()()
+
+    def stop(self):
+        self._stopped = True
+        # Wakes up the loop
+        self.add_callback_threadsafe(lambda: None)
+
+
+class LoopbackChannel:
+    """
+    Service side channel of the loopback transport, with the methods of pika.channel.Channel used by :class:`base_service.BaseService`
+    """
+    def __init__(self, connection:"LoopbackSelectConnection") -> None:
+        self._connection = connection
+        self._delivery_tags = itertools.count(1)
+        self._consumer_tags = []
+        self.is_open = True
+
+    def queue_declare(self, queue:str, **kwargs):
+        pass
+
+    def basic_qos(self, prefetch_count:int=0, **kwargs):
+        # Deliveries are not limited: the service executes them in the order they were published
+        pass
+
+    def basic_consume(self, queue:str, on_message_callback:Callable, auto_ack:bool=False, **kwargs) -> str:
+        consumer_tag = f"loopback.ctag.{uuid.uuid4()}"
+        def consumer(properties:pika.spec.BasicProperties, body:bytes):
+            method = pika.spec.Basic.Deliver(
+                consumer_tag=consumer_tag, delivery_tag=next(self._delivery_tags), routing_key=queue)
+            self._connection.ioloop.add_callback_threadsafe(
+                functools.partial(on_message_callback, self, method, properties, body))
+        self._connection.broker.consume(queue, consumer, consumer_tag)
+        self._consumer_tags.append(consumer_tag)
+        return consumer_tag
+
+    def basic_cancel(self, consumer_tag:str, **kwargs):
+        self._connection.broker.cancel(consumer_tag)
+
+    def basic_publish(self, exchange:str, routing_key:str, body:bytes, properties:pika.spec.BasicProperties=None, **kwargs):
+        self._connection.broker.publish(routing_key, properties or pika.BasicProperties(), body)
+
+    def basic_ack(self, delivery_tag:int=0, **kwargs):
+        pass
+
+    def close(self):
+        for consumer_tag in self._consumer_tags:
+            self._connection.broker.cancel(consumer_tag)
+        self.is_open = False
+
+
+class LoopbackSelectConnection:
+    """
+    Service side of the loopback transport, with the interface of pika.SelectConnection used by :class:`base_service.BaseService`
+
+    :param parameters: host (see :data:`LOOPBACK_HOST`) and port of the loopback broker
+    :type parameters: pika.ConnectionParameters
+    """
+    def __init__(
+            self,
+            parameters:pika.ConnectionParameters,
+            on_open_callback:Callable=None,
+            on_close_callback:Callable=None) -> None:
+        self.broker = get_loopback_broker(parameters.host, parameters.port)
+        self.ioloop = LoopbackIOLoop()
+        self._on_close_callback = on_close_callback
+        self._channels: List[LoopbackChannel] = []
+        self.is_open = True
+        self.is_closed = False
+        if on_open_callback is not None:
+            self.ioloop.add_callback_threadsafe(functools.partial(on_open_callback, self))
+
+    def channel(self, on_open_callback:Callable=None) -> LoopbackChannel:
+        channel = LoopbackChannel(self)
+        self._channels.append(channel)
+        if on_open_callback is not None:
+            self.ioloop.add_callback_threadsafe(functools.partial(on_open_callback, channel))
+        return channel
+
+    def close(self):
+        if self.is_closed:
+            return
+        for channel in self._channels:
+            channel.close()
+        self.is_open = False
+        self.is_closed = True
+        if self._on_close_callback is not None:
+            self.ioloop.add_callback_threadsafe(
+                functools.partial(self._on_close_callback, self, Exception("Loopback connection closed")))
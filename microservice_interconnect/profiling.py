@@ -0,0 +1,199 @@
+import argparse
+import cProfile
+import heapq
+import itertools
+import json
+import os
+import random
+import threading
+import time as tm
+import tracemalloc
+from typing import Any, Callable, List
+
+from microservice_interconnect.latency_stats import LatencyHistogram
+
+# Only one cProfile snapshot is taken at a time: calls executed meanwhile by other workers are not sampled
+_cprofile_lock = threading.Lock()
+
+# Endpoints with allocation tracking on. tracemalloc is process-wide, so it runs while any of them is profiled
+_tracemalloc_users = 0
+_tracemalloc_lock = threading.Lock()
+
+def _start_tracemalloc():
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        _tracemalloc_users += 1
+        if _tracemalloc_users == 1 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+def _stop_tracemalloc():
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0 and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+class EndpointProfiler:
+    """
+    Measures each call of an endpoint: wall time, CPU time of the worker thread and, if trace_allocations is True,
+    the memory allocated by it (net tracemalloc delta; with calls running at the same time in other workers, their
+    allocations are included too). If profile_slowest is more than 0, a fraction sample_rate of the calls also runs
+    under cProfile, and the snapshots of the profile_slowest slowest of them are kept, to be written by :meth:`dump`
+
+    Created by :meth:`base_service.BaseService.enable_profiling`. Endpoints without profiler are not affected
+
+    :param func_name: profiled endpoint
+    :type func_name: str
+
+    :param profile_slowest: number of cProfile snapshots kept. If 0, cProfile is not used
+    :type profile_slowest: int
+
+    :param sample_rate: fraction of the calls run under cProfile, between 0 and 1
+    :type sample_rate: float
+
+    :param trace_allocations: if True, tracemalloc runs while the endpoint is profiled
+    :type trace_allocations: bool
+    """
+    def __init__(self, func_name:str, profile_slowest:int=0, sample_rate:float=0.1, trace_allocations:bool=True) -> None:
+        self.func_name = func_name
+        self.profile_slowest = profile_slowest
+        self.sample_rate = sample_rate
+        self.trace_allocations = trace_allocations
+        self.started = tm.time()
+        self.wall = LatencyHistogram()
+        self.cpu = LatencyHistogram()
+        self.allocated_bytes = 0
+        self.max_allocated_bytes = 0
+        self.profiled_calls = 0
+        # Min-heap of (wall time, sequence, start time, cProfile.Profile), so the fastest snapshot is replaced first
+        self._slowest = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._stopped = False
+        if trace_allocations:
+            _start_tracemalloc()
+
+    def profile(self, call:Callable[[], Any]) -> Any:
+        """
+        :param call: executes the endpoint
+        :type call: Callable[[], Any]
+
+        :return: what the call returns
+        :rtype: Any
+        """
+        profiler = None
+        if self.profile_slowest > 0 and random.random() < self.sample_rate and _cprofile_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+        allocated_before = tracemalloc.get_traced_memory()[0] if self.trace_allocations else 0
+        start_time = tm.time()
+        cpu_start = tm.thread_time()
+        start = tm.perf_counter()
+        try:
+            if profiler is None:
+                return call()
+            profiler.enable()
+            try:
+                return call()
+            finally:
+                profiler.disable()
+        finally:
+            wall = tm.perf_counter() - start
+            cpu = tm.thread_time() - cpu_start
+            allocated = tracemalloc.get_traced_memory()[0] - allocated_before if self.trace_allocations else 0
+            if profiler is not None:
+                _cprofile_lock.release()
+            self._record(wall, cpu, allocated, start_time, profiler)
+
+    def _record(self, wall:float, cpu:float, allocated:int, start_time:float, profiler:cProfile.Profile):
+        self.wall.record(wall)
+        self.cpu.record(cpu)
+        with self._lock:
+            self.allocated_bytes += allocated
+            self.max_allocated_bytes = max(self.max_allocated_bytes, allocated)
+            if profiler is None:
+                return
+            self.profiled_calls += 1
+            entry = (wall, next(self._sequence), start_time, profiler)
+            if len(self._slowest) < self.profile_slowest:
+                heapq.heappush(self._slowest, entry)
+            elif wall > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, entry)
+
+    def summary(self) -> dict:
+        """
+        :return: wall and CPU time summaries (see :meth:`latency_stats.LatencyHistogram.summary`), mean and max bytes allocated per call, number of calls run under cProfile and wall time and start time of the kept snapshots
+        :rtype: dict
+        """
+        with self._lock:
+            count = self.wall.count
+            summary = {
+                "since": self.started,
+                "wall": self.wall.summary(),
+                "cpu": self.cpu.summary(),
+                "profiled_calls": self.profiled_calls,
+                # Start times match the spans and events of the calls
+                "slowest": [
+                    {"wall_ms": 1000*wall, "start": start_time}
+                    for wall, _, start_time, _ in sorted(self._slowest, reverse=True)
+                ],
+            }
+            if self.trace_allocations:
+                summary["allocated_bytes_mean"] = self.allocated_bytes/count if count else 0
+                summary["allocated_bytes_max"] = self.max_allocated_bytes
+        return summary
+
+    def dump(self, directory:str) -> List[str]:
+        """
+        Writes the summary (summary.json) and the kept cProfile snapshots, from the slowest to the fastest,
+        in a new subdirectory. Snapshots are read with pstats (e.g. "python -m pstats slowest-1.prof")
+
+        :param directory: directory of the dumps of the service
+        :type directory: str
+
+        :return: paths of the written files
+        :rtype: List[str]
+        """
+        path = os.path.join(directory, f"{self.func_name}-{int(tm.time()*1000)}")
+        os.makedirs(path, exist_ok=True)
+        summary_path = os.path.join(path, "summary.json")
+        with open(summary_path, "w") as summary_file:
+            json.dump(self.summary(), summary_file, indent=1)
+        paths = [summary_path]
+        with self._lock:
+            slowest = sorted(self._slowest, reverse=True)
+        for rank, (_, _, _, profiler) in enumerate(slowest, start=1):
+            profile_path = os.path.join(path, f"slowest-{rank}.prof")
+            profiler.dump_stats(profile_path)
+            paths.append(profile_path)
+        return paths
+
+    def stop(self):
+        """
+        Releases tracemalloc. Calls still running finish their measurements
+        """
+        with self._lock:
+            if self._stopped:
+                return
+            self._stopped = True
+        if self.trace_allocations:
+            _stop_tracemalloc()
+
+
+if __name__ == "__main__":
+    from microservice_interconnect.rpc_client import rpc_profile
+
+    parser = argparse.ArgumentParser(description="Switches the profiling of an endpoint of a running service")
+    parser.add_argument("func_name")
+    parser.add_argument("action", choices=("enable", "disable", "dump", "status"))
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=5672)
+    parser.add_argument("--slowest", type=int, default=0, help="cProfile snapshots of the slowest calls kept")
+    parser.add_argument("--sample_rate", type=float, default=0.1, help="fraction of the calls run under cProfile")
+    parser.add_argument("--no_allocations", action="store_true", help="do not trace allocations")
+    args = parser.parse_args()
+
+    response = rpc_profile(
+        args.func_name, args.action, args.host, args.port,
+        profile_slowest=args.slowest, sample_rate=args.sample_rate,
+        trace_allocations=not args.no_allocations, timeout=10)
+    print(json.dumps(response, indent=1))
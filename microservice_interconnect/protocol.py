@@ -0,0 +1,35 @@
+"""
+Names shared by the client (rpc_client) and the service (base_service) sides of the RPC protocol
+"""
+
+# Message type of an envelope with many calls to the same service, answered with a list of responses
+BATCH_FUNC_NAME = "rpc_batch"
+
+# Message type answered by every service with its latency and cache statistics
+STATS_FUNC_NAME = "rpc_stats"
+
+# Header with the content types accepted for the response, comma-separated, in order of preference
+ACCEPT_HEADER = "accept"
+
+# Header with the content encodings accepted for the response (see compression.py), comma-separated
+ACCEPT_ENCODING_HEADER = "accept-encoding"
+
+# Header with the absolute time (UNIX epoch, in seconds) after which the caller no longer waits for the response
+DEADLINE_HEADER = "x-deadline"
+
+# Header with the time (UNIX epoch, in seconds) when the request was published, for measuring queue wait
+SENT_AT_HEADER = "x-sent-at"
+
+# Header with a key that identifies a request and its redeliveries, so services execute it only once
+IDEMPOTENCY_KEY_HEADER = "x-idempotency-key"
+
+# Header of requests whose caller accepts a streamed response: streaming endpoints then answer with
+# many messages with the same correlation ID, {"items": [...]} chunks followed by an {"end": true} marker
+STREAM_HEADER = "x-stream"
+
+# Header with the trace and span IDs of the caller, in W3C Trace Context format ("00-<trace id>-<span id>-01").
+# Also used as HTTP header by the gateways (see tracing.py)
+TRACE_PARENT_HEADER = "traceparent"
+
+# Message type that switches the profiling of an endpoint of the service on or off, or dumps it (see BaseService.enable_profiling)
+PROFILE_FUNC_NAME = "rpc_profile"
@@ -0,0 +1,68 @@
+import os
+import signal
+from typing import Callable, List
+
+from microservice_interconnect.base_service import BaseService
+from microservice_interconnect.event_emitter import flush_event_emitters
+from microservice_interconnect.tracing import flush_spans
+
+def _run_replica(service_factory:Callable[[], BaseService], drain_timeout:float):
+    # Connections and threads cannot be shared with the parent, so the service is built after the fork
+    service = service_factory()
+    def signal_handler(sig, frame):
+        service.stop(drain_timeout=drain_timeout)
+    signal.signal(signal.SIGTERM, signal_handler)
+    signal.signal(signal.SIGINT, signal_handler)
+    service.start()
+    # Forked replicas exit without running the atexit handlers
+    flush_event_emitters()
+    flush_spans()
+
+def run_replicas(service_factory:Callable[[], BaseService], replicas:int=1, drain_timeout:float=30):
+    """
+    Forks a process for each replica of a service. Replicas consume the same queues, and the broker
+    dispatches each message to a single one of them (see the prefetch_count of :class:`base_service.BaseService`)
+
+    Blocks until every replica exits. SIGTERM or SIGINT (Ctrl+C) is forwarded to the replicas, which drain before exiting
+
+    :param service_factory: builds the service in each replica, e.g. the service class with its arguments bound by functools.partial
+    :type service_factory: Callable[[], BaseService]
+
+    :param replicas: number of processes
+    :type replicas: int
+
+    :param drain_timeout: maximum time, in seconds, that each replica waits for its requests in execution when stopping
+    :type drain_timeout: float
+    """
+    if replicas <= 1:
+        _run_replica(service_factory, drain_timeout)
+        return
+
+    pids: List[int] = []
+    for replica in range(replicas):
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 0
+            try:
+                _run_replica(service_factory, drain_timeout)
+            except BaseException as e:
+                print(f"Replica {replica} failed: {e}")
+                exit_code = 1
+            finally:
+                # Skips the parent cleanup handlers inherited by the fork
+                os._exit(exit_code)
+        print(f"Started replica {replica} (PID {pid})")
+        pids.append(pid)
+
+    def signal_handler(sig, frame):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+    signal.signal(signal.SIGTERM, signal_handler)
+    signal.signal(signal.SIGINT, signal_handler)
+
+    for pid in pids:
+        _, status = os.waitpid(pid, 0)
+        print(f"Replica with PID {pid} exited with code {os.waitstatus_to_exitcode(status)}")
@@ -0,0 +1,129 @@
+import json
+import threading
+import time as tm
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Tuple
+
+def default_cache_key(received:Any) -> Hashable:
+    """
+    :param received: validated JSON request
+    :type received: Any
+
+    :return: canonical JSON text of the request, so equal requests share the same entry
+    :rtype: Hashable
+    """
+    return json.dumps(received, sort_keys=True)
+
+class CachePolicy:
+    """
+    Cache configuration for a read-only endpoint
+
+    The cache is kept in the memory of each process, and invalidations (see the "invalidates" parameter of
+    :meth:`base_service.BaseService.add_api_endpoint`) only reach the cache of the replica that executed the write.
+    Other replicas return the old response until the TTL expires, so endpoints that must reflect writes at once
+    should not be cached when the service runs more than one replica
+
+    :param ttl: time, in seconds, that a response is kept
+    :type ttl: float
+
+    :param max_size: maximum number of responses kept. The least recently used is evicted first
+    :type max_size: int
+
+    :param key_func: maps the validated request to the cache key. Write endpoints must use the same keys to invalidate entries. Default: whole request
+    :type key_func: Callable[[Any], Hashable]
+    """
+    def __init__(self, ttl:float=10, max_size:int=1024, key_func:Callable[[Any], Hashable]=None) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        self.key_func = key_func if key_func is not None else default_cache_key
+
+
+class ResponseCache:
+    """
+    Thread-safe LRU cache with expiration for the responses of one endpoint
+
+    :param policy: cache configuration
+    :type policy: CachePolicy
+    """
+    def __init__(self, policy:CachePolicy) -> None:
+        self.policy = policy
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Incremented on every invalidation, so responses computed before it are not stored
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def key(self, received:Any) -> Hashable:
+        return self.policy.key_func(received)
+
+    def get(self, key:Hashable) -> Tuple[bool, Any, int]:
+        """
+        :param key: cache key
+        :type key: Hashable
+
+        :return: if found, the cached response, and the generation to be informed to :meth:`put` after a miss
+        :rtype: Tuple[bool, Any, int]
+        """
+        now = tm.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[1], self._generation
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return False, None, self._generation
+
+    def put(self, key:Hashable, response:Any, generation:int):
+        """
+        Stores a response, unless an invalidation happened after the lookup that returned the generation
+
+        :param key: cache key
+        :type key: Hashable
+
+        :param response: response to be cached
+        :type response: Any
+
+        :param generation: generation returned by :meth:`get`
+        :type generation: int
+        """
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[key] = (tm.monotonic() + self.policy.ttl, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.policy.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key:Hashable=None):
+        """
+        :param key: cache key to be removed. If None, removes every entry
+        :type key: Hashable
+        """
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        """
+        :return: hits, misses, evictions, invalidations and current size
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "size": len(self._entries),
+            }
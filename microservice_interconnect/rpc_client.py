@@ -1,11 +1,98 @@
 import pika
 import uuid
-import json
+import random
 import time as tm
+from typing import Any, Iterator, List
+
+from microservice_interconnect.compression import GZIP_ENCODING, decompress, maybe_compress
+from microservice_interconnect.confirmed_publisher import ConfirmedPublisher
+from microservice_interconnect.connection_pool import get_connection_pool, open_connection
+from microservice_interconnect.direct_transport import DirectTransportClosed
+from microservice_interconnect.load_shedding import OVERLOADED_STATUS_CODE, retry_after_delay
+from microservice_interconnect.loopback import is_loopback_host
+from microservice_interconnect.event_emitter import get_event_emitter
+from microservice_interconnect.service_registry import lookup_direct_address
+from microservice_interconnect.tracing import create_span, current_span_context, inject, set_span_attribute, start_span
+from microservice_interconnect.protocol import ACCEPT_ENCODING_HEADER, ACCEPT_HEADER, BATCH_FUNC_NAME, DEADLINE_HEADER, IDEMPOTENCY_KEY_HEADER, PROFILE_FUNC_NAME, SENT_AT_HEADER, STATS_FUNC_NAME, STREAM_HEADER
+from microservice_interconnect.wire_codecs import JSON_CONTENT_TYPE, get_codec
+
+# Reconnection backoff, in seconds: random delay up to min(RECONNECT_MAX_DELAY, RECONNECT_BASE_DELAY*2**attempt)
+RECONNECT_BASE_DELAY = 0.1
+RECONNECT_MAX_DELAY = 10
+
+def reconnect_delay(attempt:int) -> float:
+    """
+    Exponential backoff with full jitter, so clients that lost the broker at the same time do not reconnect together
+
+    :param attempt: number of the reconnection attempt, starting at 1
+    :type attempt: int
+
+    :return: time to wait before the attempt, in seconds
+    :rtype: float
+    """
+    return random.uniform(0, min(RECONNECT_MAX_DELAY, RECONNECT_BASE_DELAY*2**attempt))
+
+class RpcTimeout(Exception):
+    def __init__(self, func_name:str, timeout:float):
+        super().__init__(f"No response from {func_name} after {timeout} seconds")
+
+class RpcStreamError(Exception):
+    def __init__(self, func_name:str, response:dict):
+        super().__init__(f"{func_name} stream failed with status code {response.get('status_code')}: {response.get('exception')}")
+        self.response = response
+
+def request_properties(func_name:str, content_type:str, reply_to:str, corr_id:str, timeout:float=None, idempotency_key:str=None) -> pika.BasicProperties:
+    """
+    Properties of a request sent by :class:`RpcClient` and :class:`async_rpc_client.AsyncRpcClient`
+
+    :param func_name: function name in the destination
+    :type func_name: str
+
+    :param content_type: codec of the request, also requested for the response
+    :type content_type: str
+
+    :param reply_to: queue of the response
+    :type reply_to: str
+
+    :param corr_id: correlation ID of the response
+    :type corr_id: str
+
+    :param timeout: time the client waits for the response, in seconds. It becomes the message expiration and the deadline header. If None, neither is set
+    :type timeout: float
+
+    :param idempotency_key: sent in the idempotency key header, if not None
+    :type idempotency_key: str
+
+    :return: AMQP properties. The content encoding is set when the body is compressed
+    :rtype: pika.BasicProperties
+    """
+    headers = {
+        ACCEPT_HEADER: content_type,
+        ACCEPT_ENCODING_HEADER: GZIP_ENCODING,
+        SENT_AT_HEADER: tm.time(),
+    }
+    if idempotency_key is not None:
+        headers[IDEMPOTENCY_KEY_HEADER] = idempotency_key
+    # The service handles the request as a child of the span in execution (see tracing.py)
+    inject(headers)
+    expiration = None
+    if timeout is not None:
+        headers[DEADLINE_HEADER] = tm.time() + timeout
+        expiration = str(max(int(timeout*1000), 1))
+    return pika.BasicProperties(
+        reply_to=reply_to,
+        correlation_id=corr_id,
+        type=func_name,
+        content_type=content_type,
+        headers=headers,
+        expiration=expiration,
+    )
 
 class RpcClient:
     """
     Implements an RPC client for microservices communication using a Pika connection to the channel
+    By default, the connection is leased from the process-wide :class:`connection_pool.ConnectionPool`
+    and given back on :meth:`close`, so consecutive clients reuse the same TCP connection and reply queue
 
     :param queue_name: destination function name to send the call
     :type queue_name: str  
@@ -16,13 +103,50 @@ class RpcClient:
     :param port: broker port
     :type port: int
 
+    :param pooled: if False, a dedicated connection is opened and closed with the client
+    :type pooled: bool
+
+    :param content_type: codec used to encode requests and requested for responses (see :mod:`wire_codecs`)
+    :type content_type: str
+
+    :param compression_threshold: requests of at least this size, in bytes, are compressed. If None (default), requests are never compressed, since older services cannot decompress them. Compressed responses are always accepted
+    :type compression_threshold: int
+
+    :param max_reconnect_attempts: reconnections tried by :meth:`publish`, with jittered exponential backoff (see :func:`reconnect_delay`), before raising the connection error
+    :type max_reconnect_attempts: int
+
+    :param max_overload_retries: retries of :meth:`call` when the service answers it is overloaded (status code 503), after waiting the "retry_after" it asks for
+    :type max_overload_retries: int
+
+    :param direct: if True and the service of queue_name is registered in the process :class:`service_registry.ServiceRegistry`, calls go straight to it through the direct transport, without the broker. If the service closes the direct connection before answering, e.g. while draining, the client moves to the broker and sends the call again, with the same idempotency key, if any
+    :type direct: bool
+
     :raises pika.exceptions.AMQPConnectionError: broker inaccessible
-    """
-    def __init__(self, queue_name:str=None, host:str="localhost", port:int=5672) -> None:
 
-        self._connection_params = pika.ConnectionParameters(host=host, heartbeat=600, port=port)
-        self._connection = None
-        self._channel = None
+    :raises wire_codecs.UnknownContentType: no codec registered for the content type
+    """
+    def __init__(
+            self, 
+            queue_name:str=None, 
+            host:str="localhost", 
+            port:int=5672, 
+            pooled:bool=True,
+            content_type:str=JSON_CONTENT_TYPE,
+            compression_threshold:int=None,
+            max_reconnect_attempts:int=8,
+            max_overload_retries:int=3,
+            direct:bool=True) -> None:
+
+        self._codec = get_codec(content_type)
+        self.compression_threshold = compression_threshold
+        self.max_reconnect_attempts = max_reconnect_attempts
+        self.max_overload_retries = max_overload_retries
+        self.direct = direct
+        self._confirmed_publisher = None
+        self._host = host
+        self._port = port
+        self._pool = get_connection_pool() if pooled else None
+        self._pooled_connection = None
         self.queue_name = queue_name
 
         # Makes the connection in a separate method so it can be called later
@@ -31,106 +155,370 @@ class RpcClient:
         self.response = None
         self.corr_id = None
 
-    def _connect(self):
-        self._connection = pika.BlockingConnection(self._connection_params)
-        self._channel = self._connection.channel()
+    @property
+    def _connection(self) -> pika.BlockingConnection:
+        return self._pooled_connection.connection
+
+    @property
+    def _channel(self) -> pika.adapters.blocking_connection.BlockingChannel:
+        return self._pooled_connection.channel
+
+    @property
+    def callback_queue_name(self) -> str:
+        return self._pooled_connection.reply_queue_name
+
+    def _connect(self, use_direct:bool=True):
+        if self._pooled_connection is not None:
+            # Broken connection: discard it instead of giving back to the pool
+            self._pooled_connection.close()
+            self._pooled_connection = None
+        direct_address = lookup_direct_address(self.queue_name) if self.direct and use_direct else None
+        if direct_address is not None:
+            try:
+                self._pooled_connection = self._open_connection(direct_address, 0)
+                return
+            except pika.exceptions.AMQPConnectionError:
+                # E.g. entry of a replica that is stopping: the broker reaches the others
+                pass
+        self._pooled_connection = self._open_connection(self._host, self._port)
 
-    def _on_response(self, ch, method, props, body) -> None:
-        if self.corr_id == props.correlation_id:
-            self.response = body
+    def _open_connection(self, host:str, port:int):
+        if self._pool is not None:
+            return self._pool.acquire(host, port)
+        return open_connection(host, port)
 
-    def _publish(self, data:dict, properties=None):
+    def _publish(self, data:dict, properties=None, queue_name:str=None):
         if not properties:
-            properties = pika.BasicProperties(content_type="text/plain")
+            properties = pika.BasicProperties(content_type=self._codec.content_type)
 
+        body, properties.content_encoding = maybe_compress(
+            get_codec(properties.content_type).encode(data), self.compression_threshold)
         self._channel.basic_publish(
             exchange="",
-            routing_key=self.queue_name,
+            routing_key=queue_name if queue_name is not None else self.queue_name,
             properties=properties,
-            body=json.dumps(data),
+            body=body,
         )
 
-    def publish(self, data:dict, properties=None):
+    def publish(self, data:dict, properties=None, queue_name:str=None):
         """
         Sends a message without waiting for a response
-        It attempts to reconnect if the connection was closed for any reason before raising exception
+        It attempts to reconnect if the connection was closed for any reason before raising exception,
+        waiting longer after each failed attempt
 
         :param data: JSON data to be sent
         :type data: dict
 
         :param properties: Pika message properties
         :type properties: pika.BasicProperties
+
+        :param queue_name: destination queue, if different from the client queue
+        :type queue_name: str
         """
+        if queue_name is None:
+            queue_name = self.queue_name
         if properties is None:
             properties = pika.BasicProperties(
-                content_type="text/plain"
+                content_type=self._codec.content_type
             )
-        
-        # This queue probabily alerdy exists, but its nice to declare
-        self._channel.queue_declare(queue=self.queue_name, exclusive=False)
 
+        attempt = 0
+        lost_reply_queue_name = None
         while True:
             try:
-                self._publish(data, properties)
+                if lost_reply_queue_name is not None:
+                    self._connect()
+                    if properties.reply_to is not None and properties.reply_to == lost_reply_queue_name:
+                        # The reply queue was exclusive to the lost connection
+                        properties.reply_to = self.callback_queue_name
+                    lost_reply_queue_name = None
+                # This queue probabily alerdy exists, but its nice to declare (once per connection)
+                self._pooled_connection.declare_queue(queue_name)
+                self._publish(data, properties, queue_name)
                 return
             except pika.exceptions.ConnectionClosedByBroker as e:
                 print("ERROR: Connection closed by broker")
                 raise e
-            except pika.exceptions.AMQPChannelError:
+            except pika.exceptions.AMQPChannelError as e:
                 print("ERROR: AMQP channel error")
                 raise e
-            except pika.exceptions.AMQPConnectionError:
-                self._connect()
+            except pika.exceptions.AMQPConnectionError as e:
+                attempt += 1
+                if attempt > self.max_reconnect_attempts:
+                    print(f"ERROR: could not reconnect after {self.max_reconnect_attempts} attempts")
+                    raise e
+                if lost_reply_queue_name is None:
+                    lost_reply_queue_name = self.callback_queue_name
+                delay = reconnect_delay(attempt)
+                print(f"Connection lost ({e}), reconnecting in {delay:.2f} s")
+                tm.sleep(delay)
+
+    def publish_many(self, data_list:List[dict], confirm:bool=False, timeout:float=None):
+        """
+        Sends many messages without waiting for responses
 
-    def _prepare_callback(self):
-        callback_queue = self._channel.queue_declare(queue="", exclusive=True)
-        self.callback_queue_name = callback_queue.method.queue
+        With confirm=True, messages are published through a :class:`confirmed_publisher.ConfirmedPublisher`,
+        pipelined, and the method returns only after the broker confirmed all of them (in bulk).
+        Its connection is kept for the next calls, until :meth:`close`
 
-        self._channel.basic_consume(
-            queue=self.callback_queue_name,
-            on_message_callback=self._on_response,
-            auto_ack=True,
-        )
+        :param data_list: JSON messages to be sent
+        :type data_list: List[dict]
+
+        :param confirm: if True, waits for the broker confirms
+        :type confirm: bool
+
+        :param timeout: maximum time to wait for the confirms, in seconds. If None, waits forever
+        :type timeout: float
 
-    def call(self, data: dict) -> dict:
+        :raises confirmed_publisher.PublishNotConfirmed: some message was not confirmed by the broker
+        """
+        if not confirm or is_loopback_host(self._host):
+            # The loopback transport delivers synchronously
+            for data in data_list:
+                self.publish(data)
+            return
+
+        properties = pika.BasicProperties(content_type=self._codec.content_type)
+        bodies = [self._codec.encode(data) for data in data_list]
+        attempt = 0
+        while True:
+            try:
+                if self._confirmed_publisher is None:
+                    self._confirmed_publisher = ConfirmedPublisher(self._host, self._port)
+                self._confirmed_publisher.publish_many(self.queue_name, bodies, properties, timeout)
+                return
+            except pika.exceptions.AMQPConnectionError as e:
+                attempt += 1
+                if attempt > self.max_reconnect_attempts:
+                    raise e
+                delay = reconnect_delay(attempt)
+                print(f"Could not connect ({e}), retrying in {delay:.2f} s")
+                tm.sleep(delay)
+
+    def call(self, data: dict, func_name:str=None, timeout:float=None, idempotency_key:str=None) -> dict:
         """
         Sends a message to a microservice and waits for a response
 
+        The timeout also becomes a deadline for the service: the message expires in the queue
+        after the timeout, and the service does not execute requests received after the deadline
+
+        If the service answers it is overloaded, the call is retried after the "retry_after" it asks for,
+        with the same idempotency key, if any, up to max_overload_retries times and within the timeout
+
         :param data: JSON data to be sent to the microservice
         :type data: dict
 
+        :param func_name: function to be executed, if different from the queue name (e.g. "rpc_batch")
+        :type func_name: str
+
+        :param timeout: maximum time to wait for the response, in seconds. If None, waits forever
+        :type timeout: float
+
+        :param idempotency_key: identifies the request, so the service executes it only once, even if redelivered, and answers duplicates with the stored response. Retries of the same operation should reuse it. If None, the request is not deduplicated, and the service does not pay for storing its response
+        :type idempotency_key: str
+
+        :raises RpcTimeout: response not received before the timeout
+
         :return: JSON microservice response from callback queue
         :rtype: dict
         """
-        self._prepare_callback()
+        deadline = None if timeout is None else tm.monotonic() + timeout
+        n_retries = 0
+        while True:
+            remaining = None if deadline is None else max(deadline - tm.monotonic(), 0.001)
+            response = self._call_once(data, func_name, remaining, idempotency_key)
+            if not isinstance(response, dict) or response.get("status_code") != OVERLOADED_STATUS_CODE or n_retries >= self.max_overload_retries:
+                return response
+            delay = retry_after_delay(response.get("retry_after", 1.0))
+            if deadline is not None and tm.monotonic() + delay >= deadline:
+                return response
+            n_retries += 1
+            set_span_attribute("overload_retries", n_retries)
+            tm.sleep(delay)
+
+    def _decode_response(self, received:tuple) -> Any:
+        response_props, self.response = received
+        # Services that do not support the requested codec answer in JSON
+        return get_codec(response_props.content_type).decode(decompress(self.response, response_props.content_encoding))
+
+    def _fall_back_to_broker(self, error:DirectTransportClosed):
+        # The registry may still list the draining service, or other replica at the same address
+        set_span_attribute("fallback", "broker")
+        self._connect(use_direct=False)
+
+    def _send_and_wait(self, data: dict, func_name:str, timeout:float, idempotency_key:str) -> tuple:
+        self.corr_id = str(uuid.uuid4())
+        self.publish(data, properties=request_properties(func_name, self._codec.content_type, self.callback_queue_name, self.corr_id, timeout, idempotency_key))
+        return self._pooled_connection.wait_response(self.corr_id, timeout)
 
+    def _call_once(self, data: dict, func_name:str, timeout:float, idempotency_key:str) -> dict:
         self.response = None
-        self.corr_id = str(uuid.uuid4())
-        self.publish(
-            data,
-            properties=pika.BasicProperties(
-                reply_to=self.callback_queue_name,
-                correlation_id=self.corr_id,
-                type=self.queue_name,
-            ),
-        )
-        while self.response is None:
-            self._connection.process_data_events()
-        response = json.loads(self.response.decode("utf-8"))
-        return response
+        func_name = func_name if func_name is not None else self.queue_name
+        deadline = None if timeout is None else tm.monotonic() + timeout
+        with start_span(func_name, kind="client"):
+            try:
+                received = self._send_and_wait(data, func_name, timeout, idempotency_key)
+            except DirectTransportClosed as e:
+                # Requests not executed by the service are executed by other replica. An idempotency key keeps
+                # the ones it executed from running twice
+                self._fall_back_to_broker(e)
+                remaining = None if deadline is None else max(deadline - tm.monotonic(), 0.001)
+                received = self._send_and_wait(data, func_name, remaining, idempotency_key)
+            if received is None:
+                raise RpcTimeout(func_name, timeout)
+            response = self._decode_response(received)
+            if isinstance(response, dict):
+                set_span_attribute("status_code", response.get("status_code"))
+            return response
+
+    def gather(self, calls:list, timeout:float=None) -> list:
+        """
+        Sends many independent calls, to the same or to different services, all at once through this
+        client connection, and waits for their responses with a shared deadline.
+        The wait takes as long as the slowest call, instead of the sum of all of them
 
-    def close(self) -> None:
+        If the client uses the direct transport, every call must be to the same service
+
+        :param calls: list of {"func_name": function name in the destination, "args": parameters in JSON format}, with an optional "idempotency_key" (see :meth:`call`)
+        :type calls: list
+
+        :param timeout: maximum time to wait for all the responses, in seconds. If None, waits forever
+        :type timeout: float
+
+        :return: JSON with funtion return for each call, in the same order. Calls without response before the timeout have status code 504
+        :rtype: list
         """
-        Closes RabbitMQ connection
+        deadline = None if timeout is None else tm.monotonic() + timeout
+        idempotency_keys = [call.get("idempotency_key") for call in calls]
+        # A single span, parent of the calls: they are all waited for together
+        with start_span("gather", kind="client", attributes={"calls":[call["func_name"] for call in calls]}):
+            corr_ids = self._publish_calls(calls, idempotency_keys, timeout)
+            try:
+                received = self._pooled_connection.wait_responses(corr_ids, timeout)
+            except DirectTransportClosed as e:
+                # Only the calls not answered before the connection closed are sent again
+                self._fall_back_to_broker(e)
+                received = e.received
+                missing = [i for i, corr_id in enumerate(corr_ids) if corr_id not in received]
+                remaining = None if deadline is None else max(deadline - tm.monotonic(), 0.001)
+                resent_corr_ids = self._publish_calls(
+                    [calls[i] for i in missing], [idempotency_keys[i] for i in missing], remaining)
+                for i, corr_id in zip(missing, resent_corr_ids):
+                    corr_ids[i] = corr_id
+                received.update(self._pooled_connection.wait_responses(resent_corr_ids, remaining))
+            set_span_attribute("received", len(received))
+
+        responses = []
+        for call, corr_id in zip(calls, corr_ids):
+            if corr_id in received:
+                responses.append(self._decode_response(received[corr_id]))
+            else:
+                responses.append({"status_code":504, "exception":f"{RpcTimeout(call['func_name'], timeout)}"})
+        return responses
+
+    def _publish_calls(self, calls:list, idempotency_keys:List[str], timeout:float) -> List[str]:
+        corr_ids = []
+        for call, idempotency_key in zip(calls, idempotency_keys):
+            corr_id = str(uuid.uuid4())
+            properties = request_properties(call["func_name"], self._codec.content_type, self.callback_queue_name, corr_id, timeout, idempotency_key)
+            self.publish(call.get("args"), properties=properties, queue_name=call["func_name"])
+            corr_ids.append(corr_id)
+        return corr_ids
+
+    def call_stream(self, data: dict, func_name:str=None, timeout:float=None) -> Iterator[Any]:
         """
-        self._connection.close()
+        Calls a streaming endpoint (see :meth:`base_service.BaseService.add_api_endpoint`) and iterates over the
+        items of the response as their chunks arrive, without waiting for the whole response.
+        Endpoints that do not stream are accepted too, if they return a list
+
+        The connection is busy until the iteration ends, so the client must not make other calls in the meantime
 
+        :param data: JSON data to be sent to the microservice
+        :type data: dict
 
-def _publish_event(data, host:str="localhost", port:int=5672):
-    rpc_client = RpcClient(queue_name="events", host=host, port=port)
-    rpc_client.publish(data)
+        :param func_name: function to be executed, if different from the queue name
+        :type func_name: str
 
-def rpc_send(func_name:str, request:dict, host:str="localhost", port:int=5672) -> dict:
+        :param timeout: maximum time to wait for each chunk, in seconds. If None, waits forever
+        :type timeout: float
+
+        :raises RpcTimeout: chunk not received before the timeout
+
+        :raises RpcStreamError: the service answered with an error, before or in the middle of the stream
+
+        :return: items returned by the endpoint
+        :rtype: Iterator[Any]
+        """
+        func_name = func_name if func_name is not None else self.queue_name
+        self.response = None
+        self.corr_id = corr_id = str(uuid.uuid4())
+        headers = {
+            ACCEPT_HEADER: self._codec.content_type,
+            ACCEPT_ENCODING_HEADER: GZIP_ENCODING,
+            SENT_AT_HEADER: tm.time(),
+            STREAM_HEADER: True,
+        }
+        # Not the span in execution: the caller runs its own code between the items
+        span = create_span(func_name, kind="client", attributes={"stream":True})
+        inject(headers, span)
+        error = None
+        try:
+            self.publish(
+                data,
+                properties=pika.BasicProperties(
+                    reply_to=self.callback_queue_name,
+                    correlation_id=corr_id,
+                    type=func_name,
+                    content_type=self._codec.content_type,
+                    headers=headers,
+                ),
+            )
+            while True:
+                received = self._pooled_connection.wait_response(corr_id, timeout)
+                if received is None:
+                    raise RpcTimeout(func_name, timeout)
+                response_props, body = received
+                response = get_codec(response_props.content_type).decode(decompress(body, response_props.content_encoding))
+                if "items" in response:
+                    yield from response["items"]
+                    continue
+                if response.get("status_code") != 200:
+                    raise RpcStreamError(func_name, response)
+                if not response.get("end"):
+                    # Not a streaming endpoint: the whole response in one message
+                    yield from response.get("return") or []
+                return
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if span is not None:
+                span.end(error)
+
+    def close(self) -> None:
+        """
+        Gives back the connection to the pool or, if not pooled, closes RabbitMQ connection
+        """
+        if self._confirmed_publisher is not None:
+            self._confirmed_publisher.close()
+            self._confirmed_publisher = None
+        if self._pooled_connection is None:
+            return
+        if self._pool is not None:
+            self._pool.release(self._pooled_connection)
+        else:
+            self._pooled_connection.close()
+        self._pooled_connection = None
+
+
+def rpc_send(
+        func_name:str, 
+        request:dict, 
+        host:str="localhost", 
+        port:int=5672, 
+        content_type:str=JSON_CONTENT_TYPE,
+        timeout:float=None,
+        idempotency_key:str=None) -> dict:
     """
     Used to call a function in other microsservice and wait for the response
 
@@ -146,13 +534,226 @@ def rpc_send(func_name:str, request:dict, host:str="localhost", port:int=5672) -
     :param port: broker port
     :type port: int
 
-    :return: JSON with funtion return
+    :param content_type: codec for the request and the response. E.g. "application/msgpack" for large responses
+    :type content_type: str
+
+    :param timeout: maximum time to wait for the response, in seconds. If None, waits forever
+    :type timeout: float
+
+    :param idempotency_key: identifies the request, so it is executed only once even if sent again with the same key (see :meth:`RpcClient.call`)
+    :type idempotency_key: str
+
+    :return: JSON with funtion return. If the timeout expires, status code is 504
+    :rtype: dict
+    """
+    rpc_client = RpcClient(queue_name=func_name, host=host, port=port, content_type=content_type)
+    try:
+        response = rpc_client.call(request, timeout=timeout, idempotency_key=idempotency_key)
+    except RpcTimeout as e:
+        response = {"status_code":504, "exception":f"{e}"}
+    finally:
+        rpc_client.close()
+    return response
+
+def rpc_stream(
+        func_name:str,
+        request:dict,
+        host:str="localhost",
+        port:int=5672,
+        content_type:str=JSON_CONTENT_TYPE,
+        timeout:float=None) -> Iterator[Any]:
+    """
+    Used to call a streaming function in other microsservice, iterating over its items as they arrive (see :meth:`RpcClient.call_stream`)
+
+    :param func_name: function name in the destination
+    :type func_name: str
+
+    :param request: parameters in JSON format
+    :type request: dict
+
+    :param host: broker IP or hostname
+    :type host: str
+
+    :param port: broker port
+    :type port: int
+
+    :param content_type: codec for the request and the response
+    :type content_type: str
+
+    :param timeout: maximum time to wait for each chunk, in seconds. If None, waits forever
+    :type timeout: float
+
+    :raises RpcTimeout: chunk not received before the timeout
+
+    :raises RpcStreamError: the service answered with an error
+
+    :return: items returned by the function
+    :rtype: Iterator[Any]
+    """
+    rpc_client = RpcClient(queue_name=func_name, host=host, port=port, content_type=content_type)
+    try:
+        yield from rpc_client.call_stream(request, timeout=timeout)
+    finally:
+        rpc_client.close()
+
+def rpc_gather(
+        calls:list,
+        host:str="localhost",
+        port:int=5672,
+        timeout:float=None) -> list:
+    """
+    Used to call many independent functions, of one or more microsservices, in parallel and wait for all the responses
+    (see :meth:`RpcClient.gather`). Unlike :func:`rpc_send_batch`, each call is a separated message to its own queue
+
+    :param calls: list of {"func_name": function name in the destination, "args": parameters in JSON format}, with an optional "idempotency_key"
+    :type calls: list
+
+    :param host: broker IP or hostname
+    :type host: str
+
+    :param port: broker port
+    :type port: int
+
+    :param timeout: maximum time to wait for all the responses, in seconds. If None, waits forever
+    :type timeout: float
+
+    :return: JSON with funtion return for each call, in the same order. Calls without response before the timeout have status code 504, and the other responses are still returned
+    :rtype: list
+    """
+    if len(calls) == 0:
+        return []
+    # The direct transport reaches a single service
+    direct = len({lookup_direct_address(call["func_name"]) for call in calls}) == 1
+    rpc_client = RpcClient(queue_name=calls[0]["func_name"], host=host, port=port, direct=direct)
+    try:
+        responses = rpc_client.gather(calls, timeout=timeout)
+    finally:
+        rpc_client.close()
+    return responses
+
+def rpc_send_batch(
+        calls:list, 
+        host:str="localhost", 
+        port:int=5672, 
+        parallel:bool=False, 
+        timeout:float=None) -> list:
+    """
+    Used to call many functions of the same microsservice with a single message and wait for all the responses.
+    The batch is sent to the queue of the first function
+
+    :param calls: list of {"func_name": function name in the destination, "args": parameters in JSON format}
+    :type calls: list
+
+    :param host: broker IP or hostname
+    :type host: str
+    
+    :param port: broker port
+    :type port: int
+
+    :param parallel: if True, the destination may execute the calls at the same time. Otherwise, they are executed in order
+    :type parallel: bool
+
+    :param timeout: maximum time to wait for all the responses, in seconds. If None, waits forever
+    :type timeout: float
+
+    :return: JSON with funtion return for each call, in the same order. If the whole batch was rejected, every call receives the same error
+    :rtype: list
+    """
+    if len(calls) == 0:
+        return []
+    rpc_client = RpcClient(queue_name=calls[0]["func_name"], host=host, port=port)
+    try:
+        response = rpc_client.call({"calls":calls, "parallel":parallel}, func_name=BATCH_FUNC_NAME, timeout=timeout)
+    except RpcTimeout as e:
+        response = {"status_code":504, "exception":f"{e}"}
+    finally:
+        rpc_client.close()
+    if isinstance(response, dict):
+        return [response]*len(calls)
+    return response
+
+def rpc_get_service_stats(func_name:str, host:str="localhost", port:int=5672, timeout:float=None) -> dict:
+    """
+    Used to get the latency histograms and cache counters of the microsservice that implements a function
+
+    :param func_name: any function implemented by the microsservice
+    :type func_name: str
+
+    :param host: broker IP or hostname
+    :type host: str
+    
+    :param port: broker port
+    :type port: int
+
+    :param timeout: maximum time to wait for the response, in seconds. If None, waits forever
+    :type timeout: float
+
+    :return: JSON with the stats in "return" (see :meth:`base_service.BaseService.get_stats`)
     :rtype: dict
     """
     rpc_client = RpcClient(queue_name=func_name, host=host, port=port)
-    print(f"Sent {func_name} / {request}")
-    response = rpc_client.call(request)
-    print(f"Received {response}")
+    try:
+        response = rpc_client.call({}, func_name=STATS_FUNC_NAME, timeout=timeout)
+    except RpcTimeout as e:
+        response = {"status_code":504, "exception":f"{e}"}
+    finally:
+        rpc_client.close()
+    return response
+
+def rpc_profile(
+        func_name:str,
+        action:str="enable",
+        host:str="localhost",
+        port:int=5672,
+        profile_slowest:int=0,
+        sample_rate:float=0.1,
+        trace_allocations:bool=True,
+        timeout:float=None) -> dict:
+    """
+    Used to switch the profiling of a function of a running microsservice on or off, without restarting it
+    (see :meth:`base_service.BaseService.enable_profiling`). With replicas, only the one that consumes the message is affected
+
+    :param func_name: profiled function
+    :type func_name: str
+
+    :param action: "enable" (restarts the profile if alredy enabled), "disable" (dumps the profile and stops), "dump" (dumps without stopping) or "status"
+    :type action: str
+
+    :param host: broker IP or hostname
+    :type host: str
+
+    :param port: broker port
+    :type port: int
+
+    :param profile_slowest: for "enable", number of cProfile snapshots of the slowest calls kept. If 0, cProfile is not used
+    :type profile_slowest: int
+
+    :param sample_rate: for "enable", fraction of the calls run under cProfile
+    :type sample_rate: float
+
+    :param trace_allocations: for "enable", if True, allocations of each call are measured with tracemalloc
+    :type trace_allocations: bool
+
+    :param timeout: maximum time to wait for the response, in seconds. If None, waits forever
+    :type timeout: float
+
+    :return: JSON with "enabled", the profile "summary" and the "files" written in the microsservice host in "return"
+    :rtype: dict
+    """
+    request = {
+        "func_name": func_name,
+        "action": action,
+        "profile_slowest": profile_slowest,
+        "sample_rate": sample_rate,
+        "trace_allocations": trace_allocations,
+    }
+    rpc_client = RpcClient(queue_name=func_name, host=host, port=port)
+    try:
+        response = rpc_client.call(request, func_name=PROFILE_FUNC_NAME, timeout=timeout)
+    except RpcTimeout as e:
+        response = {"status_code":504, "exception":f"{e}"}
+    finally:
+        rpc_client.close()
     return response
 
 def register_event(
@@ -165,6 +766,7 @@ def register_event(
     ):
     """
     Used to register the occurence of an action in a microservice for logging
+    Events registered while handling a traced request also have its "trace_id" and "span_id" (see :mod:`tracing`)
     
     :param service_name: identifies the origin that registered the event
     :type service_name: str
@@ -186,13 +788,16 @@ def register_event(
     """
     
     if allow_registering:
-        _publish_event(
-            {
-                "time": tm.time(),
-                "service": service_name,
-                "function": func_name,
-                "event": event_descr,
-            },
-            host,
-            port,
-        )
+        event = {
+            "time": tm.time(),
+            "service": service_name,
+            "function": func_name,
+            "event": event_descr,
+        }
+        span_context = current_span_context()
+        if span_context is not None:
+            # Correlates the event with the request being handled (see tracing.py)
+            event["trace_id"] = span_context.trace_id
+            event["span_id"] = span_context.span_id
+        # Published in background, see event_emitter.EventEmitter
+        get_event_emitter(host, port).emit(event)
@@ -0,0 +1,149 @@
+from typing import Any, Callable, Dict, Optional
+
+import jsonschema
+import jsonschema.exceptions
+import jsonschema.validators
+
+# Keywords that the fast path knows how to check. Annotations do not affect validation
+_FAST_KEYWORDS = {"type", "properties", "required", "additionalProperties", "items"}
+_ANNOTATIONS = {"$schema", "$id", "title", "description", "$comment", "examples", "default"}
+
+# Conservative type checks: rejecting a valid instance only costs a fallback to the full validator
+_TYPE_CHECKS: Dict[str, Callable[[Any], bool]] = {
+    "object": lambda v: isinstance(v, dict),
+    "array": lambda v: isinstance(v, list),
+    "string": lambda v: isinstance(v, str),
+    "integer": lambda v: isinstance(v, int) and not isinstance(v, bool),
+    "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    "boolean": lambda v: isinstance(v, bool),
+    "null": lambda v: v is None,
+}
+
+def _always_true(instance:Any) -> bool:
+    return True
+
+def _compile_type(schema_type:Any) -> Optional[Callable[[Any], bool]]:
+    if isinstance(schema_type, str):
+        return _TYPE_CHECKS.get(schema_type)
+    if isinstance(schema_type, list) and all(t in _TYPE_CHECKS for t in schema_type):
+        checks = tuple(_TYPE_CHECKS[t] for t in schema_type)
+        return lambda v: any(check(v) for check in checks)
+    return None
+
+def compile_fast_check(schema:Any) -> Optional[Callable[[Any], bool]]:
+    """
+    Compiles a simple schema (only type, properties, required, additionalProperties and items keywords)
+    into a specialized check function. The function returns True only for instances that are surely valid,
+    so a False result must be confirmed by the full validator
+
+    :param schema: JSON schema
+    :type schema: Any
+
+    :return: check function, or None if the schema uses keywords not supported by the fast path
+    :rtype: Callable[[Any], bool]
+    """
+    if schema is True or schema == {}:
+        return _always_true
+    if not isinstance(schema, dict):
+        return None
+    if any(k not in _FAST_KEYWORDS and k not in _ANNOTATIONS for k in schema):
+        return None
+
+    checks = []
+
+    if "type" in schema:
+        type_check = _compile_type(schema["type"])
+        if type_check is None:
+            return None
+        checks.append(type_check)
+
+    properties = schema.get("properties", {})
+    required = tuple(schema.get("required", ()))
+    additional = schema.get("additionalProperties", True)
+    if not isinstance(properties, dict) or not isinstance(additional, bool):
+        return None
+    properties_checks = {}
+    for name, subschema in properties.items():
+        subcheck = compile_fast_check(subschema)
+        if subcheck is None:
+            return None
+        if subcheck is not _always_true:
+            properties_checks[name] = subcheck
+    allowed = frozenset(properties)
+
+    if properties_checks or required or not additional:
+        def check_object(v):
+            if not isinstance(v, dict):
+                # Object keywords do not apply to other types
+                return True
+            for name in required:
+                if name not in v:
+                    return False
+            if not additional and not allowed.issuperset(v):
+                return False
+            for name, subcheck in properties_checks.items():
+                if name in v and not subcheck(v[name]):
+                    return False
+            return True
+        checks.append(check_object)
+
+    if "items" in schema:
+        items_check = compile_fast_check(schema["items"])
+        if items_check is None:
+            return None
+        if items_check is not _always_true:
+            def check_array(v):
+                if not isinstance(v, list):
+                    return True
+                for item in v:
+                    if not items_check(item):
+                        return False
+                return True
+            checks.append(check_array)
+
+    if len(checks) == 0:
+        return _always_true
+    if len(checks) == 1:
+        return checks[0]
+    checks = tuple(checks)
+    return lambda v: all(check(v) for check in checks)
+
+
+class CompiledValidator:
+    """
+    JSON schema validator built once per endpoint, instead of once per message as in jsonschema.validate
+
+    :param schema: JSON schema
+    :type schema: dict
+
+    :param fast: if True, simple schemas are also compiled into a specialized check function, used
+        before the full validator. Invalid instances are always reported by the full validator
+    :type fast: bool
+
+    :raises jsonschema.SchemaError: invalid schema
+    """
+    def __init__(self, schema:Dict[str, Any], fast:bool=False) -> None:
+        validator_class = jsonschema.validators.validator_for(schema)
+        validator_class.check_schema(schema)
+        self.schema = schema
+        self._validator = validator_class(schema)
+        self._fast_check = compile_fast_check(schema) if fast else None
+
+    @property
+    def has_fast_path(self) -> bool:
+        return self._fast_check is not None
+
+    def validate(self, instance:Any):
+        """
+        Validates an instance, raising the same error as jsonschema.validate
+
+        :param instance: decoded JSON
+        :type instance: Any
+
+        :raises jsonschema.ValidationError: instance is invalid
+        """
+        if self._fast_check is not None and self._fast_check(instance):
+            return
+        error = jsonschema.exceptions.best_match(self._validator.iter_errors(instance))
+        if error is not None:
+            raise error
@@ -0,0 +1,156 @@
+import os
+import random
+import threading
+import time as tm
+from typing import Dict, List, Optional, Tuple
+
+def _process_alive(pid:int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Process of other user
+        pass
+    return True
+
+class ServiceRegistry:
+    """
+    Direct transport addresses (see :mod:`direct_transport`) of the services running in this host, by endpoint name.
+    Clients use it to call co-located services without going through the broker
+
+    Kept as a directory with a subdirectory per endpoint and, in it, one file per process that serves it, named by
+    its PID, so services and their replicas register and unregister themselves without locks. A replica that stops
+    removes only its own entry: the others, which may share its TCP address, stay registered. Entries of processes
+    that died without unregistering are ignored. Lookups are cached for refresh_interval seconds
+
+    :param path: registry directory, shared by the services and clients of the host
+    :type path: str
+
+    :param refresh_interval: time, in seconds, that a lookup is cached
+    :type refresh_interval: float
+    """
+    def __init__(self, path:str, refresh_interval:float=1.0) -> None:
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self._cache: Dict[str, Tuple[float, Optional[str]]] = {}
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def _entry_dir(self, func_name:str) -> str:
+        return os.path.join(self.path, func_name)
+
+    def _entry_path(self, func_name:str) -> str:
+        return os.path.join(self._entry_dir(func_name), str(os.getpid()))
+
+    def register(self, func_names:List[str], address:str):
+        """
+        :param func_names: endpoints served at the address
+        :type func_names: List[str]
+
+        :param address: direct transport address of the service
+        :type address: str
+        """
+        for func_name in func_names:
+            os.makedirs(self._entry_dir(func_name), exist_ok=True)
+            temp_path = f"{self._entry_path(func_name)}.tmp"
+            with open(temp_path, "w") as entry_file:
+                entry_file.write(address)
+            # Atomic, so clients never read a partial address
+            os.replace(temp_path, self._entry_path(func_name))
+        with self._lock:
+            self._cache = {}
+
+    def unregister(self, func_names:List[str], address:str):
+        """
+        Removes the entries of this process, unless other service of the process registered the endpoints with other address in the meantime
+
+        :param func_names: endpoints served at the address
+        :type func_names: List[str]
+
+        :param address: direct transport address of the service
+        :type address: str
+        """
+        for func_name in func_names:
+            entry_path = self._entry_path(func_name)
+            if self._read_entry(entry_path) == address:
+                try:
+                    os.remove(entry_path)
+                except FileNotFoundError:
+                    pass
+        with self._lock:
+            self._cache = {}
+
+    def _read_entry(self, entry_path:str) -> Optional[str]:
+        try:
+            with open(entry_path) as entry_file:
+                return entry_file.read().strip() or None
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+
+    def _read(self, func_name:str) -> Optional[str]:
+        entry_dir = self._entry_dir(func_name)
+        try:
+            names = os.listdir(entry_dir)
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        addresses = set()
+        for name in names:
+            if not name.isdigit() or not _process_alive(int(name)):
+                # Temporary file, or entry of a crashed process
+                continue
+            address = self._read_entry(os.path.join(entry_dir, name))
+            if address is not None:
+                addresses.add(address)
+        if not addresses:
+            return None
+        # Replicas with their own Unix sockets share the calls
+        return random.choice(sorted(addresses))
+
+    def lookup(self, func_name:str) -> Optional[str]:
+        """
+        :param func_name: endpoint name
+        :type func_name: str
+
+        :return: direct transport address of the service that implements the endpoint, or None if not co-located
+        :rtype: str
+        """
+        now = tm.monotonic()
+        with self._lock:
+            cached = self._cache.get(func_name)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+        address = self._read(func_name)
+        with self._lock:
+            self._cache[func_name] = (now + self.refresh_interval, address)
+        return address
+
+
+_registry: Optional[ServiceRegistry] = None
+
+def set_service_registry(registry:Optional[ServiceRegistry]):
+    """
+    :param registry: registry used by the services and clients of this process. If None, the direct transport is not used
+    :type registry: ServiceRegistry
+    """
+    global _registry
+    _registry = registry
+
+def get_service_registry() -> Optional[ServiceRegistry]:
+    """
+    :return: registry of this process, or None if the direct transport is not used
+    :rtype: ServiceRegistry
+    """
+    return _registry
+
+def lookup_direct_address(func_name:str) -> Optional[str]:
+    """
+    :param func_name: endpoint name
+    :type func_name: str
+
+    :return: direct transport address of the endpoint, or None if there is no registry or the service is not co-located
+    :rtype: str
+    """
+    if _registry is None or func_name is None:
+        return None
+    return _registry.lookup(func_name)
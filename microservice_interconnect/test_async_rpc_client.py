@@ -0,0 +1,64 @@
+import asyncio
+
+import pika.exceptions
+import pytest
+
+from microservice_interconnect.async_rpc_client import AsyncRpcClient
+
+FUNC_NAME = "rpc_exec_test_async"
+
+class FakeConnection:
+    def __init__(self) -> None:
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+class FakeChannel:
+    """
+    Closed by the broker right after the first publish, without answering
+    """
+    def __init__(self, rpc_client:AsyncRpcClient) -> None:
+        self.rpc_client = rpc_client
+        self.is_open = True
+
+    def basic_publish(self, **kwargs):
+        self.is_open = False
+        reason = pika.exceptions.ChannelClosedByBroker(406, "PRECONDITION_FAILED")
+        asyncio.get_running_loop().call_soon(self.rpc_client._on_channel_closed, self, reason)
+
+class ClosedWhileDeclaringChannel(FakeChannel):
+    """
+    Closed by the broker before confirming the declaration of the called queue
+    """
+    def queue_declare(self, queue:str, callback):
+        self.is_open = False
+        reason = pika.exceptions.ChannelClosedByBroker(403, "ACCESS_REFUSED")
+        asyncio.get_running_loop().call_soon(self.rpc_client._on_channel_closed, self, reason)
+
+def test_channel_close_fails_calls_in_flight():
+    async def call_and_close_channel():
+        rpc_client = AsyncRpcClient()
+        connection = rpc_client._connection = FakeConnection()
+        rpc_client._channel = FakeChannel(rpc_client)
+        rpc_client._declared_queues.add(FUNC_NAME)
+        with pytest.raises(pika.exceptions.AMQPChannelError):
+            await asyncio.wait_for(rpc_client.call(FUNC_NAME, {}), 5)
+        assert rpc_client._pending == {}
+        # The next call opens a new connection
+        assert not connection.is_open
+        assert not rpc_client.is_open
+
+    asyncio.run(call_and_close_channel())
+
+def test_channel_close_fails_calls_declaring_queue():
+    async def call_and_close_channel():
+        rpc_client = AsyncRpcClient()
+        rpc_client._connection = FakeConnection()
+        rpc_client._channel = ClosedWhileDeclaringChannel(rpc_client)
+        with pytest.raises(pika.exceptions.AMQPChannelError):
+            await asyncio.wait_for(rpc_client.call(FUNC_NAME, {}), 5)
+        assert rpc_client._declaring == set()
+        assert FUNC_NAME not in rpc_client._declared_queues
+
+    asyncio.run(call_and_close_channel())
@@ -0,0 +1,55 @@
+import time as tm
+
+from microservice_interconnect.base_service import BaseService
+from microservice_interconnect.loopback import LOOPBACK_HOST
+from microservice_interconnect.rpc_client import rpc_send_batch
+
+TASK_SCHEMA = {"type": "object", "properties": {"task_id": {"type": "string"}}, "required": ["task_id"]}
+
+def test_batch_executes_calls_in_order_with_one_response_each():
+    tasks = {}
+    def create_task(received:dict) -> str:
+        tasks[received["task_id"]] = "created"
+        return received["task_id"]
+    def start_task(received:dict) -> str:
+        # Fails unless the task was created by an earlier call of the batch
+        if tasks[received["task_id"]] != "created":
+            raise ValueError("Task not created")
+        tasks[received["task_id"]] = "running"
+        return tasks[received["task_id"]]
+
+    service = BaseService(broker_host=LOOPBACK_HOST, broker_port=5341)
+    service.add_api_endpoint("rpc_exec_create_task", TASK_SCHEMA, create_task)
+    service.add_api_endpoint("rpc_exec_start_server_task", TASK_SCHEMA, start_task)
+    service.start(background=True)
+    try:
+        responses = rpc_send_batch([
+            {"func_name": "rpc_exec_create_task", "args": {"task_id": "4fe5"}},
+            {"func_name": "rpc_exec_start_server_task", "args": {"task_id": "4fe5"}},
+            {"func_name": "rpc_exec_start_server_task", "args": {"task_id": "missing"}},
+            {"func_name": "rpc_exec_start_server_task", "args": {}},
+        ], LOOPBACK_HOST, 5341, timeout=5)
+        rejected = rpc_send_batch([{"func_name": "rpc_exec_create_task"}]*2, LOOPBACK_HOST, 5341, timeout=5)
+    finally:
+        service.stop(drain_timeout=0.1)
+
+    assert responses[:2] == [{"status_code": 200, "return": "4fe5"}, {"status_code": 200, "return": "running"}]
+    # A failed call does not fail the others
+    assert responses[2]["status_code"] == 500
+    assert responses[3]["status_code"] == 400
+    # An invalid envelope is rejected as a whole
+    assert len(rejected) == 2
+    assert rejected[0]["status_code"] == 400
+
+def test_parallel_batch_runs_calls_in_the_endpoint_bulkhead():
+    service = BaseService(broker_host=LOOPBACK_HOST, broker_port=5342, execution_mode="thread", max_workers=4)
+    service.add_api_endpoint("rpc_exec_test_sleep", None, lambda received: tm.sleep(0.5))
+    service.start(background=True)
+    try:
+        start = tm.monotonic()
+        responses = rpc_send_batch([{"func_name": "rpc_exec_test_sleep", "args": {}}]*4, LOOPBACK_HOST, 5342, parallel=True, timeout=5)
+        elapsed = tm.monotonic() - start
+    finally:
+        service.stop(drain_timeout=0.1)
+    assert [response["status_code"] for response in responses] == [200]*4
+    assert elapsed < 1.5
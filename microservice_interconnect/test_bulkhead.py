@@ -0,0 +1,57 @@
+import os
+import time as tm
+
+from microservice_interconnect.base_service import BaseService
+from microservice_interconnect.loopback import LOOPBACK_HOST
+from microservice_interconnect.rpc_client import rpc_gather, rpc_send
+
+def get_pid(received:dict) -> int:
+    # Module-level, so the process pool can pickle it
+    return os.getpid()
+
+def test_slow_bulkhead_does_not_hold_other_endpoints():
+    finished = {}
+    def slow(received:dict) -> None:
+        tm.sleep(0.5)
+        finished.setdefault("slow", []).append(tm.monotonic())
+    def fast(received:dict) -> None:
+        finished["fast"] = tm.monotonic()
+
+    service = BaseService(broker_host=LOOPBACK_HOST, broker_port=5331, execution_mode="thread", max_workers=2)
+    service.add_bulkhead("slow", max_workers=1)
+    service.add_api_endpoint("rpc_exec_test_slow", None, slow, bulkhead="slow")
+    service.add_api_endpoint("rpc_exec_test_fast", None, fast)
+    service.start(background=True)
+    try:
+        calls = [{"func_name": "rpc_exec_test_slow", "args": {}}]*2 + [{"func_name": "rpc_exec_test_fast", "args": {}}]
+        responses = rpc_gather(calls, LOOPBACK_HOST, 5331, timeout=5)
+    finally:
+        service.stop(drain_timeout=0.1)
+    assert [response["status_code"] for response in responses] == [200]*3
+    # The slow calls run one at a time, and the fast one does not wait for them
+    assert finished["slow"][1] - finished["slow"][0] >= 0.45
+    assert finished["fast"] < finished["slow"][0]
+
+def test_thread_mode_executes_requests_at_the_same_time():
+    service = BaseService(broker_host=LOOPBACK_HOST, broker_port=5332, execution_mode="thread", max_workers=4)
+    service.add_api_endpoint("rpc_exec_test_sleep", None, lambda received: tm.sleep(0.5))
+    service.start(background=True)
+    try:
+        start = tm.monotonic()
+        responses = rpc_gather([{"func_name": "rpc_exec_test_sleep", "args": {}}]*4, LOOPBACK_HOST, 5332, timeout=5)
+        elapsed = tm.monotonic() - start
+    finally:
+        service.stop(drain_timeout=0.1)
+    assert [response["status_code"] for response in responses] == [200]*4
+    assert elapsed < 1.5
+
+def test_process_mode_runs_functions_in_other_processes():
+    service = BaseService(broker_host=LOOPBACK_HOST, broker_port=5333, execution_mode="process", max_workers=1)
+    service.add_api_endpoint("rpc_exec_test_pid", None, get_pid)
+    service.start(background=True)
+    try:
+        response = rpc_send("rpc_exec_test_pid", {}, LOOPBACK_HOST, 5333, timeout=10)
+    finally:
+        service.stop(drain_timeout=0.1)
+    assert response["status_code"] == 200
+    assert response["return"] != os.getpid()
@@ -0,0 +1,46 @@
+import pytest
+
+from microservice_interconnect.base_service import BaseService
+from microservice_interconnect.compression import GZIP_ENCODING, UnknownContentEncoding, decompress, get_compression_stats, maybe_compress
+from microservice_interconnect.loopback import LOOPBACK_HOST
+from microservice_interconnect.rpc_client import RpcClient
+
+def test_only_large_compressible_bodies_are_compressed():
+    body = b'{"sensors": ["camera", "ecu"]}'*200
+    compressed, content_encoding = maybe_compress(body, threshold=1024)
+    assert content_encoding == GZIP_ENCODING
+    assert len(compressed) < len(body)
+    assert decompress(compressed, content_encoding) == body
+
+    assert maybe_compress(body[:100], threshold=1024) == (body[:100], None)
+    assert maybe_compress(body, threshold=None) == (body, None)
+    with pytest.raises(UnknownContentEncoding):
+        decompress(compressed, "br")
+
+def test_large_request_and_response_are_compressed_on_the_wire():
+    service = BaseService(broker_host=LOOPBACK_HOST, broker_port=5391, compression_threshold=1024)
+    service.add_api_endpoint("rpc_exec_test_echo", None, lambda received: received)
+    service.start(background=True)
+    rpc_client = RpcClient(queue_name="rpc_exec_test_echo", host=LOOPBACK_HOST, port=5391, compression_threshold=1024)
+    received_encodings = []
+    decode_response = rpc_client._decode_response
+    def record_encoding(received:tuple):
+        received_encodings.append(received[0].content_encoding)
+        return decode_response(received)
+    rpc_client._decode_response = record_encoding
+    request = {"tasks": [{"task_id": f"task-{i}", "status": "running"} for i in range(100)]}
+    before = get_compression_stats().summary()
+    try:
+        large = rpc_client.call(request, timeout=5)
+        small = rpc_client.call({"task_id": "task-0"}, timeout=5)
+    finally:
+        rpc_client.close()
+        service.stop(drain_timeout=0.1)
+    after = get_compression_stats().summary()
+
+    assert large == {"status_code": 200, "return": request}
+    assert small == {"status_code": 200, "return": {"task_id": "task-0"}}
+    assert received_encodings == [GZIP_ENCODING, None]
+    # The request, by the client, and the response, by the service, in this process
+    assert after["compressed_messages"] - before["compressed_messages"] == 2
+    assert after["decompressed_messages"] - before["decompressed_messages"] == 2
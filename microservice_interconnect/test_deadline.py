@@ -0,0 +1,37 @@
+import threading
+import time as tm
+
+import pytest
+
+from microservice_interconnect.base_service import BaseService
+from microservice_interconnect.loopback import LOOPBACK_HOST
+from microservice_interconnect.rpc_client import RpcClient, RpcTimeout, rpc_send
+
+def test_call_times_out_and_expired_request_is_not_executed():
+    executed = []
+    def slow(received:dict) -> None:
+        tm.sleep(0.6)
+        executed.append("slow")
+
+    # Inline: the expired request waits for the slow one in the connection thread
+    service = BaseService(broker_host=LOOPBACK_HOST, broker_port=5351)
+    service.add_api_endpoint("rpc_exec_test_slow", None, slow)
+    service.add_api_endpoint("rpc_exec_test_fast", None, lambda received: executed.append("fast"))
+    service.start(background=True)
+    slow_call = threading.Thread(target=rpc_send, args=("rpc_exec_test_slow", {}, LOOPBACK_HOST, 5351), kwargs={"timeout": 5})
+    rpc_client = RpcClient(queue_name="rpc_exec_test_fast", host=LOOPBACK_HOST, port=5351)
+    try:
+        slow_call.start()
+        tm.sleep(0.1)
+        start = tm.monotonic()
+        with pytest.raises(RpcTimeout):
+            rpc_client.call({}, timeout=0.2)
+        assert tm.monotonic() - start < 0.5
+        assert rpc_send("rpc_exec_test_fast", {}, LOOPBACK_HOST, 5351, timeout=0.2)["status_code"] == 504
+        slow_call.join()
+        # Both fast requests were answered with 504, after the deadline, and not executed
+        assert rpc_send("rpc_exec_test_fast", {}, LOOPBACK_HOST, 5351, timeout=5)["status_code"] == 200
+    finally:
+        rpc_client.close()
+        service.stop(drain_timeout=0.1)
+    assert executed == ["slow", "fast"]
@@ -0,0 +1,69 @@
+from microservice_interconnect.base_service import BaseService
+from microservice_interconnect.dedup_store import DedupStore, content_idempotency_key
+from microservice_interconnect.loopback import LOOPBACK_HOST
+from microservice_interconnect.rpc_client import RpcClient, rpc_send
+
+def test_successful_responses_are_replayed(tmp_path):
+    store = DedupStore(path=str(tmp_path / "dedup.db"))
+    executions = []
+    def execute():
+        executions.append(1)
+        return {"status_code": 200, "return": len(executions)}
+
+    assert store.execute_once("key", execute) == {"status_code": 200, "return": 1}
+    assert store.execute_once("key", execute) == {"status_code": 200, "return": 1}
+    assert len(executions) == 1
+    store.close()
+
+def test_failed_responses_are_not_stored(tmp_path):
+    store = DedupStore(path=str(tmp_path / "dedup.db"))
+    responses = iter([{"status_code": 500, "exception": "transient"}, {"status_code": 503, "retry_after": 0.1}, {"status_code": 200}])
+
+    assert store.execute_once("key", lambda: next(responses))["status_code"] == 500
+    assert store.execute_once("key", lambda: next(responses))["status_code"] == 503
+    assert store.execute_once("key", lambda: next(responses))["status_code"] == 200
+    assert store.stats() == {"replayed": 0, "size": 1}
+    store.close()
+
+def test_only_calls_with_key_are_deduplicated():
+    service = BaseService(broker_host=LOOPBACK_HOST, broker_port=5303)
+    service.add_api_endpoint("rpc_exec_test_dedup", None, lambda received: received)
+    service.start(background=True)
+    rpc_client = RpcClient(queue_name="rpc_exec_test_dedup", host=LOOPBACK_HOST, port=5303)
+    try:
+        for _ in range(2):
+            rpc_client.call({}, timeout=5)
+        assert service.dedup_store.stats()["size"] == 0
+        for _ in range(2):
+            rpc_client.call({}, timeout=5, idempotency_key="call-1")
+        assert service.dedup_store.stats() == {"replayed": 1, "size": 1}
+    finally:
+        rpc_client.close()
+        service.stop(drain_timeout=0.1)
+
+def test_redelivered_task_creation_executes_once(tmp_path):
+    """
+    The request is executed and its response stored, but the service stops before the client receives it.
+    The resent request, with the key the cloud gateway derives from its content, is answered by the restarted
+    service from the persisted store
+    """
+    created = []
+    def create_task(received:dict) -> None:
+        created.append(received["task_id"])
+
+    request = {"task_id": "4fe5", "host": "localhost", "port": 8080}
+    idempotency_key = content_idempotency_key(request)
+    responses = []
+    for _ in range(2):
+        service = BaseService(broker_host=LOOPBACK_HOST, broker_port=5304, dedup_store=DedupStore(path=str(tmp_path / "dedup.db")))
+        service.add_api_endpoint("rpc_exec_create_task", None, create_task)
+        service.start(background=True)
+        try:
+            responses.append(rpc_send("rpc_exec_create_task", request, LOOPBACK_HOST, 5304, timeout=5, idempotency_key=idempotency_key))
+        finally:
+            service.stop(drain_timeout=0.1)
+            service.dedup_store.close()
+
+    assert created == ["4fe5"]
+    assert responses[0] == responses[1] == {"status_code": 200, "return": None}
+    assert content_idempotency_key(dict(reversed(list(request.items())))) == idempotency_key
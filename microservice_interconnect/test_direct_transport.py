@@ -0,0 +1,70 @@
+import threading
+import time as tm
+from typing import Any, Callable, Tuple
+
+from microservice_interconnect.base_service import BaseService
+from microservice_interconnect.loopback import LOOPBACK_HOST
+from microservice_interconnect.rpc_client import RpcClient
+from microservice_interconnect.service_registry import ServiceRegistry, get_service_registry, set_service_registry
+
+FUNC_NAME = "rpc_exec_test_direct"
+
+def start_replica(name:str, port:int, executed:list, direct_address:str=None, delay:float=0) -> BaseService:
+    def handler(received:dict) -> dict:
+        executed.append(name)
+        tm.sleep(delay)
+        return {"replica": name}
+    service = BaseService(broker_host=LOOPBACK_HOST, broker_port=port, execution_mode="thread", direct_address=direct_address)
+    service.add_api_endpoint(FUNC_NAME, None, handler)
+    service.start(background=True)
+    return service
+
+def drain_during(tmp_path, port:int, executed:list, send:Callable[[RpcClient], Any]) -> Tuple[Any, str]:
+    """
+    Sends calls to a replica through the direct transport, and stops it, with a drain timeout shorter than the calls,
+    while they are executed. Other replica consumes from the broker. Returns what send returns and the host the client ends connected to
+    """
+    previous_registry = get_service_registry()
+    registry = ServiceRegistry(str(tmp_path / "registry"))
+    set_service_registry(registry)
+    draining = start_replica("draining", port, executed, f"unix:{tmp_path}/draining.sock", delay=2)
+    other = start_replica("other", port, executed)
+    rpc_client = None
+    try:
+        # The direct transport starts with the broker connection
+        deadline = tm.monotonic() + 5
+        while registry.lookup(FUNC_NAME) is None and tm.monotonic() < deadline:
+            tm.sleep(0.05)
+        rpc_client = RpcClient(queue_name=FUNC_NAME, host=LOOPBACK_HOST, port=port)
+        assert rpc_client._pooled_connection.host.startswith("unix:")
+
+        stopper = threading.Timer(0.3, draining.stop, kwargs={"drain_timeout": 0.1})
+        stopper.start()
+        result = send(rpc_client)
+        stopper.join()
+        return result, rpc_client._pooled_connection.host
+    finally:
+        if rpc_client is not None:
+            rpc_client.close()
+        draining.stop(drain_timeout=0.1)
+        other.stop(drain_timeout=0.1)
+        set_service_registry(previous_registry)
+
+def test_call_in_flight_moves_to_broker_when_service_drains(tmp_path):
+    executed = []
+    response, host = drain_during(
+        tmp_path, 5301, executed, lambda rpc_client: rpc_client.call({}, timeout=10, idempotency_key="call-1"))
+
+    assert response["status_code"] == 200, response
+    assert response["return"] == {"replica": "other"}
+    assert executed == ["draining", "other"]
+    assert host == LOOPBACK_HOST
+
+def test_gather_in_flight_moves_to_broker_when_service_drains(tmp_path):
+    executed = []
+    calls = [{"func_name": FUNC_NAME, "args": {"i": i}} for i in range(2)]
+    responses, host = drain_during(tmp_path, 5302, executed, lambda rpc_client: rpc_client.gather(calls, timeout=10))
+
+    assert [response["return"] for response in responses] == [{"replica": "other"}]*2
+    assert sorted(executed) == ["draining"]*2 + ["other"]*2
+    assert host == LOOPBACK_HOST
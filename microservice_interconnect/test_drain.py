@@ -0,0 +1,42 @@
+import threading
+import time as tm
+
+from microservice_interconnect.base_service import BaseService
+from microservice_interconnect.loopback import LOOPBACK_HOST
+from microservice_interconnect.rpc_client import rpc_send
+
+FUNC_NAME = "rpc_exec_test_drain"
+
+def start_replica(name:str, executed:list) -> BaseService:
+    def handler(received:dict) -> str:
+        tm.sleep(received.get("delay", 0))
+        executed.append(name)
+        return name
+    service = BaseService(broker_host=LOOPBACK_HOST, broker_port=5371, execution_mode="thread")
+    service.add_api_endpoint(FUNC_NAME, None, handler)
+    service.start(background=True)
+    return service
+
+def test_stop_finishes_requests_in_execution_and_leaves_the_queue_to_other_replicas():
+    executed = []
+    draining = start_replica("draining", executed)
+    in_flight = {}
+    call = threading.Thread(target=lambda: in_flight.update(rpc_send(FUNC_NAME, {"delay": 0.5}, LOOPBACK_HOST, 5371, timeout=5)))
+    other = None
+    try:
+        call.start()
+        tm.sleep(0.1)
+        other = start_replica("other", executed)
+        start = tm.monotonic()
+        draining.stop(drain_timeout=5)
+        # Returned once the request finished, not after the drain timeout
+        assert tm.monotonic() - start < 2
+        call.join()
+        responses = [rpc_send(FUNC_NAME, {}, LOOPBACK_HOST, 5371, timeout=5) for _ in range(3)]
+    finally:
+        draining.stop(drain_timeout=0.1)
+        if other is not None:
+            other.stop(drain_timeout=0.1)
+    assert in_flight == {"status_code": 200, "return": "draining"}
+    assert [response["return"] for response in responses] == ["other"]*3
+    assert executed == ["draining"] + ["other"]*3
@@ -0,0 +1,35 @@
+import time as tm
+
+from microservice_interconnect.base_service import BaseService
+from microservice_interconnect.loopback import LOOPBACK_HOST
+from microservice_interconnect.rpc_client import rpc_gather
+
+def start_service(func_name:str, delay:float) -> BaseService:
+    service = BaseService(broker_host=LOOPBACK_HOST, broker_port=5421)
+    service.add_api_endpoint(func_name, None, lambda received: tm.sleep(delay) or received)
+    service.start(background=True)
+    return service
+
+def test_calls_to_different_services_are_waited_for_together():
+    services = [
+        start_service("rpc_exec_get_user_info", 0.6),
+        start_service("rpc_exec_get_task_by_id", 0.6),
+        start_service("rpc_exec_list_tasks", 1.3),
+    ]
+    try:
+        start = tm.monotonic()
+        responses = rpc_gather([
+            {"func_name": "rpc_exec_get_user_info", "args": {"user_id": "xxxx"}},
+            {"func_name": "rpc_exec_get_task_by_id", "args": {"task_id": "4fe5"}},
+            {"func_name": "rpc_exec_list_tasks", "args": {}},
+        ], LOOPBACK_HOST, 5421, timeout=1)
+        elapsed = tm.monotonic() - start
+    finally:
+        for service in services:
+            service.stop(drain_timeout=0.1)
+    # Executed at the same time: one after the other, they would take longer than the timeout
+    assert responses[0] == {"status_code": 200, "return": {"user_id": "xxxx"}}
+    assert responses[1] == {"status_code": 200, "return": {"task_id": "4fe5"}}
+    # The slow call does not hold the others back
+    assert responses[2]["status_code"] == 504
+    assert 1 <= elapsed < 1.5
@@ -0,0 +1,35 @@
+import time as tm
+
+import pytest
+
+from microservice_interconnect.base_service import BaseService
+from microservice_interconnect.latency_stats import LatencyHistogram
+from microservice_interconnect.loopback import LOOPBACK_HOST
+from microservice_interconnect.rpc_client import rpc_get_service_stats, rpc_send
+
+def test_histogram_percentiles_are_within_relative_error():
+    histogram = LatencyHistogram()
+    # 1 ms to 10 s
+    for i in range(1, 10001):
+        histogram.record(i/1000)
+    p50, p99 = histogram.percentiles([0.5, 0.99])
+    assert p50 == pytest.approx(5000, rel=0.04)
+    assert p99 == pytest.approx(9900, rel=0.04)
+    assert histogram.summary()["count"] == 10000
+
+def test_rpc_stats_reports_latency_of_each_stage():
+    service = BaseService(broker_host=LOOPBACK_HOST, broker_port=5361)
+    service.add_api_endpoint("rpc_exec_test_sleep", None, lambda received: tm.sleep(0.05))
+    service.start(background=True)
+    try:
+        for _ in range(5):
+            rpc_send("rpc_exec_test_sleep", {}, LOOPBACK_HOST, 5361, timeout=5)
+        response = rpc_get_service_stats("rpc_exec_test_sleep", LOOPBACK_HOST, 5361, timeout=5)
+    finally:
+        service.stop(drain_timeout=0.1)
+    assert response["status_code"] == 200
+    latency = response["return"]["latency"]["rpc_exec_test_sleep"]
+    assert {"queue_wait", "handler", "total"} <= set(latency)
+    assert latency["handler"]["count"] == 5
+    assert 50 <= latency["handler"]["p50_ms"] < 100
+    assert latency["total"]["p50_ms"] >= latency["handler"]["p50_ms"]
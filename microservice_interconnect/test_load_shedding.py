@@ -0,0 +1,107 @@
+import threading
+import time as tm
+
+import pytest
+
+from microservice_interconnect.base_service import BaseService
+from microservice_interconnect.load_shedding import OVERLOADED_STATUS_CODE, OverloadPolicy, ServiceOverloaded
+from microservice_interconnect.loopback import LOOPBACK_HOST
+from microservice_interconnect.rpc_client import RpcClient
+
+FUNC_NAME = "rpc_exec_test_shedding"
+
+class UpstreamOverloaded:
+    """
+    Endpoint whose upstream is overloaded the first n_overloaded times it is called
+    """
+    def __init__(self, n_overloaded:int) -> None:
+        self.n_overloaded = n_overloaded
+        self.calls = 0
+
+    def __call__(self, received:dict) -> list:
+        self.calls += 1
+        if self.calls <= self.n_overloaded:
+            raise ServiceOverloaded(0.05, "upstream overloaded")
+        return ["task"]
+
+def serve(port:int, func) -> BaseService:
+    service = BaseService(broker_host=LOOPBACK_HOST, broker_port=port)
+    service.add_api_endpoint(FUNC_NAME, None, func)
+    service.start(background=True)
+    return service
+
+def test_service_overloaded_is_a_top_level_503():
+    endpoint = UpstreamOverloaded(n_overloaded=1)
+    service = serve(5311, endpoint)
+    rpc_client = RpcClient(queue_name=FUNC_NAME, host=LOOPBACK_HOST, port=5311, max_overload_retries=0)
+    try:
+        response = rpc_client.call({}, timeout=5)
+    finally:
+        rpc_client.close()
+        service.stop(drain_timeout=0.1)
+    assert response["status_code"] == OVERLOADED_STATUS_CODE
+    assert response["retry_after"] == 0.05
+    assert "return" not in response
+
+def test_client_retries_after_service_overloaded():
+    endpoint = UpstreamOverloaded(n_overloaded=2)
+    service = serve(5312, endpoint)
+    rpc_client = RpcClient(queue_name=FUNC_NAME, host=LOOPBACK_HOST, port=5312, max_overload_retries=3)
+    try:
+        response = rpc_client.call({}, timeout=5)
+    finally:
+        rpc_client.close()
+        service.stop(drain_timeout=0.1)
+    assert response == {"status_code": 200, "return": ["task"]}
+    assert endpoint.calls == 3
+
+def test_requests_waiting_too_long_are_shed():
+    executed = []
+    def update_stats(received:dict):
+        tm.sleep(received.get("delay", 0))
+        executed.append(received)
+
+    service = BaseService(broker_host=LOOPBACK_HOST, broker_port=5314)
+    service.add_api_endpoint(FUNC_NAME, None, update_stats, overload_policy=OverloadPolicy(max_queue_age=0.1, retry_after=0.05))
+    service.start(background=True)
+    # Holds the connection thread, so the next request waits longer than max_queue_age
+    slow_client = RpcClient(queue_name=FUNC_NAME, host=LOOPBACK_HOST, port=5314)
+    slow_call = threading.Thread(target=slow_client.call, args=({"delay": 0.4},), kwargs={"timeout": 5})
+    rpc_client = RpcClient(queue_name=FUNC_NAME, host=LOOPBACK_HOST, port=5314, max_overload_retries=0)
+    try:
+        slow_call.start()
+        tm.sleep(0.05)
+        response = rpc_client.call({}, timeout=5)
+        slow_call.join()
+        stats = service.get_stats()
+    finally:
+        slow_client.close()
+        rpc_client.close()
+        service.stop(drain_timeout=0.1)
+    assert response["status_code"] == OVERLOADED_STATUS_CODE
+    assert response["retry_after"] == 0.05
+    assert executed == [{"delay": 0.4}]
+    assert stats["shed"] == {FUNC_NAME: 1}
+
+class FakeHttpResponse:
+    status_code = OVERLOADED_STATUS_CODE
+    headers = {"Retry-After": "2"}
+
+    def json(self) -> dict:
+        return {"status_code": OVERLOADED_STATUS_CODE, "return": "rpc_exec_client_requesting_task is overloaded"}
+
+def test_client_gateway_passes_on_cloud_503(monkeypatch):
+    pytest.importorskip("requests")
+    from client_gateway import amqp_gateway
+    monkeypatch.setattr(amqp_gateway, "allow_register", False, raising=False)
+    monkeypatch.setattr(amqp_gateway.requests, "post", lambda **kwargs: FakeHttpResponse())
+    gateway = amqp_gateway.ServiceAmqpGateway("client_gateway", LOOPBACK_HOST, 5313)
+    gateway.start(background=True)
+    rpc_client = RpcClient(queue_name="rpc_exec_client_requesting_task", host=LOOPBACK_HOST, port=5313, max_overload_retries=0)
+    try:
+        response = rpc_client.call({"user_id": "xxxx"}, timeout=5)
+    finally:
+        rpc_client.close()
+        gateway.stop(drain_timeout=0.1)
+    assert response["status_code"] == OVERLOADED_STATUS_CODE
+    assert response["retry_after"] == 2
@@ -0,0 +1,56 @@
+import threading
+import time as tm
+
+import pika
+
+from microservice_interconnect.base_service import BaseService
+from microservice_interconnect.loopback import LOOPBACK_HOST
+from microservice_interconnect.rpc_client import RpcClient, rpc_send
+
+def test_waiting_control_request_runs_before_bulk_ones():
+    executed = []
+    def update_stats(received:dict):
+        tm.sleep(received.get("delay", 0))
+        executed.append(f"bulk-{received['n']}")
+
+    service = BaseService(broker_host=LOOPBACK_HOST, broker_port=5401)
+    service.add_api_endpoint("rpc_exec_update_stats", None, update_stats, priority="bulk")
+    service.add_api_endpoint("rpc_exec_stop_task", None, lambda received: executed.append("control"), priority="control")
+    service.start(background=True)
+    bulk_client = RpcClient(queue_name="rpc_exec_update_stats", host=LOOPBACK_HOST, port=5401)
+    try:
+        # Both channels are consuming
+        rpc_send("rpc_exec_update_stats", {"n": "warm-up"}, LOOPBACK_HOST, 5401, timeout=5)
+        executed.clear()
+        # The first bulk request holds the connection thread while the others arrive
+        for n, delay in enumerate([0.3, 0, 0, 0]):
+            bulk_client.publish({"n": n, "delay": delay}, properties=pika.BasicProperties(
+                reply_to=bulk_client.callback_queue_name, type="rpc_exec_update_stats"))
+        assert rpc_send("rpc_exec_stop_task", {}, LOOPBACK_HOST, 5401, timeout=5)["status_code"] == 200
+        deadline = tm.monotonic() + 5
+        while len(executed) < 5 and tm.monotonic() < deadline:
+            tm.sleep(0.01)
+    finally:
+        bulk_client.close()
+        service.stop(drain_timeout=0.1)
+    # The next pick was scheduled when bulk-0 started, before the control request was received, so it gets bulk-1
+    assert executed == ["bulk-0", "bulk-1", "control", "bulk-2", "bulk-3"]
+
+def test_control_endpoint_does_not_wait_for_busy_workers():
+    service = BaseService(broker_host=LOOPBACK_HOST, broker_port=5402, execution_mode="thread", max_workers=1)
+    service.add_api_endpoint("rpc_exec_update_stats", None, lambda received: tm.sleep(1), priority="bulk")
+    service.add_api_endpoint("rpc_exec_stop_task", None, lambda received: "stopped", priority="control")
+    service.start(background=True)
+    bulk_call = threading.Thread(target=rpc_send, args=("rpc_exec_update_stats", {}, LOOPBACK_HOST, 5402), kwargs={"timeout": 5})
+    try:
+        bulk_call.start()
+        tm.sleep(0.1)
+        start = tm.monotonic()
+        response = rpc_send("rpc_exec_stop_task", {}, LOOPBACK_HOST, 5402, timeout=5)
+        elapsed = tm.monotonic() - start
+        bulk_call.join()
+    finally:
+        service.stop(drain_timeout=0.1)
+    assert response == {"status_code": 200, "return": "stopped"}
+    # The only worker of the "default" bulkhead is busy for 1 s
+    assert elapsed < 0.5
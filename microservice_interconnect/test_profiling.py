@@ -0,0 +1,50 @@
+import os
+import pstats
+import time as tm
+
+import pytest
+
+from microservice_interconnect.base_service import BaseService
+from microservice_interconnect.loopback import LOOPBACK_HOST
+from microservice_interconnect.rpc_client import rpc_profile, rpc_send
+
+# Reports kept by the endpoint, so their memory is still allocated when the call ends
+reports = []
+
+def build_report(received:dict) -> int:
+    tm.sleep(received["delay"])
+    reports.append(bytearray(100000))
+    return len(reports)
+
+def test_profiling_is_switched_on_and_off_at_runtime(tmp_path):
+    service = BaseService(broker_host=LOOPBACK_HOST, broker_port=5441, profile_dir=str(tmp_path))
+    service.add_api_endpoint("rpc_exec_build_report", None, build_report)
+    service.start(background=True)
+    try:
+        enabled = rpc_profile("rpc_exec_build_report", "enable", LOOPBACK_HOST, 5441, profile_slowest=2, sample_rate=1, timeout=5)
+        for delay in (0.01, 0.05, 0.02):
+            rpc_send("rpc_exec_build_report", {"delay": delay}, LOOPBACK_HOST, 5441, timeout=5)
+        status = rpc_profile("rpc_exec_build_report", "status", LOOPBACK_HOST, 5441, timeout=5)
+        disabled = rpc_profile("rpc_exec_build_report", "disable", LOOPBACK_HOST, 5441, timeout=5)
+        # Not measured any more
+        rpc_send("rpc_exec_build_report", {"delay": 0}, LOOPBACK_HOST, 5441, timeout=5)
+    finally:
+        service.stop(drain_timeout=0.1)
+
+    assert enabled["return"]["enabled"] is True
+    summary = status["return"]["summary"]
+    assert summary["wall"]["count"] == 3
+    assert summary["profiled_calls"] == 3
+    # Snapshots of the 50 ms and 20 ms calls
+    slowest, second = [snapshot["wall_ms"] for snapshot in summary["slowest"]]
+    assert 50 <= slowest and 20 <= second < 50
+    assert summary["allocated_bytes_max"] >= 100000
+
+    assert disabled["return"]["enabled"] is False
+    assert disabled["return"]["summary"]["wall"]["count"] == 3
+    files = disabled["return"]["files"]
+    assert [os.path.basename(path) for path in files] == ["summary.json", "slowest-1.prof", "slowest-2.prof"]
+    assert "build_report" in str(pstats.Stats(files[1]).stats)
+    assert service.profilers == {}
+    with pytest.raises(ValueError):
+        service.enable_profiling("rpc_exec_unknown")
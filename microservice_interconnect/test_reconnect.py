@@ -0,0 +1,78 @@
+import random
+
+import pika.exceptions
+import pika.frame
+import pika.spec
+import pytest
+
+from microservice_interconnect import rpc_client as rpc_client_module
+from microservice_interconnect.base_service import BaseService
+from microservice_interconnect.confirmed_publisher import ConfirmedPublisher, _PendingBatch
+from microservice_interconnect.loopback import LOOPBACK_HOST
+from microservice_interconnect.rpc_client import RECONNECT_BASE_DELAY, RECONNECT_MAX_DELAY, RpcClient, reconnect_delay
+
+def test_reconnect_delay_grows_up_to_the_maximum():
+    random.seed(0)
+    for attempt in range(1, 12):
+        bound = min(RECONNECT_MAX_DELAY, RECONNECT_BASE_DELAY*2**attempt)
+        delays = [reconnect_delay(attempt) for _ in range(200)]
+        assert all(0 <= delay <= bound for delay in delays)
+        # Full jitter: spread over the whole interval
+        assert max(delays) > 0.8*bound and min(delays) < 0.2*bound
+
+def test_call_is_sent_again_after_the_connection_is_lost(monkeypatch):
+    monkeypatch.setattr(rpc_client_module, "reconnect_delay", lambda attempt: 0)
+    service = BaseService(broker_host=LOOPBACK_HOST, broker_port=5381)
+    service.add_api_endpoint("rpc_exec_test_reconnect", None, lambda received: received)
+    service.start(background=True)
+    rpc_client = RpcClient(queue_name="rpc_exec_test_reconnect", host=LOOPBACK_HOST, port=5381, pooled=False)
+    publish = rpc_client._publish
+    failures = iter([pika.exceptions.StreamLostError("lost"), pika.exceptions.AMQPConnectionError("refused")])
+    def publish_after_failures(*args, **kwargs):
+        error = next(failures, None)
+        if error is not None:
+            raise error
+        publish(*args, **kwargs)
+    monkeypatch.setattr(rpc_client, "_publish", publish_after_failures)
+    lost_reply_queue_name = rpc_client.callback_queue_name
+    try:
+        response = rpc_client.call({"n": 1}, timeout=5)
+        # The response came to the reply queue of the new connection
+        assert rpc_client.callback_queue_name != lost_reply_queue_name
+    finally:
+        rpc_client.close()
+        service.stop(drain_timeout=0.1)
+    assert response == {"status_code": 200, "return": {"n": 1}}
+
+def test_publish_gives_up_after_max_reconnect_attempts(monkeypatch):
+    monkeypatch.setattr(rpc_client_module, "reconnect_delay", lambda attempt: 0)
+    service = BaseService(broker_host=LOOPBACK_HOST, broker_port=5382)
+    service.start(background=True)
+    rpc_client = RpcClient(queue_name="rpc_exec_test_reconnect", host=LOOPBACK_HOST, port=5382, pooled=False, max_reconnect_attempts=2)
+    attempts = []
+    def lose_connection(*args, **kwargs):
+        attempts.append(1)
+        raise pika.exceptions.StreamLostError("lost")
+    monkeypatch.setattr(rpc_client, "_publish", lose_connection)
+    try:
+        with pytest.raises(pika.exceptions.AMQPConnectionError):
+            rpc_client.publish({})
+    finally:
+        rpc_client.close()
+        service.stop(drain_timeout=0.1)
+    assert len(attempts) == 3
+
+def confirm(publisher:ConfirmedPublisher, method:pika.spec.Basic.Ack):
+    publisher._on_delivery_confirmation(pika.frame.Method(1, method))
+
+def test_confirms_resolve_pipelined_batch():
+    publisher = ConfirmedPublisher()
+    batch = _PendingBatch(4)
+    publisher._pending = {tag: batch for tag in range(1, 5)}
+
+    confirm(publisher, pika.spec.Basic.Ack(delivery_tag=2, multiple=True))
+    assert (batch.acked, batch.done.is_set()) == (2, False)
+    confirm(publisher, pika.spec.Basic.Nack(delivery_tag=3))
+    confirm(publisher, pika.spec.Basic.Ack(delivery_tag=4))
+    assert (batch.acked, batch.nacked, batch.done.is_set()) == (3, 1, True)
+    assert publisher._pending == {}
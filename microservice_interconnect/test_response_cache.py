@@ -0,0 +1,44 @@
+from microservice_interconnect.base_service import BaseService
+from microservice_interconnect.loopback import LOOPBACK_HOST
+from microservice_interconnect.response_cache import CachePolicy, ResponseCache
+from microservice_interconnect.rpc_client import RpcClient
+
+def test_response_computed_before_invalidation_is_not_stored():
+    cache = ResponseCache(CachePolicy(ttl=60))
+    found, _, generation = cache.get("task-1")
+    assert not found
+    # A write finishes while the read is still executing
+    cache.invalidate("task-1")
+    cache.put("task-1", {"status_code": 200, "return": "old"}, generation)
+    assert cache.get("task-1")[0] is False
+
+def test_write_endpoint_invalidates_its_key():
+    tasks = {"task-1": "created", "task-2": "created"}
+    def update_task(received:dict) -> None:
+        tasks[received["task_id"]] = received["status"]
+
+    service = BaseService(broker_host=LOOPBACK_HOST, broker_port=5321)
+    service.add_api_endpoint("rpc_exec_get_task_by_id", None, lambda received: tasks[received["task_id"]],
+        cache_policy=CachePolicy(ttl=60, key_func=lambda received: received["task_id"]))
+    service.add_api_endpoint("rpc_exec_update_task", None, update_task,
+        invalidates={"rpc_exec_get_task_by_id": lambda received: received["task_id"]})
+    service.start(background=True)
+    get_client = RpcClient(queue_name="rpc_exec_get_task_by_id", host=LOOPBACK_HOST, port=5321)
+    update_client = RpcClient(queue_name="rpc_exec_update_task", host=LOOPBACK_HOST, port=5321)
+    try:
+        for task_id in tasks:
+            assert get_client.call({"task_id": task_id}, timeout=5)["return"] == "created"
+        update_client.call({"task_id": "task-1", "status": "running"}, timeout=5)
+        # Changed outside the endpoints
+        tasks["task-2"] = "stopped"
+        service.invalidate_cache("rpc_exec_get_task_by_id", "task-2")
+
+        assert get_client.call({"task_id": "task-1"}, timeout=5)["return"] == "running"
+        assert get_client.call({"task_id": "task-2"}, timeout=5)["return"] == "stopped"
+        assert get_client.call({"task_id": "task-2"}, timeout=5)["return"] == "stopped"
+        stats = service.cache_stats()["rpc_exec_get_task_by_id"]
+        assert (stats["hits"], stats["misses"], stats["invalidations"]) == (1, 4, 2)
+    finally:
+        get_client.close()
+        update_client.close()
+        service.stop(drain_timeout=0.1)
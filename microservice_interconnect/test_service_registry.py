@@ -0,0 +1,40 @@
+import multiprocessing
+
+from microservice_interconnect.service_registry import ServiceRegistry
+
+FUNC_NAME = "rpc_exec_test_registry"
+ADDRESS = "tcp:127.0.0.1:9199"
+
+def run_replica(path:str, registered, stop):
+    registry = ServiceRegistry(path)
+    registry.register([FUNC_NAME], ADDRESS)
+    registered.set()
+    stop.wait(10)
+    registry.unregister([FUNC_NAME], ADDRESS)
+
+def test_replica_unregistering_keeps_the_others(tmp_path):
+    path = str(tmp_path)
+    registry = ServiceRegistry(path, refresh_interval=0)
+    registered, stop = multiprocessing.Event(), multiprocessing.Event()
+    replica = multiprocessing.Process(target=run_replica, args=(path, registered, stop))
+    replica.start()
+    try:
+        assert registered.wait(10)
+        registry.register([FUNC_NAME], ADDRESS)
+        registry.unregister([FUNC_NAME], ADDRESS)
+        # The other replica shares the address and is still running
+        assert registry.lookup(FUNC_NAME) == ADDRESS
+    finally:
+        stop.set()
+        replica.join(10)
+    assert registry.lookup(FUNC_NAME) is None
+
+def test_entries_of_dead_processes_are_ignored(tmp_path):
+    path = str(tmp_path)
+    registry = ServiceRegistry(path, refresh_interval=0)
+    replica = multiprocessing.Process(target=ServiceRegistry(path).register, args=([FUNC_NAME], ADDRESS))
+    replica.start()
+    replica.join(10)
+    # Exited without unregistering
+    assert (tmp_path / FUNC_NAME / str(replica.pid)).exists()
+    assert registry.lookup(FUNC_NAME) is None
@@ -0,0 +1,48 @@
+import threading
+
+import pytest
+
+from microservice_interconnect.base_service import BaseService
+from microservice_interconnect.loopback import LOOPBACK_HOST
+from microservice_interconnect.rpc_client import RpcStreamError, rpc_send, rpc_stream
+
+def test_items_arrive_before_the_endpoint_finishes():
+    first_chunk_received = threading.Event()
+    def list_tasks(received:dict):
+        yield from range(3)
+        # The rest is produced only after the client got the first chunk
+        assert first_chunk_received.wait(5)
+        yield from range(3, received["n"])
+
+    service = BaseService(broker_host=LOOPBACK_HOST, broker_port=5411, execution_mode="thread")
+    service.add_api_endpoint("rpc_exec_list_tasks", None, list_tasks, stream_chunk_size=3)
+    service.start(background=True)
+    items = []
+    try:
+        for item in rpc_stream("rpc_exec_list_tasks", {"n": 10}, LOOPBACK_HOST, 5411, timeout=5):
+            items.append(item)
+            first_chunk_received.set()
+        # Callers that do not stream get the whole list
+        response = rpc_send("rpc_exec_list_tasks", {"n": 10}, LOOPBACK_HOST, 5411, timeout=5)
+    finally:
+        service.stop(drain_timeout=0.1)
+    assert items == list(range(10))
+    assert response == {"status_code": 200, "return": list(range(10))}
+
+def test_exception_in_the_middle_ends_the_stream():
+    def list_tasks(received:dict):
+        yield from range(4)
+        raise RuntimeError("database closed")
+
+    service = BaseService(broker_host=LOOPBACK_HOST, broker_port=5412, execution_mode="thread")
+    service.add_api_endpoint("rpc_exec_list_tasks", None, list_tasks, stream_chunk_size=2)
+    service.start(background=True)
+    items = []
+    try:
+        with pytest.raises(RpcStreamError) as error:
+            for item in rpc_stream("rpc_exec_list_tasks", {}, LOOPBACK_HOST, 5412, timeout=5):
+                items.append(item)
+    finally:
+        service.stop(drain_timeout=0.1)
+    assert items == [0, 1, 2, 3]
+    assert error.value.response["status_code"] == 500
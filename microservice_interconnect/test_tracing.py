@@ -0,0 +1,51 @@
+from microservice_interconnect.base_service import BaseService
+from microservice_interconnect.loopback import LOOPBACK_HOST
+from microservice_interconnect.rpc_client import rpc_send
+from microservice_interconnect.tracing import SpanContext, SpanExporter, build_trees, flush_spans, get_span_exporter, read_spans, set_span_exporter, start_span
+
+def test_traceparent_header_round_trip():
+    span_context = SpanContext("4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7")
+    header = span_context.to_header()
+    assert header == "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+    received = SpanContext.from_header(header.encode())
+    assert (received.trace_id, received.span_id) == (span_context.trace_id, span_context.span_id)
+    assert SpanContext.from_header("00-4bf92f35-00f067aa0ba902b7-01") is None
+    assert SpanContext.from_header(None) is None
+
+def test_nested_calls_share_the_trace(tmp_path):
+    previous_exporter = get_span_exporter()
+    outer = BaseService(broker_host=LOOPBACK_HOST, broker_port=5431)
+    outer.add_api_endpoint("rpc_exec_outer", None, lambda received: rpc_send("rpc_exec_inner", received, LOOPBACK_HOST, 5431, timeout=5))
+    inner = BaseService(broker_host=LOOPBACK_HOST, broker_port=5431)
+    inner.add_api_endpoint("rpc_exec_inner", None, lambda received: received)
+    outer.start(background=True)
+    inner.start(background=True)
+    set_span_exporter(SpanExporter(str(tmp_path), "test"))
+    try:
+        with start_span("client_procedure"):
+            return_value = rpc_send("rpc_exec_outer", {"task_id": "4fe5"}, LOOPBACK_HOST, 5431, timeout=5)["return"]
+        flush_spans()
+        spans = read_spans(str(tmp_path))
+    finally:
+        set_span_exporter(previous_exporter)
+        outer.stop(drain_timeout=0.1)
+        inner.stop(drain_timeout=0.1)
+
+    assert return_value == {"status_code": 200, "return": {"task_id": "4fe5"}}
+    assert len({span["trace_id"] for span in spans}) == 1
+    roots = build_trees(spans)
+    assert len(roots) == 1
+    path, span = [], roots[0]
+    while True:
+        path.append((span["name"], span["kind"]))
+        if not span["children"]:
+            break
+        assert len(span["children"]) == 1
+        span = span["children"][0]
+    assert path == [
+        ("client_procedure", "internal"),
+        ("rpc_exec_outer", "client"),
+        ("rpc_exec_outer", "server"),
+        ("rpc_exec_inner", "client"),
+        ("rpc_exec_inner", "server"),
+    ]
@@ -0,0 +1,404 @@
+import argparse
+import atexit
+import contextvars
+import json
+import os
+import threading
+import time as tm
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from microservice_interconnect.protocol import TRACE_PARENT_HEADER
+
+# Finished spans kept in memory before being written, and maximum time, in seconds, that they wait
+SPAN_BUFFER_SIZE = 200
+SPAN_FLUSH_INTERVAL = 1.0
+
+SPAN_FILE_PREFIX = "spans-"
+SPAN_FILE_SUFFIX = ".jsonl"
+
+class SpanContext:
+    """
+    Identifies a span and its trace, as propagated to other services in the "traceparent" header
+    (W3C Trace Context format: "00-<trace id>-<span id>-01")
+
+    :param trace_id: 32 hexadecimal digits, shared by every span of a request
+    :type trace_id: str
+
+    :param span_id: 16 hexadecimal digits
+    :type span_id: str
+    """
+    def __init__(self, trace_id:str, span_id:str) -> None:
+        self.trace_id = trace_id
+        self.span_id = span_id
+
+    def to_header(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    @classmethod
+    def from_header(cls, header:Any) -> Optional["SpanContext"]:
+        """
+        :param header: "traceparent" header value
+        :type header: Any
+
+        :return: context of the remote parent span, or None if the header is missing or malformed
+        :rtype: SpanContext
+        """
+        if isinstance(header, bytes):
+            header = header.decode(errors="replace")
+        if not isinstance(header, str):
+            return None
+        parts = header.strip().split("-")
+        if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+            return None
+        return cls(parts[1], parts[2])
+
+class Span(SpanContext):
+    """
+    Timed operation of a request: the handling of a message by a service ("server"), a call to other
+    service ("client") or any step inside them ("internal"). Spans are created by :func:`start_span`
+
+    :param name: operation name, e.g. the RPC function name
+    :type name: str
+
+    :param kind: "server", "client" or "internal"
+    :type kind: str
+
+    :param parent: parent span, local or received from other service. If None, the span starts a new trace
+    :type parent: SpanContext
+
+    :param attributes: details of the operation, e.g. the status code of the response
+    :type attributes: dict
+    """
+    def __init__(self, name:str, kind:str="internal", parent:SpanContext=None, attributes:dict=None) -> None:
+        super().__init__(parent.trace_id if parent is not None else os.urandom(16).hex(), os.urandom(8).hex())
+        self.name = name
+        self.kind = kind
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes = attributes or {}
+        self.error = None
+        # Wall clock, comparable between processes, and monotonic clock for the duration
+        self.start_time = tm.time()
+        self._start = tm.perf_counter()
+        self.duration = None
+
+    def set_attribute(self, key:str, value:Any):
+        self.attributes[key] = value
+
+    def end(self, error:BaseException=None):
+        """
+        Finishes the span and hands it to the process exporter. Spans are ended only once
+
+        :param error: exception that interrupted the operation, if any
+        :type error: BaseException
+        """
+        if self.duration is not None:
+            return
+        self.duration = tm.perf_counter() - self._start
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        exporter = _exporter
+        if exporter is not None:
+            exporter.export(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start": self.start_time,
+            "duration": self.duration,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+class SpanExporter:
+    """
+    Writes finished spans as JSON Lines, in a file per process of the directory, so services and replicas
+    in the same host share the directory without locks. Spans are buffered and written in batches of up to
+    SPAN_BUFFER_SIZE spans or every SPAN_FLUSH_INTERVAL seconds, and at exit
+
+    Span trees of the traces in the directory are printed by running this module (see :func:`build_trees`)
+
+    :param directory: directory of the span files
+    :type directory: str
+
+    :param service_name: identifies the process in the spans it writes
+    :type service_name: str
+    """
+    def __init__(self, directory:str, service_name:str) -> None:
+        self.directory = directory
+        self.service_name = service_name
+        self._buffer: List[dict] = []
+        self._last_flush = tm.monotonic()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        os.makedirs(directory, exist_ok=True)
+
+    def export(self, span:Span):
+        """
+        :param span: finished span
+        :type span: Span
+        """
+        record = span.to_dict()
+        record["service"] = self.service_name
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked replica: spans of the parent are written by the parent
+                self._buffer = []
+                self._pid = os.getpid()
+            self._buffer.append(record)
+            if len(self._buffer) < SPAN_BUFFER_SIZE and tm.monotonic() - self._last_flush < SPAN_FLUSH_INTERVAL:
+                return
+            self._write()
+
+    def flush(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                self._write()
+
+    def _write(self):
+        # Called with the lock held
+        self._last_flush = tm.monotonic()
+        if not self._buffer:
+            return
+        path = os.path.join(self.directory, f"{SPAN_FILE_PREFIX}{self.service_name}-{os.getpid()}{SPAN_FILE_SUFFIX}")
+        with open(path, "a") as span_file:
+            span_file.write("".join(json.dumps(record) + "\n" for record in self._buffer))
+        self._buffer = []
+
+
+_exporter: Optional[SpanExporter] = None
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+def set_span_exporter(exporter:Optional[SpanExporter]):
+    """
+    :param exporter: exporter of the spans of this process. If None, spans are not recorded, but received trace contexts are still propagated
+    :type exporter: SpanExporter
+    """
+    global _exporter
+    _exporter = exporter
+
+def get_span_exporter() -> Optional[SpanExporter]:
+    """
+    :return: exporter of this process, or None if tracing is disabled
+    :rtype: SpanExporter
+    """
+    return _exporter
+
+def flush_spans():
+    """
+    Writes the buffered spans of the process. Called at exit
+    """
+    if _exporter is not None:
+        _exporter.flush()
+
+atexit.register(flush_spans)
+
+def current_span_context() -> Optional[SpanContext]:
+    """
+    :return: context of the span in execution in this thread (a :class:`Span`, if recorded), or None if there is none
+    :rtype: SpanContext
+    """
+    return _current_span.get()
+
+def set_span_attribute(key:str, value:Any):
+    """
+    Adds a detail to the span in execution in this thread, if it is recorded
+
+    :param key: attribute name
+    :type key: str
+
+    :param value: JSON-serializable value
+    :type value: Any
+    """
+    span = _current_span.get()
+    if isinstance(span, Span):
+        span.attributes[key] = value
+
+def create_span(name:str, kind:str="internal", parent:SpanContext=None, attributes:dict=None) -> Optional[Span]:
+    """
+    Starts a span without making it the span in execution, for operations that do not run in a single block,
+    e.g. iterated streams. It must be ended with :meth:`Span.end`
+
+    :param name: operation name
+    :type name: str
+
+    :param kind: "server", "client" or "internal"
+    :type kind: str
+
+    :param parent: parent context. If None, the span in execution in this thread
+    :type parent: SpanContext
+
+    :param attributes: details of the operation
+    :type attributes: dict
+
+    :return: the span, or None without exporter
+    :rtype: Span
+    """
+    if _exporter is None:
+        return None
+    return Span(name, kind, parent if parent is not None else _current_span.get(), attributes)
+
+@contextmanager
+def start_span(name:str, kind:str="internal", parent:SpanContext=None, attributes:dict=None) -> Iterator[Optional[Span]]:
+    """
+    Measures the enclosed block as a span, child of parent or, if None, of the span in execution in this thread.
+    Calls and registered events inside the block belong to the span
+
+    Without exporter (see :func:`set_span_exporter`), nothing is measured, but the parent context is still
+    propagated to the calls inside the block, so traces are not broken by services without tracing
+
+    :param name: operation name
+    :type name: str
+
+    :param kind: "server", "client" or "internal"
+    :type kind: str
+
+    :param parent: remote parent context, e.g. extracted from the headers of a request (see :func:`extract`)
+    :type parent: SpanContext
+
+    :param attributes: details of the operation
+    :type attributes: dict
+
+    :return: the span, or None without exporter
+    :rtype: Iterator[Span]
+    """
+    if parent is None:
+        parent = _current_span.get()
+    if _exporter is None:
+        if parent is None:
+            yield None
+            return
+        token = _current_span.set(parent)
+        try:
+            yield None
+        finally:
+            _current_span.reset(token)
+        return
+
+    span = Span(name, kind, parent, attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.end(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+
+def inject(headers:dict, span_context:SpanContext=None):
+    """
+    Adds the "traceparent" header of the span, so the receiver continues the trace
+
+    :param headers: AMQP or HTTP headers of the outgoing request
+    :type headers: dict
+
+    :param span_context: span that makes the request. If None, the span in execution in this thread
+    :type span_context: SpanContext
+    """
+    if span_context is None:
+        span_context = _current_span.get()
+    if span_context is not None:
+        headers[TRACE_PARENT_HEADER] = span_context.to_header()
+
+def extract(headers:Any) -> Optional[SpanContext]:
+    """
+    :param headers: AMQP or HTTP headers of a received request (any mapping with get)
+    :type headers: Any
+
+    :return: context of the caller span, or None if the caller is not traced
+    :rtype: SpanContext
+    """
+    if not headers:
+        return None
+    return SpanContext.from_header(headers.get(TRACE_PARENT_HEADER))
+
+
+def read_spans(directory:str) -> List[dict]:
+    """
+    :param directory: directory of a :class:`SpanExporter`
+    :type directory: str
+
+    :return: spans written by every process, in no particular order. Truncated lines are skipped
+    :rtype: List[dict]
+    """
+    spans = []
+    for name in sorted(os.listdir(directory)):
+        if not (name.startswith(SPAN_FILE_PREFIX) and name.endswith(SPAN_FILE_SUFFIX)):
+            continue
+        with open(os.path.join(directory, name)) as span_file:
+            for line in span_file:
+                try:
+                    spans.append(json.loads(line))
+                except ValueError:
+                    print(f"Skipped malformed span in {name}")
+    return spans
+
+def build_trees(spans:List[dict]) -> List[dict]:
+    """
+    Links each span to its parent, by span ID, across processes
+
+    :param spans: spans, as read by :func:`read_spans`
+    :type spans: List[dict]
+
+    :return: root spans (without parent, or whose parent was not exported), sorted by start time, each with its "children", also sorted
+    :rtype: List[dict]
+    """
+    by_id: Dict[str, dict] = {}
+    for span in spans:
+        span["children"] = []
+        by_id[span["span_id"]] = span
+    roots = []
+    for span in spans:
+        parent = by_id.get(span.get("parent_id"))
+        if parent is not None:
+            parent["children"].append(span)
+        else:
+            roots.append(span)
+    for span in spans:
+        span["children"].sort(key=lambda child: child["start"])
+    roots.sort(key=lambda root: root["start"])
+    return roots
+
+def format_tree(root:dict) -> str:
+    """
+    :param root: span with its "children" (see :func:`build_trees`)
+    :type root: dict
+
+    :return: one line per span, indented by depth, with its start relative to the root and its duration, in ms
+    :rtype: str
+    """
+    lines = []
+    def add(span:dict, depth:int):
+        offset = 1000*(span["start"] - root["start"])
+        details = "".join(f" {key}={value}" for key, value in span.get("attributes", {}).items())
+        error = f" ERROR {span['error']}" if span.get("error") else ""
+        lines.append(
+            f"{'  '*depth}{span['service']} {span['kind']} {span['name']}"
+            f" +{offset:.1f} ms {1000*span['duration']:.1f} ms{details}{error}")
+        for child in span["children"]:
+            add(child, depth + 1)
+    add(root, 0)
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prints the span trees written by the services")
+    parser.add_argument("directory", help="directory of the span files")
+    parser.add_argument("--trace", help="only the trace with this ID")
+    parser.add_argument("--slowest", type=int, help="only the N traces with the longest root spans")
+    args = parser.parse_args()
+
+    roots = build_trees(read_spans(args.directory))
+    if args.trace is not None:
+        roots = [root for root in roots if root["trace_id"] == args.trace]
+    if args.slowest is not None:
+        roots = sorted(roots, key=lambda root: root["duration"], reverse=True)[:args.slowest]
+    for root in roots:
+        print(f"trace {root['trace_id']}")
+        print(format_tree(root))
+        print()
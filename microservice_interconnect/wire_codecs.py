@@ -0,0 +1,103 @@
+import json
+from typing import Any, Callable, Dict, List
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_CONTENT_TYPE = "application/json"
+MSGPACK_CONTENT_TYPE = "application/msgpack"
+
+# Messages from older clients are JSON, labeled "text/plain" or without content type
+_LEGACY_JSON_CONTENT_TYPES = ("text/plain", None, "")
+
+class UnknownContentType(Exception):
+    def __init__(self, content_type:str):
+        super().__init__(f"No codec registered for content type {content_type}")
+
+class Codec:
+    """
+    Encodes and decodes RPC payloads for one AMQP content type
+
+    :param content_type: AMQP content_type property that identifies the codec
+    :type content_type: str
+
+    :param encode: converts a JSON-like object to bytes
+    :type encode: Callable[[Any], bytes]
+
+    :param decode: converts bytes back to a JSON-like object
+    :type decode: Callable[[bytes], Any]
+    """
+    def __init__(self, content_type:str, encode:Callable[[Any], bytes], decode:Callable[[bytes], Any]) -> None:
+        self.content_type = content_type
+        self.encode = encode
+        self.decode = decode
+
+
+_codecs: Dict[str, Codec] = {}
+
+def register_codec(codec:Codec):
+    """
+    Makes a codec available for requests and responses of every client and service in the process
+
+    :param codec: codec to register. Replaces any codec with the same content type
+    :type codec: Codec
+    """
+    _codecs[codec.content_type] = codec
+
+def available_content_types() -> List[str]:
+    """
+    :return: content types of the registered codecs
+    :rtype: list
+    """
+    return list(_codecs.keys())
+
+def get_codec(content_type:str) -> Codec:
+    """
+    :param content_type: AMQP content_type property of a message
+    :type content_type: str
+
+    :raises UnknownContentType: no codec registered for the content type
+
+    :return: codec for the content type (JSON for legacy messages)
+    :rtype: Codec
+    """
+    if content_type in _LEGACY_JSON_CONTENT_TYPES:
+        content_type = JSON_CONTENT_TYPE
+    codec = _codecs.get(content_type)
+    if codec is None:
+        raise UnknownContentType(content_type)
+    return codec
+
+def negotiate_codec(accept:str) -> Codec:
+    """
+    Selects the response codec from the "accept" header sent by the client,
+    a comma-separated list of content types in order of preference
+
+    :param accept: "accept" header. Older clients do not send it and receive JSON
+    :type accept: str
+
+    :return: first codec in the list that is registered, or JSON
+    :rtype: Codec
+    """
+    if accept:
+        for content_type in accept.split(","):
+            codec = _codecs.get(content_type.strip())
+            if codec is not None:
+                return codec
+    return _codecs[JSON_CONTENT_TYPE]
+
+
+register_codec(Codec(
+    JSON_CONTENT_TYPE,
+    encode=lambda data: json.dumps(data).encode("utf-8"),
+    decode=lambda body: json.loads(body),
+))
+
+if msgpack is not None:
+    register_codec(Codec(
+        MSGPACK_CONTENT_TYPE,
+        encode=lambda data: msgpack.packb(data, use_bin_type=True),
+        decode=lambda body: msgpack.unpackb(body, raw=False),
+    ))
@@ -1,11 +1,19 @@
 from user_manager.user_db_interface import UserDbInterface, UserNotRegistered
 from microservice_interconnect.base_service import BaseService
+from microservice_interconnect.replicas import run_replicas
+from microservice_interconnect.response_cache import CachePolicy
 from microservice_interconnect.rpc_client import register_event
+from microservice_interconnect.service_registry import ServiceRegistry, set_service_registry
+from microservice_interconnect.tracing import SpanExporter, set_span_exporter
 from pathlib import Path
 import os
 import json
+import functools
 import configparser
 
+# Seconds that responses of rpc_exec_get_user_info are cached
+USER_CACHE_TTL = 60
+
 class ServiceUserManager(BaseService):
     """
     Main class for User Manager microservice that executes the methods for CRUD operations on users DB
@@ -18,13 +26,25 @@ class ServiceUserManager(BaseService):
 
     :param server_broker_port: broker port
     :type server_broker_port: int
+
+    :param direct_address: Unix socket or TCP address where co-located services call it without the broker. If None, only the broker is used
+    :type direct_address: str
+
+    :param cache_user_info: if True, responses of rpc_exec_get_user_info are cached for USER_CACHE_TTL seconds. Must be False with replicas, since updates only invalidate the cache of the replica that executes them
+    :type cache_user_info: bool
     """
     def __init__(
             self, 
             workpath:str, 
             server_broker_host:str="localhost",
-            server_broker_port:int=5672) -> None:
-        super().__init__(broker_host=server_broker_host, broker_port=server_broker_port)
+            server_broker_port:int=5672,
+            direct_address:str=None,
+            cache_user_info:bool=True) -> None:
+        super().__init__(
+            broker_host=server_broker_host,
+            broker_port=server_broker_port,
+            fast_schema_validation=True,
+            direct_address=direct_address)
         self.workpath = workpath
         self.db_handler = UserDbInterface(workpath)
 
@@ -34,13 +54,17 @@ class ServiceUserManager(BaseService):
         self.add_api_endpoint(
             func=self.rpc_exec_update_user_info,
             func_name="rpc_exec_update_user_info",
-            schema=self._get_schema("rpc_exec_update_user_info")
+            schema=self._get_schema("rpc_exec_update_user_info"),
+            invalidates={"rpc_exec_get_user_info": lambda received: received["user_id"]},
+            # Sent periodically by every client: must not delay the queries
+            priority="bulk"
         )
 
         self.add_api_endpoint(
             func=self.rpc_exec_get_user_info,
             func_name="rpc_exec_get_user_info",
-            schema=self._get_schema("rpc_exec_get_user_info")
+            schema=self._get_schema("rpc_exec_get_user_info"),
+            cache_policy=CachePolicy(ttl=USER_CACHE_TTL, key_func=lambda received: received["user_id"]) if cache_user_info else None
         )
 
         register_event("service_user_manager","main","Started",allow_registering=allow_register,host=self.broker_host,port=self.broker_port)
@@ -111,12 +135,26 @@ if __name__ == "__main__":
     configs.read("config.ini")
     allow_register = configs.getboolean("events","register_events")
 
-    service = ServiceUserManager(
-        os.path.join(Path().resolve(),"user_manager"),
-        server_broker_host=configs["server.broker"]["host"],
-        server_broker_port=configs["server.broker"]["port"],
-    )
-    try:
-        service.start()
-    except KeyboardInterrupt as e:
-        service.stop()
\ No newline at end of file
+    direct_address = None
+    if configs.getboolean("direct","enabled",fallback=False):
+        set_service_registry(ServiceRegistry(configs["direct"]["registry"]))
+        # A TCP address is shared by the replicas (SO_REUSEPORT)
+        direct_address = configs["direct"]["user_manager"]
+    if configs.getboolean("tracing","enabled",fallback=False):
+        # Each replica writes its own span file
+        set_span_exporter(SpanExporter(configs["tracing"]["directory"], "service_user_manager"))
+
+    # Each replica is a process consuming the same queues
+    replicas = configs.getint("server.user_manager","replicas",fallback=1)
+    run_replicas(
+        functools.partial(
+            ServiceUserManager,
+            os.path.join(Path().resolve(),"user_manager"),
+            server_broker_host=configs["server.broker"]["host"],
+            server_broker_port=configs["server.broker"]["port"],
+            direct_address=direct_address,
+            # Updates received by one replica would not invalidate the caches of the others
+            cache_user_info=replicas == 1,
+        ),
+        replicas=replicas,
+    )
\ No newline at end of file